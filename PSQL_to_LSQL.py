@@ -1,37 +1,372 @@
-import psycopg2
+import hashlib
+import multiprocessing
+import os
 import sqlite3
+import time
+from decimal import Decimal
 
-def fetch_data_from_postgres(postgres_conn_params):
-    conn = psycopg2.connect(**postgres_conn_params)
-    cursor = conn.cursor()
-    cursor.execute("SELECT * FROM customers")
-    data = cursor.fetchall()
-    column_names = [desc[0] for desc in cursor.description]
-    conn.close()
-    return data, column_names
+from psycopg2 import sql
 
-def create_sqlite_db(sqlite_db_path, data, column_names):
-    conn = sqlite3.connect(sqlite_db_path)
-    cursor = conn.cursor()
-    columns_str = ", ".join(f"{col} TEXT" for col in column_names)
-    cursor.execute(f"CREATE TABLE IF NOT EXISTS customers ({columns_str})")
-
-    placeholders = ", ".join("?" for _ in column_names)
-    cursor.executemany(f"INSERT INTO customers VALUES ({placeholders})", data)
-    conn.commit()
-    conn.close()
-
-postgres_conn_params = {
-    'dbname': 'zypl_project', 
-    'user': 'postgres', 
-    'password': 'yourpassword', 
-    'host': '127.0.0.1', 
-    'port': '5432'
-}
+import db
+from db import ID_ORDER_SQL
+from ddl import sqlite_column_types, build_sqlite_index_script, build_sqlite_index_statements
 
 sqlite_db_path = 'my.db'
 
-data, column_names = fetch_data_from_postgres(postgres_conn_params)
-create_sqlite_db(sqlite_db_path, data, column_names)
+# Таблица PostgreSQL, которая переносится в SQLite (в файле она называется так же)
+SOURCE_TABLE = 'customers'
+
+# Количество строк, которые одновременно держатся в памяти; каждая порция — отдельная транзакция SQLite
+BATCH_SIZE = 50_000
+
+# Режим переноса: 'stream' — одним потоком с продолжением после сбоя, 'parallel' — по частям в нескольких процессах
+MIGRATION_MODE = 'stream'
+
+# Число частей (и процессов) в параллельном режиме. Все промежуточные файлы присоединяются к my.db
+# одновременно, а SQLite по умолчанию допускает не больше 10 присоединённых баз.
+PARALLEL_PARTITIONS = min(8, os.cpu_count() or 1)
+
+# Типы PostgreSQL (information_schema.columns.data_type) и соответствующие типы SQLite для столбцов,
+# которых нет в ddl.py; остальные типы переносятся как TEXT
+SQLITE_TYPES = {
+    'smallint': 'INTEGER',
+    'integer': 'INTEGER',
+    'bigint': 'INTEGER',
+    'boolean': 'INTEGER',
+    'real': 'REAL',
+    'double precision': 'REAL',
+    'numeric': 'REAL',
+}
+
+# Таблица с позицией переноса: ID последней записанной строки обновляется в той же транзакции, что и порция.
+# Строки с пустым ID переносятся после остальных (null_phase = 1): упорядочить их нельзя, поэтому при продолжении
+# такие строки удаляются из SQLite и переносятся заново.
+STATE_TABLE = 'migration_state'
+
+# NUMERIC приходит из psycopg2 как Decimal, который sqlite3 не умеет сохранять
+sqlite3.register_adapter(Decimal, float)
+
+# Столбцы таблицы и их типы в SQLite: по описанию из ddl.py, а для прочих столбцов — по типу в PostgreSQL
+def fetch_column_types(conn, table=SOURCE_TABLE):
+    ddl_types = dict(sqlite_column_types())
+    with conn.cursor() as cur:
+        cur.execute(
+            "SELECT column_name, data_type FROM information_schema.columns "
+            "WHERE table_schema = current_schema() AND table_name = %s ORDER BY ordinal_position",
+            [table]
+        )
+        return [
+            (name, ddl_types.get(name) or SQLITE_TYPES.get(data_type, 'TEXT'))
+            for name, data_type in cur.fetchall()
+        ]
+
+def quote(name):
+    return '"' + name.replace('"', '""') + '"'
+
+def open_sqlite(sqlite_db_path):
+    conn = sqlite3.connect(sqlite_db_path)
+    # WAL: запись порций не блокирует читателей файла, а fsync выполняется только при контрольных точках
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    return conn
+
+# Позиция прерванного переноса: ID последней записанной строки, число строк и признак этапа строк
+# с пустым ID, либо None
+def read_state(sqlite_conn, table=SOURCE_TABLE):
+    with sqlite_conn:
+        sqlite_conn.execute(
+            f"CREATE TABLE IF NOT EXISTS {STATE_TABLE} "
+            f"(table_name TEXT PRIMARY KEY, last_id TEXT, rows INTEGER, done INTEGER, null_phase INTEGER DEFAULT 0)"
+        )
+        columns = [row[1] for row in sqlite_conn.execute(f"PRAGMA table_info({STATE_TABLE})")]
+        if 'null_phase' not in columns:
+            # Позиция, сохранённая до появления этапа: пустой last_id после записанных строк означает,
+            # что перенос уже дошёл до строк с пустым ID (в порядке ID они идут последними)
+            sqlite_conn.execute(f"ALTER TABLE {STATE_TABLE} ADD COLUMN null_phase INTEGER DEFAULT 0")
+            sqlite_conn.execute(f"UPDATE {STATE_TABLE} SET null_phase = 1 WHERE last_id IS NULL AND rows > 0")
+    row = sqlite_conn.execute(
+        f"SELECT last_id, rows, done, null_phase FROM {STATE_TABLE} WHERE table_name = ?", [table]
+    ).fetchone()
+    if row is None or row[2]:
+        return None
+    return row[0], row[1], bool(row[3])
+
+# Пустая таблица вместо прежней и сброс позиции переноса. Транзакцией управляет вызывающий код:
+# в SQLite DROP и CREATE транзакционные, поэтому при сбое до COMMIT остаётся прежняя таблица.
+def replace_sqlite_table(sqlite_conn, column_types, table=SOURCE_TABLE):
+    columns_str = ", ".join(f"{quote(name)} {sqlite_type}" for name, sqlite_type in column_types)
+    # Имя с main.: без него DROP удалил бы одноимённую таблицу присоединённой базы, если в main её нет
+    sqlite_conn.execute(f"DROP TABLE IF EXISTS main.{quote(table)}")
+    sqlite_conn.execute(f"CREATE TABLE main.{quote(table)} ({columns_str})")
+    sqlite_conn.execute(
+        f"INSERT OR REPLACE INTO {STATE_TABLE} (table_name, last_id, rows, done, null_phase) VALUES (?, NULL, 0, 0, 0)",
+        [table]
+    )
+
+def create_sqlite_table(sqlite_conn, column_types, table=SOURCE_TABLE):
+    with sqlite_conn:
+        sqlite_conn.execute("BEGIN")
+        replace_sqlite_table(sqlite_conn, column_types, table)
+
+def create_sqlite_indexes(sqlite_conn, column_names, table=SOURCE_TABLE):
+    start = time.perf_counter()
+    sqlite_conn.executescript(build_sqlite_index_script(table, column_names))
+    print(f"Indexes created in {time.perf_counter() - start:.1f} s")
+
+# Запрос строк после ID last_id в порядке (длина ID, ID) — том же, что у водяного знака в etl (db.ID_ORDER_SQL).
+# null_ids=True — строки с пустым ID, которые в этот порядок не входят.
+def build_select(column_names, table=SOURCE_TABLE, last_id=None, null_ids=False):
+    query = sql.SQL("SELECT {} FROM {}").format(
+        sql.SQL(", ").join(sql.Identifier(name) for name in column_names), sql.Identifier(table)
+    )
+    if null_ids:
+        return query + sql.SQL(" WHERE {} IS NULL").format(sql.Identifier('ID')), []
+    query += sql.SQL(" WHERE {} IS NOT NULL").format(sql.Identifier('ID'))
+    params = []
+    if last_id is not None:
+        query += sql.SQL(" AND {} > (length(%s), %s)").format(ID_ORDER_SQL)
+        params = [last_id, last_id]
+    query += sql.SQL(" ORDER BY {}").format(ID_ORDER_SQL)
+    return query, params
+
+# Копирование результата запроса порциями; каждая порция фиксируется вместе с числом строк
+# и (если задан id_pos) ID её последней строки
+def copy_rows(pg_conn, sqlite_conn, query, params, insert, table, total_rows, batch_size, id_pos=None):
+    with pg_conn.cursor(name='psql_to_lsql') as cur:
+        cur.itersize = batch_size
+        cur.execute(query, params)
+        while True:
+            rows = cur.fetchmany(batch_size)
+            if not rows:
+                break
+            total_rows += len(rows)
+            with sqlite_conn:
+                sqlite_conn.executemany(insert, rows)
+                if id_pos is None:
+                    sqlite_conn.execute(
+                        f"UPDATE {STATE_TABLE} SET rows = ? WHERE table_name = ?", [total_rows, table]
+                    )
+                else:
+                    sqlite_conn.execute(
+                        f"UPDATE {STATE_TABLE} SET last_id = ?, rows = ? WHERE table_name = ?",
+                        [rows[-1][id_pos], total_rows, table]
+                    )
+            print(f"Copied {total_rows} rows")
+    return total_rows
+
+# Потоковый перенос таблицы из PostgreSQL в SQLite. Строки читаются именованным (серверным) курсором
+# порциями по batch_size, поэтому память не зависит от размера таблицы. После каждой порции
+# транзакция SQLite фиксируется вместе с позицией, и прерванный перенос продолжается с неё.
+def migrate(sqlite_db_path=sqlite_db_path, table=SOURCE_TABLE, batch_size=BATCH_SIZE, resume=True):
+    start = time.perf_counter()
+
+    # Отдельное соединение вне пула: серверный курсор живёт внутри одной долгой транзакции
+    pg_conn = db.connect()
+    sqlite_conn = open_sqlite(sqlite_db_path)
+    try:
+        column_types = fetch_column_types(pg_conn, table)
+        if not column_types:
+            raise ValueError(f"Table {table} not found in PostgreSQL")
+        column_names = [name for name, _ in column_types]
+        id_pos = column_names.index('ID')
+
+        state = read_state(sqlite_conn, table) if resume else None
+        if state is None:
+            create_sqlite_table(sqlite_conn, column_types, table)
+            last_id, total_rows, null_phase = None, 0, False
+        else:
+            last_id, total_rows, null_phase = state
+            if null_phase:
+                print(f"Resuming rows with empty ID ({total_rows} rows already copied)")
+            else:
+                print(f"Resuming after ID {last_id} ({total_rows} rows already copied)")
+        start_rows = total_rows
+
+        placeholders = ", ".join("?" for _ in column_names)
+        insert = f"INSERT INTO {quote(table)} VALUES ({placeholders})"
+
+        if not null_phase:
+            query, params = build_select(column_names, table, last_id)
+            total_rows = copy_rows(pg_conn, sqlite_conn, query, params, insert, table, total_rows, batch_size, id_pos)
+
+        # Строки с пустым ID: уже записанные на прерванном этапе удаляются, этап отмечается в той же транзакции
+        with sqlite_conn:
+            sqlite_conn.execute(f'DELETE FROM main.{quote(table)} WHERE "ID" IS NULL')
+            total_rows = sqlite_conn.execute(f"SELECT count(*) FROM main.{quote(table)}").fetchone()[0]
+            sqlite_conn.execute(
+                f"UPDATE {STATE_TABLE} SET rows = ?, null_phase = 1 WHERE table_name = ?", [total_rows, table]
+            )
+        start_rows = min(start_rows, total_rows)
+        query, params = build_select(column_names, table, null_ids=True)
+        total_rows = copy_rows(pg_conn, sqlite_conn, query, params, insert, table, total_rows, batch_size)
+
+        create_sqlite_indexes(sqlite_conn, column_names, table)
+        with sqlite_conn:
+            sqlite_conn.execute(f"UPDATE {STATE_TABLE} SET done = 1 WHERE table_name = ?", [table])
+        pg_conn.rollback()
+    finally:
+        sqlite_conn.close()
+        pg_conn.close()
+
+    elapsed = time.perf_counter() - start
+    copied = total_rows - start_rows
+    print(f"Copied {copied} rows in {elapsed:.1f} s ({copied / max(elapsed, 1e-9):.0f} rows/s), {total_rows} in total")
+    return total_rows
+
+# Хэш ID: первые 8 шестнадцатеричных цифр md5 задают контрольную сумму, следующие 8 — номер части.
+# Одинаково считается в PostgreSQL и в Python, поэтому части и суммы можно сверить.
+# Строки с пустым ID (md5(NULL) — NULL) попадают в часть 0 и не входят в контрольную сумму, но учитываются в числе строк.
+def md5_bits_sql(start):
+    return sql.SQL("('x' || lpad(substr(md5({id}), {start}, 8), 16, '0'))::bit(64)::bigint").format(
+        id=sql.Identifier('ID'), start=sql.Literal(start)
+    )
+
+def id_checksum(value):
+    if value is None:
+        return None
+    return int(hashlib.md5(value.encode('utf-8')).hexdigest()[:8], 16)
+
+def partition_condition():
+    return sql.SQL("coalesce(mod({}, %s), 0) = %s").format(md5_bits_sql(9))
+
+# Число строк и контрольная сумма части в PostgreSQL
+def source_partition_stats(pg_conn, table, partitions, part):
+    with pg_conn.cursor() as cur:
+        cur.execute(
+            sql.SQL("SELECT count(*), coalesce(sum({}), 0) FROM {} WHERE {}").format(
+                md5_bits_sql(1), sql.Identifier(table), partition_condition()
+            ),
+            [partitions, part]
+        )
+        count, checksum = cur.fetchone()
+    return count, int(checksum)
+
+# Число строк и контрольная сумма того, что фактически записано в файл SQLite
+def sqlite_stats(sqlite_conn, table, schema='main'):
+    sqlite_conn.create_function('id_checksum', 1, id_checksum, deterministic=True)
+    count, checksum = sqlite_conn.execute(
+        f'SELECT count(*), coalesce(sum(id_checksum("ID")), 0) FROM {schema}.{quote(table)}'
+    ).fetchone()
+    return count, checksum
+
+def staging_path(sqlite_db_path, part):
+    return f'{sqlite_db_path}.part{part}'
+
+# Выгрузка одной части в отдельный промежуточный файл (выполняется в процессе-исполнителе).
+# Все исполнители читают один снимок данных, экспортированный координатором.
+def export_partition(snapshot, sqlite_db_path, column_types, table, partitions, part, batch_size):
+    pg_conn = db.connect()
+    pg_conn.set_session(isolation_level='REPEATABLE READ', readonly=True)
+    path = staging_path(sqlite_db_path, part)
+    if os.path.exists(path):
+        os.remove(path)
+    staging = sqlite3.connect(path)
+    # Промежуточный файл одноразовый: журнал не нужен
+    staging.execute("PRAGMA journal_mode=OFF")
+    staging.execute("PRAGMA synchronous=OFF")
+    try:
+        with pg_conn.cursor() as cur:
+            cur.execute("SET TRANSACTION SNAPSHOT %s", [snapshot])
+        expected = source_partition_stats(pg_conn, table, partitions, part)
+
+        columns_str = ", ".join(f"{quote(name)} {sqlite_type}" for name, sqlite_type in column_types)
+        staging.execute(f"CREATE TABLE {quote(table)} ({columns_str})")
+        placeholders = ", ".join("?" for _ in column_types)
+        insert = f"INSERT INTO {quote(table)} VALUES ({placeholders})"
+
+        query = sql.SQL("SELECT {} FROM {} WHERE {}").format(
+            sql.SQL(", ").join(sql.Identifier(name) for name, _ in column_types),
+            sql.Identifier(table), partition_condition()
+        )
+        with pg_conn.cursor(name=f'psql_to_lsql_{part}') as cur:
+            cur.itersize = batch_size
+            cur.execute(query, [partitions, part])
+            while True:
+                rows = cur.fetchmany(batch_size)
+                if not rows:
+                    break
+                with staging:
+                    staging.executemany(insert, rows)
+
+        actual = sqlite_stats(staging, table)
+        pg_conn.rollback()
+    finally:
+        staging.close()
+        pg_conn.close()
+    return part, expected, actual
+
+# Параллельный перенос: таблица делится на части по хэшу ID, каждую часть выгружает свой процесс
+# в промежуточный файл, затем файлы одной транзакцией вливаются в my.db. Число строк и контрольная
+# сумма ID каждой части сверяются с PostgreSQL. Замена таблицы, вставка, индексы и сверка итоговой таблицы
+# выполняются в одной транзакции: при любом сбое в my.db остаётся прежняя таблица.
+def migrate_parallel(sqlite_db_path=sqlite_db_path, table=SOURCE_TABLE, partitions=PARALLEL_PARTITIONS,
+                     batch_size=BATCH_SIZE):
+    start = time.perf_counter()
+
+    # Координатор держит транзакцию открытой, пока исполнители читают её снимок
+    pg_conn = db.connect()
+    pg_conn.set_session(isolation_level='REPEATABLE READ', readonly=True)
+    try:
+        column_types = fetch_column_types(pg_conn, table)
+        if not column_types:
+            raise ValueError(f"Table {table} not found in PostgreSQL")
+        with pg_conn.cursor() as cur:
+            cur.execute("SELECT pg_export_snapshot()")
+            snapshot = cur.fetchone()[0]
+
+        args = [(snapshot, sqlite_db_path, column_types, table, partitions, part, batch_size)
+                for part in range(partitions)]
+        with multiprocessing.Pool(processes=partitions) as pool:
+            results = pool.starmap(export_partition, args)
+    finally:
+        pg_conn.rollback()
+        pg_conn.close()
+
+    for part, expected, actual in results:
+        if expected != actual:
+            raise ValueError(f"Partition {part} mismatch: PostgreSQL {expected}, SQLite {actual}")
+        print(f"Partition {part}: {actual[0]} rows, checksum OK")
+
+    sqlite_conn = open_sqlite(sqlite_db_path)
+    try:
+        read_state(sqlite_conn, table)
+        # ATTACH и DETACH нельзя выполнять внутри транзакции
+        for part in range(partitions):
+            sqlite_conn.execute("ATTACH DATABASE ? AS ?", [staging_path(sqlite_db_path, part), f'part{part}'])
+        total_rows = sum(actual[0] for _, _, actual in results)
+        expected = (total_rows, sum(actual[1] for _, _, actual in results))
+        with sqlite_conn:
+            sqlite_conn.execute("BEGIN")
+            replace_sqlite_table(sqlite_conn, column_types, table)
+            for part in range(partitions):
+                sqlite_conn.execute(f"INSERT INTO main.{quote(table)} SELECT * FROM part{part}.{quote(table)}")
+            index_start = time.perf_counter()
+            for statement in build_sqlite_index_statements(table, [name for name, _ in column_types]):
+                sqlite_conn.execute(statement)
+            print(f"Indexes created in {time.perf_counter() - index_start:.1f} s")
+            merged = sqlite_stats(sqlite_conn, table)
+            if merged != expected:
+                raise ValueError(f"Merged table mismatch: expected {expected}, got {merged}")
+            sqlite_conn.execute(
+                f"UPDATE {STATE_TABLE} SET rows = ?, done = 1 WHERE table_name = ?", [total_rows, table]
+            )
+        for part in range(partitions):
+            sqlite_conn.execute(f"DETACH DATABASE part{part}")
+    finally:
+        sqlite_conn.close()
+
+    for part in range(partitions):
+        os.remove(staging_path(sqlite_db_path, part))
+
+    elapsed = time.perf_counter() - start
+    print(f"Copied {total_rows} rows in {elapsed:.1f} s ({total_rows / max(elapsed, 1e-9):.0f} rows/s) "
+          f"with {partitions} workers")
+    return total_rows
+
+if __name__ == '__main__':
+    if MIGRATION_MODE == 'parallel':
+        migrate_parallel(sqlite_db_path)
+    else:
+        migrate(sqlite_db_path)
 
-print(f"Data has been transferred to {sqlite_db_path}")
+    print(f"Data has been transferred to {sqlite_db_path}")
@@ -0,0 +1,117 @@
+// Клиентские обработчики режима DASHBOARD_CLIENT_SIDE (client_side.py): графики строятся в браузере
+// из счётчиков профессия × возраст × интервал, загруженных в dcc.Store один раз за сессию.
+window.dash_clientside = Object.assign({}, window.dash_clientside, {
+    histograms: (function () {
+        var noUpdate = function () {
+            return window.dash_clientside.no_update;
+        };
+
+        // Сумма счётчиков показателя по возрастам диапазона (как HistogramCube.histograms)
+        function sumCounts(store, metric, occupation, ageRange) {
+            var data = store.metrics[metric];
+            var nBins = data.edges.length - 1;
+            var result = new Array(nBins).fill(0);
+            var rows = data.counts[occupation];
+            if (!rows || !ageRange) {
+                return result;
+            }
+            var lo = Math.max(Math.ceil(ageRange[0]), store.age_min);
+            var hi = Math.min(Math.floor(ageRange[1]), store.age_max);
+            for (var age = lo; age <= hi; age++) {
+                var offset = (age - store.age_min) * nBins;
+                for (var b = 0; b < nBins; b++) {
+                    result[b] += rows[offset + b];
+                }
+            }
+            return result;
+        }
+
+        function total(counts) {
+            return counts.reduce(function (a, b) { return a + b; }, 0);
+        }
+
+        function emptyFigure(store, title) {
+            return {data: [], layout: {template: store.template, title: {text: title}}};
+        }
+
+        // Столбчатая диаграмма из интервалов (как histogram_cube.histogram_figure)
+        function histogramFigure(store, edges, counts, spec) {
+            var first = counts.findIndex(function (c) { return c > 0; });
+            var last = counts.length - 1;
+            while (last >= 0 && counts[last] === 0) {
+                last--;
+            }
+            if (first < 0) {
+                first = 0;
+                last = -1;
+            }
+            var x = [], y = [], width = [];
+            for (var b = first; b <= last; b++) {
+                x.push((edges[b] + edges[b + 1]) / 2);
+                y.push(counts[b]);
+                width.push(edges[b + 1] - edges[b]);
+            }
+            var trace = {type: 'bar', x: x, y: y, width: width, name: spec.metric};
+            if (spec.color) {
+                trace.marker = {color: spec.color};
+            }
+            var layout = Object.assign({
+                template: store.template,
+                title: {text: spec.title},
+                bargap: 0,
+                xaxis: {title: {text: spec.label || spec.metric}},
+                yaxis: {title: {text: 'count'}}
+            }, spec.layout || {});
+            return {data: [trace], layout: layout};
+        }
+
+        function metricFigure(store, occupation, ageRange, spec) {
+            if (!store || occupation === null || occupation === undefined) {
+                return null;
+            }
+            var counts = sumCounts(store, spec.metric, occupation, ageRange);
+            if (total(counts) === 0) {
+                return emptyFigure(store, spec.no_data_title);
+            }
+            return histogramFigure(store, store.metrics[spec.metric].edges, counts, spec);
+        }
+
+        return {
+            // Один график: аргументы (store, профессия, диапазон возраста)
+            figure: function (args, spec) {
+                var figure = metricFigure(args[0], args[1], args[2], spec);
+                return figure === null ? noUpdate() : figure;
+            },
+
+            // Несколько графиков с общим фильтром: spec.graphs — параметры каждого графика
+            figures: function (args, spec) {
+                return spec.graphs.map(function (graph) {
+                    var figure = metricFigure(args[0], args[1], args[2], Object.assign({}, spec, graph));
+                    return figure === null ? noUpdate() : figure;
+                });
+            },
+
+            // Вкладки дашборда 3: аргументы (store, вкладка, профессия, диапазон возраста).
+            // Возвращает график вкладки, стили графика и блока параллельных координат,
+            // запрос параллельных координат к серверу (только для spec.server_tab) и текст отладки.
+            tabs: function (args, spec) {
+                var store = args[0], tab = args[1], occupation = args[2], ageRange = args[3];
+                if (!store) {
+                    return [noUpdate(), noUpdate(), noUpdate(), noUpdate(), noUpdate()];
+                }
+                var count = total(sumCounts(store, spec.count_metric, occupation, ageRange));
+                var debug = spec.debug_prefix + count;
+                var hidden = {display: 'none'};
+                if (tab === spec.server_tab) {
+                    return [noUpdate(), hidden, {}, {tab: tab, occupation: occupation, age_range: ageRange}, debug];
+                }
+                var tabSpec = spec.tabs[tab];
+                if (!tabSpec || count === 0) {
+                    return [emptyFigure(store, spec.no_data_title), {}, hidden, noUpdate(), debug];
+                }
+                var figure = metricFigure(store, occupation, ageRange, Object.assign({}, spec, tabSpec));
+                return [figure, {}, hidden, noUpdate(), debug];
+            }
+        };
+    })()
+});
@@ -0,0 +1,45 @@
+// Раскодирование графиков режима DASHBOARD_BINARY_FIGURES (figure_encoding.py): числовые массивы трасс
+// приходят как {dtype, bdata} — base64 типизированного массива little-endian.
+window.dash_clientside = Object.assign({}, window.dash_clientside, {
+    figures: (function () {
+        var ARRAYS = {
+            i1: Int8Array, u1: Uint8Array, i2: Int16Array, u2: Uint16Array,
+            i4: Int32Array, u4: Uint32Array, f4: Float32Array, f8: Float64Array
+        };
+
+        function decodeArray(value) {
+            var binary = atob(value.bdata);
+            var bytes = new Uint8Array(binary.length);
+            for (var i = 0; i < binary.length; i++) {
+                bytes[i] = binary.charCodeAt(i);
+            }
+            return Array.from(new ARRAYS[value.dtype](bytes.buffer));
+        }
+
+        function decodeValue(value) {
+            if (Array.isArray(value)) {
+                return value.map(decodeValue);
+            }
+            if (value && typeof value === 'object') {
+                if (typeof value.bdata === 'string' && ARRAYS[value.dtype] && !value.shape) {
+                    return decodeArray(value);
+                }
+                var result = {};
+                Object.keys(value).forEach(function (key) {
+                    result[key] = decodeValue(value[key]);
+                });
+                return result;
+            }
+            return value;
+        }
+
+        return {
+            decode: function (figure) {
+                if (!figure) {
+                    return window.dash_clientside.no_update;
+                }
+                return {data: figure.data.map(decodeValue), layout: figure.layout};
+            }
+        };
+    })()
+});
@@ -0,0 +1,380 @@
+import argparse
+import datetime
+import gzip
+import importlib
+import json
+import os
+import platform
+import sqlite3
+import statistics
+import subprocess
+import sys
+import time
+import tracemalloc
+
+import pandas as pd
+import plotly
+import plotly.express as px
+import plotly.utils
+
+import etl
+from ddl import sqlite_column_types, build_sqlite_index_script
+from figure_encoding import decode_plotly_array, encode_figure
+from histogram_cube import HistogramCube, histogram_figure
+from load_data import coerce_chunk, peak_rss_mb
+from synthetic_data import write_csv
+
+# Набор замеров производительности без PostgreSQL: синтетический CSV загружается в SQLite (my.db)
+# и Parquet, дашборды запускаются с движками pandas, sqlite и duckdb, каждый обработчик вызывается
+# несколько раз. Результаты пишутся в JSON, чтобы сравнивать запуски между собой.
+# Каждый размер и движок замеряются в отдельном процессе, поэтому пиковая память процессов не смешивается.
+
+BENCHMARK_SIZES = [100_000, 1_000_000, 10_000_000]
+BENCHMARK_BACKENDS = ['pandas', 'sqlite', 'duckdb']
+BENCHMARK_DIR = os.path.join(etl.DATA_DIR, 'benchmark')
+DASHBOARDS = ['dashboard', 'dashboard_2', 'dashboard_3']
+
+# Повторы каждого вызова обработчика; в результатах медиана, минимум и максимум
+REPEATS = 5
+
+# Диапазоны возраста для вызовов обработчиков: весь набор и узкий срез
+AGE_RANGES = [[14, 100], [25, 35]]
+
+# Число профессий, для которых вызываются обработчики
+OCCUPATION_SAMPLES = 2
+
+# Показатели гистограмм и столбцы графика параллельных координат для замера кодирования графиков
+FIGURE_METRICS = ['Annual_Income', 'Outstanding_Debt']
+FIGURE_PARALLEL_COLUMNS = ['Annual_Income', 'Num_Bank_Accounts', 'Num_Credit_Card', 'Interest_Rate',
+                           'Num_Credit_Inquiries', 'Credit_History_Age', 'Outstanding_Debt']
+FIGURE_PARALLEL_LINES = 2000
+
+# Строк CSV в одной части при загрузке в SQLite
+INGEST_CHUNK_SIZE = 100_000
+
+def dataset_paths(size, seed):
+    name = f'customers_{size}_{seed}'
+    return {
+        'csv': os.path.join(BENCHMARK_DIR, f'{name}.csv'),
+        'sqlite': os.path.join(BENCHMARK_DIR, f'{name}.db'),
+        'parquet': os.path.join(BENCHMARK_DIR, f'{name}.parquet'),
+    }
+
+def quote(name):
+    return '"' + name.replace('"', '""') + '"'
+
+# Загрузка CSV в SQLite теми же шагами, что load_data.load_data_streaming: чтение частями
+# и приведение типов через coerce_chunk; вместо COPY в PostgreSQL — пакетная вставка в SQLite
+def ingest_sqlite(csv_path, db_path, chunksize=INGEST_CHUNK_SIZE):
+    if os.path.exists(db_path):
+        os.remove(db_path)
+    column_types = sqlite_column_types()
+    columns_str = ", ".join(f"{quote(name)} {sqlite_type}" for name, sqlite_type in column_types)
+    placeholders = ", ".join("?" for _ in column_types)
+
+    conn = sqlite3.connect(db_path)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    total_rows = 0
+    try:
+        with conn:
+            conn.execute(f"CREATE TABLE customers ({columns_str})")
+            for chunk in pd.read_csv(csv_path, chunksize=chunksize, dtype=str):
+                chunk = coerce_chunk(chunk).astype(object)
+                chunk = chunk.where(chunk.notna(), None)
+                conn.executemany(f"INSERT INTO customers VALUES ({placeholders})",
+                                 chunk.itertuples(index=False, name=None))
+                total_rows += len(chunk)
+        conn.executescript(build_sqlite_index_script('customers'))
+    finally:
+        conn.close()
+    return total_rows
+
+# Выгрузка SQLite в Parquet для движка duckdb (частями, с одинаковой схемой во всех частях)
+def export_parquet(db_path, parquet_path, chunksize=INGEST_CHUNK_SIZE):
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    dtypes = {'INTEGER': 'Int64', 'REAL': 'float64', 'TEXT': 'object'}
+    column_types = {name: dtypes[sqlite_type] for name, sqlite_type in sqlite_column_types()}
+    conn = sqlite3.connect(db_path)
+    writer = None
+    try:
+        for chunk in pd.read_sql_query("SELECT * FROM customers", conn, chunksize=chunksize):
+            table = pa.Table.from_pandas(chunk.astype(column_types), preserve_index=False)
+            if writer is None:
+                writer = pq.ParquetWriter(parquet_path, table.schema)
+            writer.write_table(table)
+    finally:
+        if writer is not None:
+            writer.close()
+        conn.close()
+
+# Замена etl.get_data, читающая SQLite-файл вместо PostgreSQL. Фильтры те же, что в etl.build_query,
+# а полученные строки обрабатываются той же etl.clean_fetched. Ошибки не перехватываются (как при raise_errors=True).
+def sqlite_get_data(db_path):
+    def get_data(columns=None, occupation=None, age_range=None, bounds=None, use_snapshot=True, compact=True,
+                 id_range=None, raise_errors=False):
+        select_list = ", ".join(quote(col) for col in columns) if columns else "*"
+        conditions, params = [], []
+        if occupation:
+            conditions.append('"Occupation" = ?')
+            params.append(occupation)
+        if age_range:
+            conditions.append('"Age" BETWEEN ? AND ?')
+            params.extend(age_range)
+        for col, (low, high) in (bounds or {}).items():
+            if low is not None:
+                conditions.append(f"{quote(col)} >= ?")
+                params.append(low)
+            if high is not None:
+                conditions.append(f"{quote(col)} <= ?")
+                params.append(high)
+        query = f"SELECT {select_list} FROM customers"
+        if conditions:
+            query += " WHERE " + " AND ".join(conditions)
+        conn = sqlite3.connect(db_path)
+        try:
+            df = pd.read_sql_query(query, conn, params=params)
+        finally:
+            conn.close()
+        return etl.clean_fetched(df, compact)
+    return get_data
+
+def payload_bytes(output):
+    return len(json.dumps(output, cls=plotly.utils.PlotlyJSONEncoder).encode('utf-8'))
+
+# Задержка вызова (медиана, минимум, максимум по repeats), пиковая память Python одного вызова
+# по tracemalloc и размер ответа в JSON. reset вызывается перед каждым вызовом (например, сброс кэшей).
+def measure(fn, repeats=REPEATS, reset=None):
+    timings = []
+    for _ in range(repeats):
+        if reset is not None:
+            reset()
+        start = time.perf_counter()
+        output = fn()
+        timings.append((time.perf_counter() - start) * 1000)
+
+    if reset is not None:
+        reset()
+    tracemalloc.start()
+    try:
+        fn()
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+    return {
+        'latency_ms_median': statistics.median(timings),
+        'latency_ms_min': min(timings),
+        'latency_ms_max': max(timings),
+        'peak_mem_mb': peak / 2**20,
+        'figure_bytes': payload_bytes(output),
+    }
+
+# Вызовы обработчиков дашборда: (имя обработчика, функция без аргументов)
+def dashboard_calls(name, module, occupation, age_range):
+    if name == 'dashboard':
+        return [('update_graphs', lambda: module.update_graphs(occupation, age_range))]
+    if name == 'dashboard_2':
+        return [
+            (attr, lambda fn=getattr(module, attr): fn(occupation, age_range))
+            for attr in sorted(dir(module)) if attr.startswith('update_') and attr.endswith('_graph')
+        ]
+    calls = [
+        (f'render_content[tab-{i}]', lambda tab=f'tab-{i}': module.render_content(tab, occupation, age_range))
+        for i in range(1, 10)
+    ]
+    calls.append(('update_debug_info', lambda: module.update_debug_info(occupation, age_range)))
+    return calls
+
+def reset_caches(module):
+    for name in ['figure_cache', 'contexts']:
+        cache = getattr(module, name, None)
+        if cache is not None:
+            cache.clear()
+
+def run_ingest(size, seed):
+    paths = dataset_paths(size, seed)
+    results = []
+
+    if not os.path.exists(paths['csv']):
+        start = time.perf_counter()
+        write_csv(paths['csv'], size, seed=seed)
+        results.append({'stage': 'generate', 'seconds': time.perf_counter() - start})
+
+    start = time.perf_counter()
+    rows = ingest_sqlite(paths['csv'], paths['sqlite'])
+    elapsed = time.perf_counter() - start
+    results.append({'stage': 'ingest', 'rows': rows, 'seconds': elapsed, 'rows_per_sec': rows / elapsed,
+                    'peak_rss_mb': peak_rss_mb()})
+
+    start = time.perf_counter()
+    export_parquet(paths['sqlite'], paths['parquet'])
+    results.append({'stage': 'export_parquet', 'seconds': time.perf_counter() - start})
+
+    get_data = sqlite_get_data(paths['sqlite'])
+    for label, kwargs in [('all_columns', {}), ('default_bounds', {'bounds': etl.DEFAULT_BOUNDS})]:
+        start = time.perf_counter()
+        df = get_data(**kwargs)
+        results.append({'stage': 'get_data', 'variant': label, 'rows': len(df),
+                        'seconds': time.perf_counter() - start,
+                        'frame_mb': df.memory_usage(deep=True).sum() / 2**20})
+    return results
+
+def run_dashboards(size, seed, backend):
+    paths = dataset_paths(size, seed)
+    os.environ['DASHBOARD_BACKEND'] = backend
+    etl.BACKEND = backend
+    etl.SQLITE_DATA_PATH = paths['sqlite']
+    etl.DUCKDB_DATA_PATH = paths['parquet']
+    if backend == 'pandas':
+        etl.get_data = sqlite_get_data(paths['sqlite'])
+
+    results = []
+    for name in DASHBOARDS:
+        # Загрузка, очистка и построение индексов выполняются при импорте модуля дашборда
+        start = time.perf_counter()
+        module = importlib.import_module(name)
+        results.append({'stage': 'startup', 'dashboard': name, 'seconds': time.perf_counter() - start,
+                        'peak_rss_mb': peak_rss_mb()})
+        # Задержка каждого обработчика замеряется без фонового построения соседних вкладок
+        if hasattr(module, 'PREWARM_TABS'):
+            module.PREWARM_TABS = False
+
+        occupations = module.source.current().occupations()[:OCCUPATION_SAMPLES]
+        for occupation in occupations:
+            for age_range in AGE_RANGES:
+                for callback, fn in dashboard_calls(name, module, occupation, age_range):
+                    result = measure(fn, reset=lambda: reset_caches(module))
+                    results.append({'stage': 'callback', 'dashboard': name, 'callback': callback,
+                                    'occupation': occupation, 'age_range': age_range, **result})
+    return results
+
+# Числовые массивы трасс в виде списков JSON, как их отправляет plotly до версии 6
+def plain_lists(value):
+    if isinstance(value, dict):
+        if 'bdata' in value and 'dtype' in value:
+            return decode_plotly_array(value).reshape(value.get('shape', -1)).tolist()
+        return {key: plain_lists(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [plain_lists(item) for item in value]
+    if hasattr(value, 'tolist'):
+        return value.tolist()
+    return value
+
+# Кодирование графика в JSON: как в ответе Dash с установленным plotly, со списками чисел (plotly до версии 6)
+# и с двоичными массивами figure_encoding. Медианное время, размер ответа и размер после gzip.
+def measure_encoding(fig, repeats=REPEATS):
+    lists = {'data': plain_lists(fig.to_plotly_json()['data']), 'layout': fig.layout}
+    result = {}
+    for label, encode in [('json', lambda: fig), ('json_lists', lambda: lists), ('binary', lambda: encode_figure(fig))]:
+        timings = []
+        for _ in range(repeats):
+            start = time.perf_counter()
+            body = json.dumps(encode(), cls=plotly.utils.PlotlyJSONEncoder).encode('utf-8')
+            timings.append((time.perf_counter() - start) * 1000)
+        result[label] = {
+            'encode_ms_median': statistics.median(timings),
+            'bytes': len(body),
+            'gzip_bytes': len(gzip.compress(body)),
+        }
+    return result
+
+# Графики на данных из SQLite: гистограммы по сырым строкам (px.histogram), по заранее посчитанным
+# интервалам (histogram_figure) и параллельные координаты
+def run_figures(size, seed):
+    df = sqlite_get_data(dataset_paths(size, seed)['sqlite'])(bounds=etl.DEFAULT_BOUNDS)
+    cube = HistogramCube(df, FIGURE_METRICS)
+    results = []
+    for occupation in sorted(df['Occupation'].dropna().unique())[:OCCUPATION_SAMPLES]:
+        for age_range in AGE_RANGES:
+            rows = df[(df['Occupation'] == occupation) & df['Age'].between(*age_range)]
+            figures = [(f'histogram_raw[{metric}]', lambda metric=metric: px.histogram(rows, x=metric))
+                       for metric in FIGURE_METRICS]
+            figures += [(f'histogram_binned[{metric}]', lambda metric=metric: histogram_figure(
+                *cube.histogram(metric, occupation, age_range), metric)) for metric in FIGURE_METRICS]
+            figures.append(('parallel_coordinates', lambda: px.parallel_coordinates(
+                rows[FIGURE_PARALLEL_COLUMNS].dropna().head(FIGURE_PARALLEL_LINES), dimensions=FIGURE_PARALLEL_COLUMNS)))
+            for figure, build in figures:
+                results.append({'stage': 'figure_encoding', 'figure': figure, 'occupation': occupation,
+                                'age_range': age_range, 'rows': len(rows), **measure_encoding(build())})
+    return results
+
+# Запуск одного замера в дочернем процессе; результаты передаются через временный JSON-файл
+def run_worker(kind, size, seed, backend=None):
+    out_path = os.path.join(BENCHMARK_DIR, f'worker_{os.getpid()}.json')
+    command = [sys.executable, os.path.abspath(__file__), '--worker', kind, '--worker-size', str(size),
+               '--seed', str(seed), '--worker-output', out_path]
+    if backend:
+        command += ['--worker-backend', backend]
+    subprocess.run(command, check=True, stdout=subprocess.DEVNULL)
+    with open(out_path, encoding='utf-8') as f:
+        results = json.load(f)
+    os.remove(out_path)
+    for result in results:
+        result.update({'size': size, 'backend': backend})
+    return results
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True, check=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except Exception:
+        return None
+
+def run_benchmark(sizes=BENCHMARK_SIZES, backends=BENCHMARK_BACKENDS, seed=0, output=None):
+    os.makedirs(BENCHMARK_DIR, exist_ok=True)
+    results = []
+    for size in sizes:
+        print(f"Size {size}: ingest")
+        results += run_worker('ingest', size, seed)
+        for backend in backends:
+            print(f"Size {size}: dashboards on {backend}")
+            results += run_worker('dashboards', size, seed, backend)
+        print(f"Size {size}: figure encoding")
+        results += run_worker('figures', size, seed)
+
+    report = {
+        'meta': {
+            'timestamp': datetime.datetime.now().isoformat(timespec='seconds'),
+            'revision': git_revision(),
+            'python': platform.python_version(),
+            'plotly': plotly.__version__,
+            'platform': platform.platform(),
+            'seed': seed,
+            'repeats': REPEATS,
+            'sizes': list(sizes),
+            'backends': list(backends),
+        },
+        'results': results,
+    }
+    output = output or os.path.join(BENCHMARK_DIR, f"results_{datetime.datetime.now():%Y%m%d_%H%M%S}.json")
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2, default=str)
+    print(f"Results written to {output}")
+    return report
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Замеры загрузки, выборки данных и обработчиков дашбордов")
+    parser.add_argument('--sizes', type=int, nargs='+', default=BENCHMARK_SIZES)
+    parser.add_argument('--backends', nargs='+', default=BENCHMARK_BACKENDS, choices=BENCHMARK_BACKENDS)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output')
+    parser.add_argument('--worker', choices=['ingest', 'dashboards', 'figures'], help=argparse.SUPPRESS)
+    parser.add_argument('--worker-size', type=int, help=argparse.SUPPRESS)
+    parser.add_argument('--worker-backend', help=argparse.SUPPRESS)
+    parser.add_argument('--worker-output', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker == 'ingest':
+        worker_results = run_ingest(args.worker_size, args.seed)
+    elif args.worker == 'dashboards':
+        worker_results = run_dashboards(args.worker_size, args.seed, args.worker_backend)
+    elif args.worker == 'figures':
+        worker_results = run_figures(args.worker_size, args.seed)
+    else:
+        run_benchmark(args.sizes, args.backends, args.seed, args.output)
+        sys.exit(0)
+    with open(args.worker_output, 'w', encoding='utf-8') as f:
+        json.dump(worker_results, f, default=str)
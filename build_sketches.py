@@ -0,0 +1,48 @@
+import argparse
+import multiprocessing
+import os
+import time
+
+import etl
+from ddl import DEFAULT_BOUNDS
+from quantile_sketch import SketchCube
+
+# Построение эскизов квантилей для движка 'sketch' за один проход по full_customers.
+# С --workers таблица делится на части по хэшу ID, каждая часть обрабатывается в отдельном процессе,
+# а эскизы частей объединяются в один файл (тот же, что читает etl.get_sketch_cube).
+
+# Число процессов по умолчанию
+SKETCH_WORKERS = min(4, os.cpu_count() or 1)
+
+# Эскизы одной части таблицы; в родительский процесс передаются в виде словаря
+def build_partition(bounds, id_range, part, partitions):
+    return etl.build_sketch_cube(bounds, id_range=id_range, partition=(part, partitions)).to_dict()
+
+def build_sketches(bounds=DEFAULT_BOUNDS, workers=SKETCH_WORKERS):
+    fingerprint = etl.current_fingerprint()
+    if fingerprint is None:
+        raise ValueError("PostgreSQL is unavailable.")
+    # Все части читают строки до одного и того же последнего ID
+    id_range = (None, fingerprint['max_id'])
+
+    start = time.perf_counter()
+    if workers > 1:
+        with multiprocessing.Pool(processes=workers) as pool:
+            parts = pool.starmap(build_partition, [(bounds, id_range, part, workers) for part in range(workers)])
+        cube = SketchCube.from_dict(parts[0])
+        for part in parts[1:]:
+            cube.merge(SketchCube.from_dict(part))
+    else:
+        cube = etl.build_sketch_cube(bounds, id_range=id_range)
+
+    path = etl.sketch_path(bounds)
+    cube.save(path, fingerprint=fingerprint)
+    rows = sum(int(counts.sum()) for counts in cube.counts.values())
+    print(f"Built quantile sketches for {rows} rows in {time.perf_counter() - start:.1f} s: {path}")
+    return cube
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Построение эскизов квантилей по full_customers")
+    parser.add_argument('--workers', type=int, default=SKETCH_WORKERS)
+    args = parser.parse_args()
+    build_sketches(workers=args.workers)
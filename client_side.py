@@ -0,0 +1,77 @@
+import json
+import os
+import threading
+
+import plotly.io as pio
+from dash import dcc
+from dash.dependencies import Input, Output
+
+# Режим фильтрации в браузере: один раз за сессию сервер отдаёт счётчики по профессии, возрасту
+# и интервалам, а графики при движении ползунков строятся клиентскими обработчиками (assets/clientside.js)
+CLIENT_SIDE = os.environ.get('DASHBOARD_CLIENT_SIDE', '0') == '1'
+
+STORE_ID = 'histogram-store'
+
+# Данные для браузера: для каждого показателя границы интервалов и по каждой профессии счётчики
+# возраст × интервал (возраст от age_min до age_max), записанные подряд по возрастам.
+# Шаблон оформления plotly передаётся вместе с данными, чтобы графики выглядели как серверные.
+def build_payload(data, metrics):
+    age_min, age_max = (int(age) for age in data.age_bounds())
+    payload = {
+        'version': data.version,
+        'age_min': age_min,
+        'age_max': age_max,
+        'template': pio.templates[pio.templates.default].to_plotly_json(),
+        'metrics': {},
+    }
+    for metric in metrics:
+        edges, by_occupation = data.age_bin_counts(metric)
+        payload['metrics'][metric] = {
+            'edges': [float(edge) for edge in edges],
+            'counts': {
+                occupation: counts[age_min:age_max + 1].ravel().tolist()
+                for occupation, counts in by_occupation.items()
+            },
+        }
+    return payload
+
+# Данные для браузера строятся один раз на версию набора данных и отдаются всем сессиям
+class PayloadCache:
+    def __init__(self, holder, metrics):
+        self.holder = holder
+        self.metrics = list(metrics)
+        self.lock = threading.Lock()
+        self.version = None
+        self.payload = None
+
+    def get(self):
+        data = self.holder.current()
+        with self.lock:
+            if self.version != data.version:
+                self.payload = build_payload(data, self.metrics)
+                self.version = data.version
+            return self.payload
+
+def store():
+    return dcc.Store(id=STORE_ID)
+
+# Заполнение хранилища при открытии страницы — единственный запрос к серверу за сессию
+def register_store(app, holder, metrics, instrumentation=None):
+    cache = PayloadCache(holder, metrics)
+
+    def load_client_data(_):
+        return cache.get()
+
+    if instrumentation is not None:
+        load_client_data = instrumentation.instrument('load_client_data')(load_client_data)
+    app.callback(Output(STORE_ID, 'data'), [Input(STORE_ID, 'id')])(load_client_data)
+    return cache
+
+# Клиентская функция, вызывающая histograms.<function_name> из assets/clientside.js с параметрами spec
+def clientside_function(function_name, spec):
+    return (
+        "function() {"
+        f" return window.dash_clientside.histograms.{function_name}"
+        f"(Array.prototype.slice.call(arguments), {json.dumps(spec, ensure_ascii=False)});"
+        " }"
+    )
@@ -5,27 +5,40 @@ from dash import dcc, html
 from dash.dependencies import Input, Output
 import plotly.express as px
 import pandas as pd
-from etl import get_data
+from etl import get_source, DEFAULT_BOUNDS
+from histogram_cube import histogram_figure
+from instrumentation import Instrumentation, current
+import startup
+import percentile_route
+from client_side import CLIENT_SIDE, STORE_ID, clientside_function, register_store, store
+from figure_encoding import BINARY_FIGURES, encoded, figure_store_id, register_decoder
+
+# Столбцы, которые используются в графиках
+COLUMNS = [
+    'Occupation', 'Age', 'Annual_Income', 'Num_Bank_Accounts', 'Num_Credit_Card',
+    'Outstanding_Debt', 'Credit_Utilization_Ratio', 'Amount_invested_monthly'
+]
+
+# Загрузка данных: экстремальные значения отфильтрованы на стороне базы (движок задаётся в etl.BACKEND),
+# гистограммы агрегируются заранее по профессии, возрасту и интервалам (все столбцы, кроме профессии)
+source = get_source(COLUMNS, COLUMNS[1:], bounds=DEFAULT_BOUNDS)
+
+# Значения для элементов управления (при фоновом запуске — из сохранённых метаданных)
+occupations = source.occupations()
+age_min, age_max = (int(age) for age in source.age_bounds())
 
-# Загрузка данных
-df = get_data()
-
-# Проверка наличия данных
-if df.empty:
-    raise ValueError("DataFrame is empty. Please check your data source.")
+# Создание приложения Dash
+app = dash.Dash(__name__)
 
-# Проверка наличия столбца 'Occupation'
-if 'Occupation' not in df.columns:
-    raise KeyError("Столбец 'Occupation' не найден в данных")
+# Задержки обработчиков по этапам и размер ответов, доступны по адресу /metrics
+metrics = Instrumentation()
+metrics.init_app(app)
 
-# Фильтрация данных для исключения экстремальных значений
-df = df[df['Annual_Income'] <= 1e6]
-df = df[(df['Age'] > 0) & (df['Age'] <= 100)]
-df = df[df['Num_Bank_Accounts'] <= 10]
-df = df[df['Num_Credit_Card'] <= 10]
+# Проверки для балансировщика: /healthz (процесс жив) и /readyz (данные загружены)
+startup.init_app(app, source)
 
-# Создание приложения Dash
-app = dash.Dash(__name__)
+# Процентили показателей и границы ошибки для движка 'sketch': /percentiles?occupation=...&age_min=...&age_max=...
+percentile_route.init_app(app, source, COLUMNS[1:])
 
 # Макет дашборда
 app.layout = html.Div([
@@ -35,8 +48,8 @@ app.layout = html.Div([
         html.Label("Выберите профессию:"),
         dcc.Dropdown(
             id='occupation-dropdown',
-            options=[{'label': occ, 'value': occ} for occ in df['Occupation'].unique()],
-            value=df['Occupation'].unique()[0] if not df['Occupation'].empty else None
+            options=[{'label': occ, 'value': occ} for occ in occupations],
+            value=occupations[0] if occupations else None
         ),
     ], style={'width': '48%', 'display': 'inline-block'}),
     
@@ -44,10 +57,10 @@ app.layout = html.Div([
         html.Label("Выберите диапазон возраста:"),
         dcc.RangeSlider(
             id='age-slider',
-            min=df['Age'].min(),
-            max=df['Age'].max(),
-            value=[df['Age'].min(), df['Age'].max()],
-            marks={i: str(i) for i in range(df['Age'].min(), df['Age'].max()+1, 5)}
+            min=age_min,
+            max=age_max,
+            value=[age_min, age_max],
+            marks={i: str(i) for i in range(age_min, age_max+1, 5)}
         ),
     ], style={'width': '48%', 'display': 'inline-block'}),
 
@@ -85,112 +98,54 @@ app.layout = html.Div([
         html.Label("Ежемесячные инвестиции:"),
         dcc.Graph(id='investment-graph')
     ])
-])
-
-# Обработчик для обновления графика дохода
-@app.callback(
-    Output('income-graph', 'figure'),
-    [Input('occupation-dropdown', 'value'),
-     Input('age-slider', 'value')]
-)
-def update_income_graph(selected_occupation, age_range):
-    if selected_occupation is None:
-        return px.histogram(title='Нет данных')
-    
-    filtered_df = df[(df['Occupation'] == selected_occupation) &
-                     (df['Age'] >= age_range[0]) & (df['Age'] <= age_range[1])]
-    fig = px.histogram(filtered_df, x='Annual_Income', title='Распределение годового дохода')
-    return fig
-
-# Обработчик для обновления графика возраста
-@app.callback(
-    Output('age-graph', 'figure'),
-    [Input('occupation-dropdown', 'value'),
-     Input('age-slider', 'value')]
-)
-def update_age_graph(selected_occupation, age_range):
-    if selected_occupation is None:
-        return px.histogram(title='Нет данных')
-    
-    filtered_df = df[(df['Occupation'] == selected_occupation) &
-                     (df['Age'] >= age_range[0]) & (df['Age'] <= age_range[1])]
-    fig = px.histogram(filtered_df, x='Age', title='Распределение возраста')
-    return fig
-
-# Обработчик для обновления графика числа банковских счетов
-@app.callback(
-    Output('bank-accounts-graph', 'figure'),
-    [Input('occupation-dropdown', 'value'),
-     Input('age-slider', 'value')]
-)
-def update_bank_accounts_graph(selected_occupation, age_range):
+] + ([store()] if CLIENT_SIDE else []))
+
+# Графики дашборда: идентификатор, показатель и заголовок
+GRAPHS = [
+    ('income-graph', 'Annual_Income', 'Распределение годового дохода'),
+    ('age-graph', 'Age', 'Распределение возраста'),
+    ('bank-accounts-graph', 'Num_Bank_Accounts', 'Распределение количества банковских счетов'),
+    ('credit-cards-graph', 'Num_Credit_Card', 'Распределение количества кредитных карт'),
+    ('debt-graph', 'Outstanding_Debt', 'Распределение задолженности'),
+    ('credit-utilization-graph', 'Credit_Utilization_Ratio', 'Распределение коэффициента использования кредита'),
+    ('investment-graph', 'Amount_invested_monthly', 'Распределение ежемесячных инвестиций'),
+]
+
+# Один обработчик для всех графиков: один запрос и один фильтр на каждое действие пользователя
+@metrics.instrument('update_graphs')
+def update_graphs(selected_occupation, age_range):
     if selected_occupation is None:
-        return px.histogram(title='Нет данных')
-    
-    filtered_df = df[(df['Occupation'] == selected_occupation) &
-                     (df['Age'] >= age_range[0]) & (df['Age'] <= age_range[1])]
-    fig = px.histogram(filtered_df, x='Num_Bank_Accounts', title='Распределение количества банковских счетов')
-    return fig
-
-# Обработчик для обновления графика числа кредитных карт
-@app.callback(
-    Output('credit-cards-graph', 'figure'),
-    [Input('occupation-dropdown', 'value'),
-     Input('age-slider', 'value')]
-)
-def update_credit_cards_graph(selected_occupation, age_range):
-    if selected_occupation is None:
-        return px.histogram(title='Нет данных')
-    
-    filtered_df = df[(df['Occupation'] == selected_occupation) &
-                     (df['Age'] >= age_range[0]) & (df['Age'] <= age_range[1])]
-    fig = px.histogram(filtered_df, x='Num_Credit_Card', title='Распределение количества кредитных карт')
-    return fig
-
-# Обработчик для обновления графика задолженности
-@app.callback(
-    Output('debt-graph', 'figure'),
-    [Input('occupation-dropdown', 'value'),
-     Input('age-slider', 'value')]
-)
-def update_debt_graph(selected_occupation, age_range):
-    if selected_occupation is None:
-        return px.histogram(title='Нет данных')
-    
-    filtered_df = df[(df['Occupation'] == selected_occupation) &
-                     (df['Age'] >= age_range[0]) & (df['Age'] <= age_range[1])]
-    fig = px.histogram(filtered_df, x='Outstanding_Debt', title='Распределение задолженности')
-    return fig
-
-# Обработчик для обновления графика коэффициента использования кредита
-@app.callback(
-    Output('credit-utilization-graph', 'figure'),
-    [Input('occupation-dropdown', 'value'),
-     Input('age-slider', 'value')]
-)
-def update_credit_utilization_graph(selected_occupation, age_range):
-    if selected_occupation is None:
-        return px.histogram(title='Нет данных')
-    
-    filtered_df = df[(df['Occupation'] == selected_occupation) &
-                     (df['Age'] >= age_range[0]) & (df['Age'] <= age_range[1])]
-    fig = px.histogram(filtered_df, x='Credit_Utilization_Ratio', title='Распределение коэффициента использования кредита')
-    return fig
-
-# Обработчик для обновления графика суммы ежемесячных инвестиций
-@app.callback(
-    Output('investment-graph', 'figure'),
-    [Input('occupation-dropdown', 'value'),
-     Input('age-slider', 'value')]
-)
-def update_investment_graph(selected_occupation, age_range):
-    if selected_occupation is None:
-        return px.histogram(title='Нет данных')
-    
-    filtered_df = df[(df['Occupation'] == selected_occupation) &
-                     (df['Age'] >= age_range[0]) & (df['Age'] <= age_range[1])]
-    fig = px.histogram(filtered_df, x='Amount_invested_monthly', title='Распределение ежемесячных инвестиций')
-    return fig
+        return [px.histogram(title='Нет данных') for _ in GRAPHS]
+
+    timer = current()
+    with timer.phase('filter'):
+        histograms = source.current().histograms([metric for _, metric, _ in GRAPHS], selected_occupation, age_range)
+    timer.rows = histograms['Age'][1].sum()
+    # Графики строятся последовательно: сборка go.Figure — код на Python, который держит GIL,
+    # и пул потоков дал бы только накладные расходы
+    with timer.phase('build'):
+        return [histogram_figure(*histograms[metric], metric, title=title) for _, metric, title in GRAPHS]
+
+# В режиме DASHBOARD_CLIENT_SIDE графики строятся в браузере из данных хранилища,
+# загруженных один раз за сессию
+outputs = [Output(graph_id, 'figure') for graph_id, _, _ in GRAPHS]
+inputs = [Input('occupation-dropdown', 'value'), Input('age-slider', 'value')]
+if CLIENT_SIDE:
+    register_store(app, source, [metric for _, metric, _ in GRAPHS], metrics)
+    app.clientside_callback(
+        clientside_function('figures', {
+            'graphs': [{'metric': metric, 'title': title} for _, metric, title in GRAPHS],
+            'no_data_title': 'Нет данных',
+        }),
+        outputs,
+        [Input(STORE_ID, 'data')] + inputs
+    )
+elif BINARY_FIGURES:
+    # Числовые массивы графиков передаются в двоичном виде и раскодируются в браузере
+    app.layout.children += [register_decoder(app, graph_id) for graph_id, _, _ in GRAPHS]
+    app.callback([Output(figure_store_id(graph_id), 'data') for graph_id, _, _ in GRAPHS], inputs)(encoded(update_graphs))
+else:
+    app.callback(outputs, inputs)(update_graphs)
 
 if __name__ == '__main__':
     app.run_server(debug=True)
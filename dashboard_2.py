@@ -3,23 +3,44 @@ from dash import dcc, html
 from dash.dependencies import Input, Output
 import plotly.express as px
 import pandas as pd
-from etl import get_data
+from etl import get_source, DEFAULT_BOUNDS
+from histogram_cube import histogram_figure
+from figure_cache import FigureCache
+from instrumentation import Instrumentation, current
+import startup
+import percentile_route
+from client_side import CLIENT_SIDE, STORE_ID, clientside_function, register_store, store
+from figure_encoding import BINARY_FIGURES, encoded, figure_store_id, register_decoder
+from flask import jsonify
 
-df = get_data()
+COLUMNS = [
+    'Occupation', 'Age', 'Annual_Income', 'Num_Bank_Accounts', 'Num_Credit_Card',
+    'Outstanding_Debt', 'Credit_Utilization_Ratio', 'Amount_invested_monthly'
+]
 
-if df.empty:
-    raise ValueError("DataFrame is empty. Please check your data source.")
+# Экстремальные значения отфильтрованы на стороне базы (движок задаётся в etl.BACKEND),
+# гистограммы агрегируются заранее по профессии, возрасту и интервалам
+source = get_source(COLUMNS, COLUMNS[1:], bounds=DEFAULT_BOUNDS)
 
-if 'Occupation' not in df.columns:
-    raise KeyError("Столбец 'Occupation' не найден в данных")
+occupations = source.occupations()
+age_min, age_max = source.age_bounds()
 
-df = df[df['Annual_Income'] <= 1e6]
-df = df[(df['Age'] > 0) & (df['Age'] <= 100)]
-df = df[df['Num_Bank_Accounts'] <= 10]
-df = df[df['Num_Credit_Card'] <= 10]
+# Кэш готовых графиков с ограничением по памяти (в байтах)
+FIGURE_CACHE_BYTES = 64 * 1024 * 1024
+figure_cache = FigureCache(FIGURE_CACHE_BYTES)
 
 app = dash.Dash(__name__)
 
+# Задержки обработчиков по этапам и размер ответов, доступны по адресу /metrics
+metrics = Instrumentation()
+metrics.init_app(app)
+
+# Проверки для балансировщика: /healthz (процесс жив) и /readyz (данные загружены)
+startup.init_app(app, source)
+
+# Процентили показателей и границы ошибки для движка 'sketch': /percentiles?occupation=...&age_min=...&age_max=...
+percentile_route.init_app(app, source, COLUMNS[1:])
+
 styles = {
     'body': {
         'backgroundColor': '#2c2c2c',
@@ -87,8 +108,8 @@ app.layout = html.Div(style=styles['container'], children=[
         html.Label("Выберите профессию (доход):", style=styles['label']),
         dcc.Dropdown(
             id='income-occupation-dropdown',
-            options=[{'label': occ, 'value': occ} for occ in df['Occupation'].unique()],
-            value=df['Occupation'].unique()[0] if not df['Occupation'].empty else None,
+            options=[{'label': occ, 'value': occ} for occ in occupations],
+            value=occupations[0] if occupations else None,
             style=styles['dropdown']
         ),
         html.Label("Выберите диапазон возраста (доход):", style=styles['label']),
@@ -96,7 +117,7 @@ app.layout = html.Div(style=styles['container'], children=[
             id='income-age-slider',
             min=0,
             max=100,
-            value=[df['Age'].min(), df['Age'].max()],
+            value=[age_min, age_max],
             marks={i: str(i) for i in range(0, 101, 10)},
             step=1,
             tooltip={"placement": "bottom", "always_visible": True},
@@ -110,8 +131,8 @@ app.layout = html.Div(style=styles['container'], children=[
         html.Label("Выберите профессию (возраст):", style=styles['label']),
         dcc.Dropdown(
             id='age-occupation-dropdown',
-            options=[{'label': occ, 'value': occ} for occ in df['Occupation'].unique()],
-            value=df['Occupation'].unique()[0] if not df['Occupation'].empty else None,
+            options=[{'label': occ, 'value': occ} for occ in occupations],
+            value=occupations[0] if occupations else None,
             style=styles['dropdown']
         ),
         html.Label("Выберите диапазон возраста (возраст):", style=styles['label']),
@@ -119,7 +140,7 @@ app.layout = html.Div(style=styles['container'], children=[
             id='age-age-slider',
             min=0,
             max=100,
-            value=[df['Age'].min(), df['Age'].max()],
+            value=[age_min, age_max],
             marks={i: str(i) for i in range(0, 101, 10)},
             step=1,
             tooltip={"placement": "bottom", "always_visible": True},
@@ -133,8 +154,8 @@ app.layout = html.Div(style=styles['container'], children=[
         html.Label("Выберите профессию (банковские счета):", style=styles['label']),
         dcc.Dropdown(
             id='bank-accounts-occupation-dropdown',
-            options=[{'label': occ, 'value': occ} for occ in df['Occupation'].unique()],
-            value=df['Occupation'].unique()[0] if not df['Occupation'].empty else None,
+            options=[{'label': occ, 'value': occ} for occ in occupations],
+            value=occupations[0] if occupations else None,
             style=styles['dropdown']
         ),
         html.Label("Выберите диапазон возраста (банковские счета):", style=styles['label']),
@@ -142,7 +163,7 @@ app.layout = html.Div(style=styles['container'], children=[
             id='bank-accounts-age-slider',
             min=0,
             max=100,
-            value=[df['Age'].min(), df['Age'].max()],
+            value=[age_min, age_max],
             marks={i: str(i) for i in range(0, 101, 10)},
             step=1,
             tooltip={"placement": "bottom", "always_visible": True},
@@ -156,8 +177,8 @@ app.layout = html.Div(style=styles['container'], children=[
         html.Label("Выберите профессию (кредитные карты):", style=styles['label']),
         dcc.Dropdown(
             id='credit-cards-occupation-dropdown',
-            options=[{'label': occ, 'value': occ} for occ in df['Occupation'].unique()],
-            value=df['Occupation'].unique()[0] if not df['Occupation'].empty else None,
+            options=[{'label': occ, 'value': occ} for occ in occupations],
+            value=occupations[0] if occupations else None,
             style=styles['dropdown']
         ),
         html.Label("Выберите диапазон возраста (кредитные карты):", style=styles['label']),
@@ -165,7 +186,7 @@ app.layout = html.Div(style=styles['container'], children=[
             id='credit-cards-age-slider',
             min=0,
             max=100,
-            value=[df['Age'].min(), df['Age'].max()],
+            value=[age_min, age_max],
             marks={i: str(i) for i in range(0, 101, 10)},
             step=1,
             tooltip={"placement": "bottom", "always_visible": True},
@@ -179,8 +200,8 @@ app.layout = html.Div(style=styles['container'], children=[
         html.Label("Выберите профессию (задолженность):", style=styles['label']),
         dcc.Dropdown(
             id='debt-occupation-dropdown',
-            options=[{'label': occ, 'value': occ} for occ in df['Occupation'].unique()],
-            value=df['Occupation'].unique()[0] if not df['Occupation'].empty else None,
+            options=[{'label': occ, 'value': occ} for occ in occupations],
+            value=occupations[0] if occupations else None,
             style=styles['dropdown']
         ),
         html.Label("Выберите диапазон возраста (задолженность):", style=styles['label']),
@@ -188,7 +209,7 @@ app.layout = html.Div(style=styles['container'], children=[
             id='debt-age-slider',
             min=0,
             max=100,
-            value=[df['Age'].min(), df['Age'].max()],
+            value=[age_min, age_max],
             marks={i: str(i) for i in range(0, 101, 10)},
             step=1,
             tooltip={"placement": "bottom", "always_visible": True},
@@ -202,8 +223,8 @@ app.layout = html.Div(style=styles['container'], children=[
         html.Label("Выберите профессию (коэффициент использования кредита):", style=styles['label']),
         dcc.Dropdown(
             id='credit-utilization-occupation-dropdown',
-            options=[{'label': occ, 'value': occ} for occ in df['Occupation'].unique()],
-            value=df['Occupation'].unique()[0] if not df['Occupation'].empty else None,
+            options=[{'label': occ, 'value': occ} for occ in occupations],
+            value=occupations[0] if occupations else None,
             style=styles['dropdown']
         ),
         html.Label("Выберите диапазон возраста (коэффициент использования кредита):", style=styles['label']),
@@ -211,7 +232,7 @@ app.layout = html.Div(style=styles['container'], children=[
             id='credit-utilization-age-slider',
             min=0,
             max=100,
-            value=[df['Age'].min(), df['Age'].max()],
+            value=[age_min, age_max],
             marks={i: str(i) for i in range(0, 101, 10)},
             step=1,
             tooltip={"placement": "bottom", "always_visible": True},
@@ -225,8 +246,8 @@ app.layout = html.Div(style=styles['container'], children=[
         html.Label("Выберите профессию (ежемесячные инвестиции):", style=styles['label']),
         dcc.Dropdown(
             id='investment-occupation-dropdown',
-            options=[{'label': occ, 'value': occ} for occ in df['Occupation'].unique()],
-                        value=df['Occupation'].unique()[0] if not df['Occupation'].empty else None,
+            options=[{'label': occ, 'value': occ} for occ in occupations],
+                        value=occupations[0] if occupations else None,
             style=styles['dropdown']
         ),
         html.Label("Выберите диапазон возраста (ежемесячные инвестиции):", style=styles['label']),
@@ -234,7 +255,7 @@ app.layout = html.Div(style=styles['container'], children=[
             id='investment-age-slider',
             min=0,
             max=100,
-            value=[df['Age'].min(), df['Age'].max()],
+            value=[age_min, age_max],
             marks={i: str(i) for i in range(0, 101, 10)},
             step=1,
             tooltip={"placement": "bottom", "always_visible": True},
@@ -243,204 +264,126 @@ app.layout = html.Div(style=styles['container'], children=[
         ),
         dcc.Graph(id='investment-graph')
     ])
-])
-
-# Обработчики для обновления графиков
-@app.callback(
-    Output('income-graph', 'figure'),
-    [Input('income-occupation-dropdown', 'value'),
-     Input('income-age-slider', 'value')]
-)
-def update_income_graph(selected_occupation, age_range):
-    print(f'Updating income graph with: Occupation={selected_occupation}, Age Range={age_range}')
-    if selected_occupation is None:
-        return px.histogram(title='Нет данных')
-    
-    filtered_df = df[(df['Occupation'] == selected_occupation) &
-                     (df['Age'] >= age_range[0]) & (df['Age'] <= age_range[1])]
-    print(f'Filtered DataFrame for income graph:\n{filtered_df.head()}')
+] + ([store()] if CLIENT_SIDE else []))
+
+# Оформление графиков, общее для сервера и браузера
+GRAPH_LAYOUT = {
+    'plot_bgcolor': '#2c2c2c',
+    'paper_bgcolor': '#2c2c2c',
+    'font': {'size': 14, 'color': '#ffffff'},
+}
+
+# Построение графика показателя для выбранной профессии и диапазона возраста
+def build_graph(data, metric, title, color, selected_occupation, age_range):
+    timer = current()
+    with timer.phase('filter'):
+        edges, counts = data.histograms([metric], selected_occupation, age_range)[metric]
+    timer.rows = counts.sum()
     
-    if filtered_df.empty:
+    if counts.sum() == 0:
         return px.histogram(title='Нет данных')
     
-    fig = px.histogram(filtered_df, x='Annual_Income', title='Распределение годового дохода', color_discrete_sequence=['darkorange'])
-    fig.update_layout(
-        plot_bgcolor='#2c2c2c',
-        paper_bgcolor='#2c2c2c',
-        font=dict(
-            size=14,
-            color='#ffffff'
-        )
-    )
+    with timer.phase('build'):
+        fig = histogram_figure(edges, counts, metric, title=title, color=color)
+        fig.update_layout(**GRAPH_LAYOUT)
     return fig
 
-@app.callback(
-    Output('age-graph', 'figure'),
-    [Input('age-occupation-dropdown', 'value'),
-     Input('age-age-slider', 'value')]
-)
-def update_age_graph(selected_occupation, age_range):
-    print(f'Updating age graph with: Occupation={selected_occupation}, Age Range={age_range}')
+# Графики из кэша: при перетаскивании ползунка диапазоны возраста часто повторяются.
+# Версия данных входит в ключ, поэтому после фонового обновления графики строятся заново.
+def cached_graph(metric, title, color, selected_occupation, age_range):
+    data = source.current()
+    key = (data.version, metric, selected_occupation, tuple(age_range))
+    return figure_cache.get_or_build(
+        key, lambda: build_graph(data, metric, title, color, selected_occupation, age_range)
+    )
+
+# Обработчики для обновления графиков (регистрируются ниже, см. GRAPHS)
+@metrics.instrument('update_income_graph')
+def update_income_graph(selected_occupation, age_range):
     if selected_occupation is None:
         return px.histogram(title='Нет данных')
     
-    filtered_df = df[(df['Occupation'] == selected_occupation) &
-                     (df['Age'] >= age_range[0]) & (df['Age'] <= age_range[1])]
-    print(f'Filtered DataFrame for age graph:\n{filtered_df.head()}')
-    
-    if filtered_df.empty:
+    return cached_graph('Annual_Income', 'Распределение годового дохода', 'darkorange', selected_occupation, age_range)
+
+@metrics.instrument('update_age_graph')
+def update_age_graph(selected_occupation, age_range):
+    if selected_occupation is None:
         return px.histogram(title='Нет данных')
     
-    fig = px.histogram(filtered_df, x='Age', title='Распределение возраста', color_discrete_sequence=['#636efa'])
-    fig.update_layout(
-        plot_bgcolor='#2c2c2c',
-        paper_bgcolor='#2c2c2c',
-        font=dict(
-            size=14,
-            color='#ffffff'
-        )
-    )
-    return fig
+    return cached_graph('Age', 'Распределение возраста', '#636efa', selected_occupation, age_range)
 
-@app.callback(
-    Output('bank-accounts-graph', 'figure'),
-    [Input('bank-accounts-occupation-dropdown', 'value'),
-     Input('bank-accounts-age-slider', 'value')]
-)
+@metrics.instrument('update_bank_accounts_graph')
 def update_bank_accounts_graph(selected_occupation, age_range):
-    print(f'Updating bank accounts graph with: Occupation={selected_occupation}, Age Range={age_range}')
     if selected_occupation is None:
         return px.histogram(title='Нет данных')
     
-    filtered_df = df[(df['Occupation'] == selected_occupation) &
-                     (df['Age'] >= age_range[0]) & (df['Age'] <= age_range[1])]
-    print(f'Filtered DataFrame for bank accounts graph:\n{filtered_df.head()}')
-    
-    if filtered_df.empty:
-        return px.histogram(title='Нет данных')
-    
-    fig = px.histogram(filtered_df, x='Num_Bank_Accounts', title='Распределение количества банковских счетов', color_discrete_sequence=['darkorange'])
-    fig.update_layout(
-        plot_bgcolor='#2c2c2c',
-        paper_bgcolor='#2c2c2c',
-        font=dict(
-            size=14,
-            color='#ffffff'
-        )
-    )
-    return fig
+    return cached_graph('Num_Bank_Accounts', 'Распределение количества банковских счетов', 'darkorange', selected_occupation, age_range)
 
-@app.callback(
-    Output('credit-cards-graph', 'figure'),
-    [Input('credit-cards-occupation-dropdown', 'value'),
-     Input('credit-cards-age-slider', 'value')]
-)
+@metrics.instrument('update_credit_cards_graph')
 def update_credit_cards_graph(selected_occupation, age_range):
-    print(f'Updating credit cards graph with: Occupation={selected_occupation}, Age Range={age_range}')
     if selected_occupation is None:
         return px.histogram(title='Нет данных')
     
-    filtered_df = df[(df['Occupation'] == selected_occupation) &
-                     (df['Age'] >= age_range[0]) & (df['Age'] <= age_range[1])]
-    print(f'Filtered DataFrame for credit cards graph:\n{filtered_df.head()}')
-    
-    if filtered_df.empty:
-        return px.histogram(title='Нет данных')
-    
-    fig = px.histogram(filtered_df, x='Num_Credit_Card', title='Распределение количества кредитных карт', color_discrete_sequence=['#636efa'])
-    fig.update_layout(
-        plot_bgcolor='#2c2c2c',
-        paper_bgcolor='#2c2c2c',
-        font=dict(
-            size=14,
-            color='#ffffff'
-        )
-    )
-    return fig
+    return cached_graph('Num_Credit_Card', 'Распределение количества кредитных карт', '#636efa', selected_occupation, age_range)
 
-@app.callback(
-    Output('debt-graph', 'figure'),
-    [Input('debt-occupation-dropdown', 'value'),
-     Input('debt-age-slider', 'value')]
-)
+@metrics.instrument('update_debt_graph')
 def update_debt_graph(selected_occupation, age_range):
-    print(f'Updating debt graph with: Occupation={selected_occupation}, Age Range={age_range}')
     if selected_occupation is None:
         return px.histogram(title='Нет данных')
     
-    filtered_df = df[(df['Occupation'] == selected_occupation) &
-                     (df['Age'] >= age_range[0]) & (df['Age'] <= age_range[1])]
-    print(f'Filtered DataFrame for debt graph:\n{filtered_df.head()}')
-    
-    if filtered_df.empty:
-        return px.histogram(title='Нет данных')
-    
-    fig = px.histogram(filtered_df, x='Outstanding_Debt', title='Распределение задолженности', color_discrete_sequence=['darkorange'])
-    fig.update_layout(
-        plot_bgcolor='#2c2c2c',
-        paper_bgcolor='#2c2c2c',
-        font=dict(
-            size=14,
-            color='#ffffff'
-        )
-    )
-    return fig
+    return cached_graph('Outstanding_Debt', 'Распределение задолженности', 'darkorange', selected_occupation, age_range)
 
-@app.callback(
-    Output('credit-utilization-graph', 'figure'),
-    [Input('credit-utilization-occupation-dropdown', 'value'),
-     Input('credit-utilization-age-slider', 'value')]
-)
+@metrics.instrument('update_credit_utilization_graph')
 def update_credit_utilization_graph(selected_occupation, age_range):
-    print(f'Updating credit utilization graph with: Occupation={selected_occupation}, Age Range={age_range}')
     if selected_occupation is None:
         return px.histogram(title='Нет данных')
     
-    filtered_df = df[(df['Occupation'] == selected_occupation) &
-                     (df['Age'] >= age_range[0]) & (df['Age'] <= age_range[1])]
-    print(f'Filtered DataFrame for credit utilization graph:\n{filtered_df.head()}')
-    
-    if filtered_df.empty:
-        return px.histogram(title='Нет данных')
-    
-    fig = px.histogram(filtered_df, x='Credit_Utilization_Ratio', title='Распределение коэффициента использования кредита', color_discrete_sequence=['#636efa'])
-    fig.update_layout(
-        plot_bgcolor='#2c2c2c',
-        paper_bgcolor='#2c2c2c',
-        font=dict(
-            size=14,
-            color='#ffffff'
-        )
-    )
-    return fig
+    return cached_graph('Credit_Utilization_Ratio', 'Распределение коэффициента использования кредита', '#636efa', selected_occupation, age_range)
 
-@app.callback(
-    Output('investment-graph', 'figure'),
-    [Input('investment-occupation-dropdown', 'value'),
-     Input('investment-age-slider', 'value')]
-)
+@metrics.instrument('update_investment_graph')
 def update_investment_graph(selected_occupation, age_range):
-    print(f'Updating investment graph with: Occupation={selected_occupation}, Age Range={age_range}')
     if selected_occupation is None:
         return px.histogram(title='Нет данных')
     
-    filtered_df = df[(df['Occupation'] == selected_occupation) &
-                     (df['Age'] >= age_range[0]) & (df['Age'] <= age_range[1])]
-    print(f'Filtered DataFrame for investment graph:\n{filtered_df.head()}')
-    
-    if filtered_df.empty:
-        return px.histogram(title='Нет данных')
-    
-    fig = px.histogram(filtered_df, x='Amount_invested_monthly', title='Распределение ежемесячных инвестиций', color_discrete_sequence=['darkorange'])
-    fig.update_layout(
-        plot_bgcolor='#2c2c2c',
-        paper_bgcolor='#2c2c2c',
-        font=dict(
-            size=14,
-            color='#ffffff'
+    return cached_graph('Amount_invested_monthly', 'Распределение ежемесячных инвестиций', 'darkorange', selected_occupation, age_range)
+
+# Графики дашборда: префикс идентификаторов, серверный обработчик, показатель, заголовок и цвет
+GRAPHS = [
+    ('income', update_income_graph, 'Annual_Income', 'Распределение годового дохода', 'darkorange'),
+    ('age', update_age_graph, 'Age', 'Распределение возраста', '#636efa'),
+    ('bank-accounts', update_bank_accounts_graph, 'Num_Bank_Accounts', 'Распределение количества банковских счетов', 'darkorange'),
+    ('credit-cards', update_credit_cards_graph, 'Num_Credit_Card', 'Распределение количества кредитных карт', '#636efa'),
+    ('debt', update_debt_graph, 'Outstanding_Debt', 'Распределение задолженности', 'darkorange'),
+    ('credit-utilization', update_credit_utilization_graph, 'Credit_Utilization_Ratio', 'Распределение коэффициента использования кредита', '#636efa'),
+    ('investment', update_investment_graph, 'Amount_invested_monthly', 'Распределение ежемесячных инвестиций', 'darkorange'),
+]
+
+# В режиме DASHBOARD_CLIENT_SIDE графики строятся в браузере из данных хранилища,
+# и сервер обрабатывает один запрос за сессию вместо запроса на каждое движение ползунка
+if CLIENT_SIDE:
+    register_store(app, source, [metric for _, _, metric, _, _ in GRAPHS], metrics)
+
+for prefix, update_graph, metric, title, color in GRAPHS:
+    inputs = [Input(f'{prefix}-occupation-dropdown', 'value'), Input(f'{prefix}-age-slider', 'value')]
+    if CLIENT_SIDE:
+        app.clientside_callback(
+            clientside_function('figure', {
+                'metric': metric, 'title': title, 'color': color, 'layout': GRAPH_LAYOUT, 'no_data_title': 'Нет данных'
+            }),
+            Output(f'{prefix}-graph', 'figure'),
+            [Input(STORE_ID, 'data')] + inputs
         )
-    )
-    return fig
+    elif BINARY_FIGURES:
+        # Числовые массивы графика передаются в двоичном виде и раскодируются в браузере
+        app.layout.children.append(register_decoder(app, f'{prefix}-graph'))
+        app.callback(Output(figure_store_id(f'{prefix}-graph'), 'data'), inputs)(encoded(update_graph))
+    else:
+        app.callback(Output(f'{prefix}-graph', 'figure'), inputs)(update_graph)
+
+# Счётчики попаданий и промахов кэша графиков
+@app.server.route('/figure-cache-stats')
+def figure_cache_stats():
+    return jsonify(figure_cache.stats())
 
 if __name__ == '__main__':
     app.run_server(debug=True)
@@ -5,11 +5,32 @@ import plotly.express as px
 import plotly.graph_objects as go
 import pandas as pd
 import numpy as np
-from etl import get_data
+from etl import get_source, DEFAULT_BOUNDS
+from histogram_cube import histogram_figure
+from instrumentation import Instrumentation, current
+import startup
+from figure_cache import FigureCache
+from filter_context import ContextCache, Prewarmer
+from flask import jsonify
+from client_side import CLIENT_SIDE, STORE_ID, clientside_function, register_store, store
+from figure_encoding import BINARY_FIGURES, encoded_graph, register_encoded_graphs
 
 # Настройка ширины страницы (в процентах)
 PAGE_WIDTH = 68
 
+# Максимальное число линий на графике параллельных координат
+PARALLEL_MAX_LINES = 2000
+
+# Фоновое построение графиков остальных вкладок после первого запроса для состояния фильтра.
+# Очередь ограничена, а задачи состояний, с которых пользователи уже ушли, пропускаются (filter_context.Prewarmer).
+PREWARM_TABS = True
+PREWARM_WORKERS = 2
+PREWARM_MAX_PENDING = 16
+PREWARM_RECENT_STATES = 4
+
+# Число состояний фильтра, для которых хранятся общие вычисления
+MAX_FILTER_CONTEXTS = 64
+
 # Функция для генерации CSS стилей
 def generate_css(page_width):
     return f'''
@@ -23,44 +44,37 @@ def generate_css(page_width):
         }}
     '''
 
-# Загрузка данных
-df = get_data()
-
-# Проверка наличия данных
-if df.empty:
-    raise ValueError("DataFrame is empty. Please check your data source.")
-
-# Проверка наличия столбца 'Occupation'
-if 'Occupation' not in df.columns:
-    raise KeyError("Столбец 'Occupation' не найден в данных")
-
-# Преобразование 'Credit_History_Age' в числовой формат
-def convert_credit_history_age(value):
-    if isinstance(value, str):
-        parts = value.split()
-        if len(parts) >= 2:
-            return float(parts[0])
-    return pd.to_numeric(value, errors='coerce')
-
-df['Credit_History_Age'] = df['Credit_History_Age'].apply(convert_credit_history_age)
-
-# Фильтрация данных для исключения экстремальных значений и возрастной группы
-df = df[df['Annual_Income'] <= 1e6]
-df = df[(df['Age'] >= 14) & (df['Age'] <= 100)]
-df = df[df['Num_Bank_Accounts'] <= 10]
-df = df[df['Num_Credit_Card'] <= 10]
-df = df[df['Credit_History_Age'] <= 60]  # Предполагаем, что кредитная история не может быть больше 60 лет
-
-# Убедимся, что все используемые столбцы имеют числовой тип данных
+# Числовые столбцы, используемые в графиках
 numeric_columns = [
     'Annual_Income', 'Num_Bank_Accounts', 'Num_Credit_Card', 
     'Interest_Rate', 'Num_Credit_Inquiries', 'Credit_History_Age', 'Outstanding_Debt'
 ]
-df[numeric_columns] = df[numeric_columns].apply(pd.to_numeric, errors='coerce')
+
+# Загрузка данных с исключением экстремальных значений и возрастной группы.
+# Кредитная история хранится в годах (разбирается при загрузке, см. transforms.py).
+# Предполагаем, что кредитная история не может быть больше 60 лет.
+# Для процентной ставки и числа запросов в гистограммах сразу учитываются ограничения вкладок 5 и 6.
+source = get_source(
+    ['Occupation', 'Age'] + numeric_columns,
+    ['Age'] + numeric_columns,
+    bounds={**DEFAULT_BOUNDS, 'Age': (14, 100), 'Credit_History_Age': (None, 60)},
+    limits={'Interest_Rate': 50, 'Num_Credit_Inquiries': 20}
+)
+
+# Значения для элементов управления (при фоновом запуске — из сохранённых метаданных)
+occupations = source.occupations()
+age_min, age_max = source.age_bounds()
 
 # Создание приложения Dash
 app = dash.Dash(__name__)
 
+# Задержки обработчиков по этапам и размер ответов, доступны по адресу /metrics
+metrics = Instrumentation()
+metrics.init_app(app)
+
+# Проверки для балансировщика: /healthz (процесс жив) и /readyz (данные загружены)
+startup.init_app(app, source)
+
 # Добавление CSS стилей
 app.index_string = f'''
 <!DOCTYPE html>
@@ -93,8 +107,8 @@ app.layout = html.Div([
         html.Label("Выберите профессию:"),
         dcc.Dropdown(
             id='occupation-dropdown',
-            options=[{'label': occ, 'value': occ} for occ in df['Occupation'].unique()],
-            value=df['Occupation'].unique()[0] if not df['Occupation'].empty else None
+            options=[{'label': occ, 'value': occ} for occ in occupations],
+            value=occupations[0] if occupations else None
         ),
     ], style={'margin': '10px 0'}),
     
@@ -102,10 +116,10 @@ app.layout = html.Div([
         html.Label("Выберите диапазон возраста:"),
         dcc.RangeSlider(
             id='age-slider',
-            min=df['Age'].min(),
-            max=df['Age'].max(),
-            value=[df['Age'].min(), df['Age'].max()],
-            marks={i: str(i) for i in range(int(df['Age'].min()), int(df['Age'].max())+1, 10)}
+            min=age_min,
+            max=age_max,
+            value=[age_min, age_max],
+            marks={i: str(i) for i in range(int(age_min), int(age_max)+1, 10)}
         ),
     ], style={'margin': '20px 0'}),
     
@@ -121,65 +135,171 @@ app.layout = html.Div([
         dcc.Tab(label='Параллельные координаты', value='tab-9')
     ]),
     
+    # В режиме DASHBOARD_CLIENT_SIDE гистограммы строятся в браузере в tab-graph,
+    # а tabs-content заполняет сервер только для параллельных координат
+    *([dcc.Graph(id='tab-graph'), dcc.Store(id='parallel-request'), store()] if CLIENT_SIDE else []),
+
     html.Div(id='tabs-content'),
     
     html.Div(id='debug-info', style={'margin': '20px 0'})
 ])
 
+# Вкладки с гистограммами: показатель, заголовок и подпись оси
+HISTOGRAM_TABS = {
+    'tab-1': ('Annual_Income', 'Годовой доход', None),
+    'tab-2': ('Age', 'Возраст', None),
+    'tab-3': ('Num_Bank_Accounts', 'Количество банковских счетов', None),
+    'tab-4': ('Num_Credit_Card', 'Количество кредитных карт', None),
+    'tab-5': ('Interest_Rate', 'Процентная ставка', None),
+    'tab-6': ('Num_Credit_Inquiries', 'Количество кредитных запросов', None),
+    'tab-7': ('Credit_History_Age', 'Распределение кредитной истории', 'Длительность кредитной истории (лет)'),
+    'tab-8': ('Outstanding_Debt', 'Задолженность', None),
+}
+
+# Оформление графиков вкладок
+GRAPH_LAYOUT = {
+    'plot_bgcolor': 'rgba(0,0,0,0)',
+    'paper_bgcolor': 'rgba(0,0,0,0)',
+    'font': {'color': 'black'},
+}
+
+# Вкладки, графики которых строит сервер (в режиме DASHBOARD_CLIENT_SIDE — только параллельные координаты)
+SERVER_TABS = ['tab-9'] if CLIENT_SIDE else list(HISTOGRAM_TABS) + ['tab-9']
+
+# Контексты состояний фильтра: число строк и выборки считаются один раз для всех обработчиков
+contexts = ContextCache(MAX_FILTER_CONTEXTS)
+
+# Готовые графики вкладок с ограничением по памяти (в байтах) и потоки для их фонового построения
+FIGURE_CACHE_BYTES = 64 * 1024 * 1024
+figure_cache = FigureCache(FIGURE_CACHE_BYTES)
+prewarmer = Prewarmer(PREWARM_WORKERS, PREWARM_MAX_PENDING, PREWARM_RECENT_STATES)
+
+# Контекст для текущей версии данных: один и тот же набор данных на всё время обработки,
+# даже если в фоне он обновится
+def filter_context(selected_occupation, age_range):
+    return contexts.get(source.current(), selected_occupation, age_range)
+
+def filtered_count(context):
+    return context.once('count', lambda: context.data.count(context.occupation, context.age_range))
+
+# Гистограммы всех вкладок для состояния фильтра: фильтр вычисляется один раз
+def filtered_histograms(context):
+    metrics_list = [metric for metric, _, _ in HISTOGRAM_TABS.values()]
+    return context.once('histograms', lambda: context.data.histograms(metrics_list, context.occupation, context.age_range))
+
+def build_tab_figure(context, tab):
+    timer = current()
+    if tab in HISTOGRAM_TABS:
+        metric, title, label = HISTOGRAM_TABS[tab]
+        with timer.phase('filter'):
+            edges, counts = filtered_histograms(context)[metric]
+        with timer.phase('build'):
+            fig = histogram_figure(edges, counts, metric, title=title, label=label)
+    elif tab == 'tab-9':
+        # Для больших выборок в браузер отправляется стратифицированная по возрасту подвыборка
+        with timer.phase('filter'):
+            sample_df, total = context.data.sample(context.occupation, context.age_range, numeric_columns, PARALLEL_MAX_LINES)
+        title = 'Параллельные координаты'
+        if len(sample_df) < total:
+            title += f' (показано {len(sample_df)} из {total} записей)'
+        else:
+            title += f' (записей: {total})'
+        with timer.phase('build'):
+            fig = px.parallel_coordinates(sample_df, dimensions=numeric_columns, title=title)
+    else:
+        return None
+
+    with timer.phase('build'):
+        fig.update_layout(**GRAPH_LAYOUT)
+    return fig
+
+# График вкладки из кэша; одновременные запросы одной вкладки (обработчик и фоновый поток) строят его один раз
+def tab_figure(context, tab):
+    key = context.key + (tab,)
+    fig = figure_cache.get(key)
+    if fig is not None:
+        return fig
+
+    def build():
+        fig = build_tab_figure(context, tab)
+        if fig is not None:
+            figure_cache.put(key, fig)
+        return fig
+    return context.once(('figure', tab), build, keep=False)
+
+# Фоновое построение графиков остальных вкладок, чтобы переключение вкладок не ждало сервера.
+# Параллельные координаты (самый дорогой график) строятся последними.
+def prewarm_tabs(context, active_tab):
+    if PREWARM_TABS and context.start_prewarm():
+        prewarmer.submit([
+            lambda tab=tab: tab_figure(context, tab) for tab in SERVER_TABS if tab != active_tab
+        ])
+
 # Функция обратного вызова для обновления содержимого вкладок
-@app.callback(
-    Output('tabs-content', 'children'),
-    [Input('tabs-example', 'value'),
-     Input('occupation-dropdown', 'value'),
-     Input('age-slider', 'value')]
-)
+@metrics.instrument('render_content')
 def render_content(tab, selected_occupation, age_range):
-    filtered_df = df[(df['Occupation'] == selected_occupation) & 
-                     (df['Age'] >= age_range[0]) & 
-                     (df['Age'] <= age_range[1])]
-    
-    if filtered_df.empty:
+    context = filter_context(selected_occupation, age_range)
+    timer = current()
+
+    with timer.phase('filter'):
+        timer.rows = filtered_count(context)
+    if timer.rows == 0:
         return html.Div("Нет данных для выбранных параметров")
+
+    fig = tab_figure(context, tab)
+    prewarm_tabs(context, tab)
+    if fig is None:
+        return None
     
-    if tab == 'tab-1':
-        fig = px.histogram(filtered_df, x='Annual_Income', title='Годовой доход')
-    elif tab == 'tab-2':
-        fig = px.histogram(filtered_df, x='Age', title='Возраст')
-    elif tab == 'tab-3':
-        fig = px.histogram(filtered_df, x='Num_Bank_Accounts', title='Количество банковских счетов')
-    elif tab == 'tab-4':
-        fig = px.histogram(filtered_df, x='Num_Credit_Card', title='Количество кредитных карт')
-    elif tab == 'tab-5':
-        fig = px.histogram(filtered_df[filtered_df['Interest_Rate'] <= 50], x='Interest_Rate', title='Процентная ставка')
-    elif tab == 'tab-6':
-        fig = px.histogram(filtered_df[filtered_df['Num_Credit_Inquiries'] <= 20], x='Num_Credit_Inquiries', title='Количество кредитных запросов')
-    elif tab == 'tab-7':
-        fig = px.histogram(filtered_df, x='Credit_History_Age', title='Распределение кредитной истории',
-                           labels={'Credit_History_Age': 'Длительность кредитной истории (лет)'})
-    elif tab == 'tab-8':
-        fig = px.histogram(filtered_df, x='Outstanding_Debt', title='Задолженность')
-    elif tab == 'tab-9':
-        fig = px.parallel_coordinates(filtered_df, dimensions=numeric_columns, title='Параллельные координаты')
-    
-    fig.update_layout(
-        plot_bgcolor='rgba(0,0,0,0)',
-        paper_bgcolor='rgba(0,0,0,0)',
-        font=dict(color='black')
-    )
-    
+    # В режиме DASHBOARD_BINARY_FIGURES числовые массивы графика передаются в двоичном виде
+    if BINARY_FIGURES:
+        return encoded_graph(fig, 'tabs-content')
     return dcc.Graph(figure=fig)
 
-# Добавление отладочной информации
-@app.callback(
-    Output('debug-info', 'children'),
-    [Input('occupation-dropdown', 'value'),
-     Input('age-slider', 'value')]
-)
+# Добавление отладочной информации (число строк общее с render_content)
+@metrics.instrument('update_debug_info')
 def update_debug_info(selected_occupation, age_range):
-    filtered_df = df[(df['Occupation'] == selected_occupation) & 
-                     (df['Age'] >= age_range[0]) & 
-                     (df['Age'] <= age_range[1])]
-    return f"Количество записей после фильтрации: {len(filtered_df)}"
+    return f"Количество записей после фильтрации: {filtered_count(filter_context(selected_occupation, age_range))}"
+
+# Счётчики попаданий и промахов кэша графиков вкладок и очередь фонового построения
+@app.server.route('/figure-cache-stats')
+def figure_cache_stats():
+    return jsonify({**figure_cache.stats(), 'prewarm': prewarmer.stats()})
+
+# Параллельные координаты в режиме DASHBOARD_CLIENT_SIDE: запрос приходит от клиентского обработчика вкладок,
+# метрики записываются под именем render_content
+def parallel_content(request):
+    if not request:
+        return None
+    return render_content(request['tab'], request['occupation'], request['age_range'])
+
+if BINARY_FIGURES:
+    register_encoded_graphs(app)
+
+filter_inputs = [Input('occupation-dropdown', 'value'), Input('age-slider', 'value')]
+if CLIENT_SIDE:
+    # Гистограммы вкладок и число записей (сумма счётчиков возраста) считаются в браузере
+    register_store(app, source, sorted({metric for metric, _, _ in HISTOGRAM_TABS.values()}), metrics)
+    app.clientside_callback(
+        clientside_function('tabs', {
+            'tabs': {
+                tab: {'metric': metric, 'title': title, 'label': label}
+                for tab, (metric, title, label) in HISTOGRAM_TABS.items()
+            },
+            'layout': GRAPH_LAYOUT,
+            'server_tab': 'tab-9',
+            'count_metric': 'Age',
+            'no_data_title': 'Нет данных для выбранных параметров',
+            'debug_prefix': 'Количество записей после фильтрации: ',
+        }),
+        [Output('tab-graph', 'figure'), Output('tab-graph', 'style'), Output('tabs-content', 'style'),
+         Output('parallel-request', 'data'), Output('debug-info', 'children')],
+        [Input(STORE_ID, 'data'), Input('tabs-example', 'value')] + filter_inputs
+    )
+    app.callback(Output('tabs-content', 'children'), [Input('parallel-request', 'data')])(parallel_content)
+else:
+    app.callback(Output('tabs-content', 'children'), [Input('tabs-example', 'value')] + filter_inputs)(render_content)
+    app.callback(Output('debug-info', 'children'), filter_inputs)(update_debug_info)
 
 # Запуск приложения
 if __name__ == '__main__':
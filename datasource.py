@@ -0,0 +1,461 @@
+import copy
+import os
+import sqlite3
+import threading
+
+import numpy as np
+import pandas as pd
+
+from filter_index import OccupationAgeIndex
+from histogram_cube import HistogramCube, DEFAULT_BINS, range_edges
+from quantile_sketch import DEFAULT_PERCENTILES, rank_error
+from sampling import stratified_sample
+
+# Доля новых строк относительно основной части, после которой данные объединяются и индекс строится заново
+DELTA_COMPACT_RATIO = 0.1
+
+# Источник данных для дашбордов на pandas: весь набор в памяти процесса,
+# фильтрация через индекс по профессии и возрасту, гистограммы из куба.
+# Новые строки (with_delta) хранятся в отдельном небольшом индексе, пока их не станет много.
+class PandasSource:
+    # index и cube — уже построенные индекс и куб (например, отображённые из файла в режиме mmap)
+    def __init__(self, df, metrics, limits=None, bins=DEFAULT_BINS, presorted=False, index=None, cube=None):
+        self.metrics = list(metrics)
+        self.limits = limits
+        self.bins = bins
+        self.index = index or OccupationAgeIndex(df, presorted=presorted)
+        self.df = self.index.df
+        self.cube = cube or HistogramCube(self.df, metrics, bins=bins, limits=limits)
+        self.delta_index = None
+
+    # Массивы индекса и куба для записи в файл (mmap_store.write_arrays); восстанавливаются через from_arrays
+    def arrays(self):
+        index_arrays, index_meta = self.index.arrays()
+        cube_arrays, cube_meta = self.cube.arrays()
+        arrays = {**{f'index/{name}': array for name, array in index_arrays.items()}, **cube_arrays}
+        return arrays, {'index': index_meta, 'cube': cube_meta}
+
+    @classmethod
+    def from_arrays(cls, df, metrics, arrays, metadata, limits=None, bins=DEFAULT_BINS):
+        index_arrays = {name[len('index/'):]: array for name, array in arrays.items() if name.startswith('index/')}
+        cube_arrays = {name: array for name, array in arrays.items() if not name.startswith('index/')}
+        index = OccupationAgeIndex.from_arrays(df, index_arrays, metadata['index'])
+        cube = HistogramCube.from_arrays(cube_arrays, metadata['cube'])
+        return cls(df, metrics, limits=limits, bins=bins, index=index, cube=cube)
+
+    def indexes(self):
+        return [self.index] if self.delta_index is None else [self.index, self.delta_index]
+
+    def row_count(self):
+        return sum(len(index.df) for index in self.indexes())
+
+    def occupations(self):
+        if self.delta_index is None:
+            return self.index.occupations()
+        return sorted(set(self.index.occupations()) | set(self.delta_index.occupations()))
+
+    def age_bounds(self):
+        frames = [index.df['Age'] for index in self.indexes() if len(index.df)]
+        return min(ages.min() for ages in frames), max(ages.max() for ages in frames)
+
+    def count(self, occupation, age_range):
+        return sum(index.count(occupation, age_range) for index in self.indexes())
+
+    def histograms(self, metrics, occupation, age_range):
+        return self.cube.histograms(metrics, occupation, age_range)
+
+    def age_bin_counts(self, metric):
+        return self.cube.age_bin_counts(metric)
+
+    # Строки для графика (не больше max_rows, стратифицированно по возрасту) и их общее число
+    def sample(self, occupation, age_range, columns, max_rows):
+        parts = [index.filter(occupation, age_range) for index in self.indexes()]
+        filtered_df = parts[0] if len(parts) == 1 else pd.concat(parts, ignore_index=True)
+        return stratified_sample(filtered_df[columns], max_rows, by=filtered_df['Age']), len(filtered_df)
+
+    # Новый источник с добавленными строками. Текущий объект не меняется, поэтому обработчики,
+    # которые уже работают с ним, видят согласованные данные. Если новые значения выходят за интервалы
+    # куба, данные объединяются сразу: куб строится заново с новыми интервалами.
+    def with_delta(self, delta_df):
+        frames = [delta_df] if self.delta_index is None else [self.delta_index.df, delta_df]
+        all_delta = pd.concat(frames, ignore_index=True)
+        outside = self.cube.outside_edges(delta_df)
+        if outside:
+            print(f"{outside} new values fall outside the histogram bins, rebuilding the cube")
+        if outside or len(all_delta) > DELTA_COMPACT_RATIO * len(self.df):
+            df = pd.concat([self.df, all_delta], ignore_index=True)
+            # Категориальные столбцы с разными наборами значений pandas объединяет в object
+            for col in self.df.columns:
+                if isinstance(self.df[col].dtype, pd.CategoricalDtype):
+                    df[col] = df[col].astype('category')
+            return PandasSource(df, self.metrics, limits=self.limits, bins=self.bins)
+
+        source = copy.copy(self)
+        source.delta_index = OccupationAgeIndex(all_delta)
+        source.cube = self.cube.with_delta(delta_df)
+        return source
+
+# Число из строки: годы с учётом месяцев, как в transforms.parse_credit_history_age
+# ("22 Years and 6 Months" -> 22.5), либо сама строка, если это число
+TEXT_NUMBER_SQL = (
+    "coalesce("
+    "TRY_CAST(regexp_extract({col}, '(\\d+)\\s+Years?', 1) AS DOUBLE) "
+    "+ coalesce(TRY_CAST(regexp_extract({col}, '(\\d+)\\s+Months?', 1) AS DOUBLE), 0) / 12, "
+    "TRY_CAST(trim({col}) AS DOUBLE))"
+)
+
+def quote(name):
+    return '"' + name.replace('"', '""') + '"'
+
+# Общая часть источников, которые считают фильтры и гистограммы SQL-запросами к локальному файлу.
+# Подклассы задают query() и диалектные выражения INTEGER_CHECK_SQL и BIN_SQL.
+class SQLSource:
+    def metric_filter(self, metric):
+        condition = f"{quote(metric)} IS NOT NULL AND \"Occupation\" IS NOT NULL AND \"Age\" BETWEEN 0 AND {self.age_max}"
+        if metric in self.limits:
+            condition += f" AND {quote(metric)} <= {float(self.limits[metric])}"
+        return condition
+
+    # Те же правила построения интервалов, что и в histogram_cube.metric_edges
+    def metric_edges(self, metric, bins):
+        col = quote(metric)
+        low, high, is_integer = self.query(
+            f"SELECT min({col}), max({col}), {self.INTEGER_CHECK_SQL.format(col=col)} "
+            f"FROM customers WHERE {self.metric_filter(metric)}"
+        )[0]
+        if low is None:
+            return np.array([0.0, 1.0])
+        return range_edges(float(low), float(high), is_integer, bins)
+
+    def row_count(self):
+        return self.query("SELECT count(*) FROM customers")[0][0]
+
+    def occupations(self):
+        rows = self.query('SELECT DISTINCT "Occupation" FROM customers WHERE "Occupation" IS NOT NULL ORDER BY 1')
+        return [row[0] for row in rows]
+
+    def age_bounds(self):
+        return tuple(self.query('SELECT min("Age"), max("Age") FROM customers')[0])
+
+    def count(self, occupation, age_range):
+        return self.query(
+            'SELECT count(*) FROM customers WHERE "Occupation" = ? AND "Age" BETWEEN ? AND ?',
+            [occupation, age_range[0], age_range[1]]
+        )[0][0]
+
+    def histograms(self, metrics, occupation, age_range):
+        result = {}
+        for metric in metrics:
+            edges = self.edges[metric]
+            n_bins = len(edges) - 1
+            width = float(edges[1] - edges[0])
+            rows = self.query(
+                f"SELECT {self.BIN_SQL.format(col=quote(metric))} AS bin, count(*) "
+                f"FROM customers WHERE {self.metric_filter(metric)} "
+                f"AND \"Occupation\" = ? AND \"Age\" BETWEEN ? AND ? GROUP BY bin",
+                [float(edges[0]), width, n_bins - 1, occupation, age_range[0], age_range[1]]
+            )
+            counts = np.zeros(n_bins, dtype='int64')
+            for bin_idx, count in rows:
+                counts[bin_idx] = count
+            result[metric] = edges, counts
+        return result
+
+    # Счётчики по профессии, возрасту и интервалу одним запросом (как HistogramCube.age_bin_counts)
+    def age_bin_counts(self, metric):
+        edges = self.edges[metric]
+        n_bins = len(edges) - 1
+        rows = self.query(
+            f"SELECT \"Occupation\", \"Age\", {self.BIN_SQL.format(col=quote(metric))} AS bin, count(*) "
+            f"FROM customers WHERE {self.metric_filter(metric)} GROUP BY 1, 2, 3",
+            [float(edges[0]), float(edges[1] - edges[0]), n_bins - 1]
+        )
+        return edges, age_bin_table(rows, self.age_max, n_bins)
+
+# Строки (профессия, возраст, интервал, число) -> профессия -> массив (возраст 0..age_max) × интервал
+def age_bin_table(rows, age_max, n_bins):
+    result = {}
+    for occupation, age, bin_idx, count in rows:
+        if occupation not in result:
+            result[occupation] = np.zeros((age_max + 1, n_bins), dtype='int64')
+        result[occupation][int(age), int(bin_idx)] = count
+    return result
+
+def bounds_condition(bounds):
+    conditions = []
+    for col, (low, high) in (bounds or {}).items():
+        if low is not None:
+            conditions.append(f"{quote(col)} >= {float(low)}")
+        if high is not None:
+            conditions.append(f"{quote(col)} <= {float(high)}")
+    return f" WHERE {' AND '.join(conditions)}" if conditions else ""
+
+# Источник данных на встроенной DuckDB: данные читаются из локального файла (Parquet или SQLite my.db),
+# фильтры и разбиение на интервалы выполняются векторизованным SQL без загрузки таблицы в pandas.
+class DuckDBSource(SQLSource):
+    INTEGER_CHECK_SQL = "bool_and({col} = floor({col}))"
+    BIN_SQL = "least(greatest(CAST(floor(({col} - ?) / ?) AS BIGINT), 0), ?)"
+
+    def __init__(self, path, columns, metrics, bounds=None, limits=None, bins=DEFAULT_BINS, age_max=100,
+                 table='customers'):
+        import duckdb
+
+        self.conn = duckdb.connect(database=':memory:')
+        if path.endswith('.parquet'):
+            relation = f"read_parquet('{path}')"
+        elif os.path.splitext(path)[1] in ('.db', '.sqlite', '.sqlite3'):
+            self.conn.execute("INSTALL sqlite")
+            self.conn.execute("LOAD sqlite")
+            relation = f"sqlite_scan('{path}', '{table}')"
+        else:
+            raise ValueError(f"Неизвестный формат файла данных: {path}")
+
+        # Числовые показатели, которые хранятся строкой, разбираются прямо в представлении
+        described = {row[0]: row[1] for row in self.conn.execute(f"DESCRIBE SELECT * FROM {relation}").fetchall()}
+        select_list = []
+        for col in columns:
+            if col in metrics and described.get(col) == 'VARCHAR':
+                select_list.append(f"{TEXT_NUMBER_SQL.format(col=quote(col))} AS {quote(col)}")
+            else:
+                select_list.append(quote(col))
+
+        self.conn.execute(
+            f"CREATE VIEW raw_customers AS SELECT {', '.join(select_list)} FROM {relation}"
+        )
+        self.conn.execute(f"CREATE VIEW customers AS SELECT * FROM raw_customers{bounds_condition(bounds)}")
+
+        self.limits = limits or {}
+        self.age_max = age_max
+        self.edges = {metric: self.metric_edges(metric, bins) for metric in metrics}
+
+    def query(self, sql, params=None):
+        # Отдельный курсор на вызов: обработчики Dash выполняются в разных потоках
+        return self.conn.cursor().execute(sql, params or []).fetchall()
+
+    # Стратифицированная по возрасту выборка: в каждой возрастной группе берётся одна и та же доля строк
+    def sample(self, occupation, age_range, columns, max_rows):
+        params = [occupation, age_range[0], age_range[1]]
+        total = self.count(occupation, age_range)
+        fraction = min(1.0, max_rows / total) if total else 1.0
+        select_list = ', '.join(quote(col) for col in columns)
+        df = self.conn.cursor().execute(
+            f"SELECT {select_list} FROM customers "
+            f"WHERE \"Occupation\" = ? AND \"Age\" BETWEEN ? AND ? "
+            f"QUALIFY row_number() OVER (PARTITION BY \"Age\" ORDER BY hash({select_list})) "
+            f"<= round(count(*) OVER (PARTITION BY \"Age\") * ?) "
+            f"LIMIT ?",
+            params + [fraction, max_rows]
+        ).fetchdf()
+        return df, total
+
+# Источник данных на SQLite-файле my.db (см. PSQL_to_LSQL.py) — без PostgreSQL и без загрузки таблицы в память.
+# Запросы с фильтром по профессии и возрасту идут по покрывающему индексу (Occupation, Age, показатели...)
+# из ddl.build_sqlite_index_statements, в котором есть и столбцы границ представления.
+class SQLiteSource(SQLSource):
+    INTEGER_CHECK_SQL = "min({col} = CAST({col} AS INTEGER))"
+    # Значения не меньше левой границы, поэтому CAST (отбрасывание дробной части) совпадает с floor
+    BIN_SQL = "min(max(CAST(({col} - ?) / ? AS INTEGER), 0), ?)"
+
+    def __init__(self, path, columns, metrics, bounds=None, limits=None, bins=DEFAULT_BINS, age_max=100,
+                 table='customers'):
+        if not os.path.exists(path):
+            raise FileNotFoundError(path)
+        self.path = path
+        self.local = threading.local()
+        self.view_sql = (
+            f"CREATE TEMP VIEW customers AS SELECT rowid AS row_id, {', '.join(quote(col) for col in columns)} "
+            f"FROM main.{quote(table)}{bounds_condition(bounds)}"
+        )
+
+        self.limits = limits or {}
+        self.age_max = age_max
+        self.edges = {metric: self.metric_edges(metric, bins) for metric in metrics}
+
+    # Соединение sqlite3 нельзя делить между потоками, поэтому у каждого потока Dash своё, только для чтения
+    def connection(self):
+        conn = getattr(self.local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(f"file:{self.path}?mode=ro", uri=True, check_same_thread=False)
+            conn.execute(self.view_sql)
+            self.local.conn = conn
+        return conn
+
+    def query(self, sql, params=None):
+        return self.connection().execute(sql, params or []).fetchall()
+
+    # Стратифицированная по возрасту выборка, как у DuckDBSource
+    def sample(self, occupation, age_range, columns, max_rows):
+        total = self.count(occupation, age_range)
+        fraction = min(1.0, max_rows / total) if total else 1.0
+        select_list = ', '.join(quote(col) for col in columns)
+        cursor = self.connection().execute(
+            f"SELECT {select_list} FROM ("
+            f"SELECT *, row_number() OVER (PARTITION BY \"Age\" ORDER BY (row_id * 2654435761) % 4294967296) AS rn, "
+            f"count(*) OVER (PARTITION BY \"Age\") AS age_count "
+            f"FROM (SELECT * FROM customers WHERE \"Occupation\" = ? AND \"Age\" BETWEEN ? AND ?)"
+            f") WHERE rn <= round(age_count * ?) LIMIT ?",
+            [occupation, age_range[0], age_range[1], fraction, max_rows]
+        )
+        df = pd.DataFrame(cursor.fetchall(), columns=columns)
+        return df, total
+
+# Источник данных на материализованных представлениях PostgreSQL (ddl.build_post_load_script): число строк
+# и гистограммы читаются из заранее посчитанных счётчиков, исходная таблица не сканируется.
+# Представления построены с границами ddl.DEFAULT_BOUNDS и без ограничений показателей.
+# query(sql, params) выполняет запрос и возвращает список строк.
+class AggregateSource:
+    def __init__(self, query, metrics):
+        self.query = query
+        rows = query(
+            "SELECT metric, low, high, is_integer FROM customer_metric_edges WHERE metric = ANY(%s)",
+            [list(metrics)]
+        )
+        found = {metric: range_edges(float(low), float(high), is_integer) for metric, low, high, is_integer in rows}
+        self.edges = {metric: found.get(metric, np.array([0.0, 1.0])) for metric in metrics}
+
+    def row_count(self):
+        return int(self.query("SELECT coalesce(sum(row_count), 0) FROM customer_age_counts")[0][0])
+
+    def occupations(self):
+        rows = self.query('SELECT DISTINCT "Occupation" FROM customer_age_counts ORDER BY 1')
+        return [row[0] for row in rows]
+
+    def age_bounds(self):
+        return tuple(self.query('SELECT min("Age"), max("Age") FROM customer_age_counts')[0])
+
+    def count(self, occupation, age_range):
+        return int(self.query(
+            'SELECT coalesce(sum(row_count), 0) FROM customer_age_counts '
+            'WHERE "Occupation" = %s AND "Age" BETWEEN %s AND %s',
+            [occupation, age_range[0], age_range[1]]
+        )[0][0])
+
+    # Все показатели одним запросом по индексу (metric, Occupation, Age, bin)
+    def histograms(self, metrics, occupation, age_range):
+        rows = self.query(
+            'SELECT metric, bin, sum(row_count) FROM customer_metric_bins '
+            'WHERE metric = ANY(%s) AND "Occupation" = %s AND "Age" BETWEEN %s AND %s GROUP BY metric, bin',
+            [list(metrics), occupation, age_range[0], age_range[1]]
+        )
+        counts = {metric: np.zeros(len(self.edges[metric]) - 1, dtype='int64') for metric in metrics}
+        for metric, bin_idx, count in rows:
+            counts[metric][bin_idx] = count
+        return {metric: (self.edges[metric], counts[metric]) for metric in metrics}
+
+    # Возраст в представлениях ограничен 100 (см. ddl.aggregate_filter_sql)
+    def age_bin_counts(self, metric):
+        edges = self.edges[metric]
+        rows = self.query(
+            'SELECT "Occupation", "Age", bin, row_count FROM customer_metric_bins WHERE metric = %s', [metric]
+        )
+        return edges, age_bin_table(rows, 100, len(edges) - 1)
+
+# Округление оценок числа строк по интервалам через накопленные суммы: итог по строке сохраняется
+def round_counts(counts):
+    return np.diff(np.rint(np.cumsum(counts, axis=-1)), axis=-1, prepend=0).astype('int64')
+
+# Источник данных по эскизам квантилей (quantile_sketch.SketchCube): гистограммы и процентили без сырых строк,
+# память не зависит от размера таблицы. Число строк точное; доля значений в интервале гистограммы и ранг
+# процентиля — с ошибкой не больше error_bounds() (доверие 99%). Если диапазон возраста покрывает возрастную
+# группу не целиком, вклад группы берётся пропорционально числу её строк в диапазоне, а распределение внутри
+# группы считается одинаковым для всех её возрастов; эта ошибка тоже входит в error_bounds().
+class SketchSource:
+    def __init__(self, cube, metrics, bins=DEFAULT_BINS):
+        self.cube = cube
+        self.metrics = list(metrics)
+        self.edges = {metric: cube.edges(metric, bins) for metric in self.metrics}
+
+    def row_count(self):
+        return int(sum(counts.sum() for counts in self.cube.counts.values()))
+
+    def occupations(self):
+        return sorted(self.cube.counts)
+
+    def age_bounds(self):
+        ages = np.flatnonzero(np.sum(list(self.cube.counts.values()), axis=0))
+        return int(ages[0]), int(ages[-1])
+
+    def age_slice(self, age_range):
+        low = max(int(np.ceil(age_range[0])), 0)
+        high = min(int(np.floor(age_range[1])), self.cube.age_max)
+        return slice(low, max(high + 1, low))
+
+    def count(self, occupation, age_range):
+        counts = self.cube.counts.get(occupation)
+        return 0 if counts is None else int(counts[self.age_slice(age_range)].sum())
+
+    # Возрастные группы, пересекающие диапазон, и доля строк каждой группы внутри диапазона
+    def band_shares(self, occupation, age_range):
+        counts = self.cube.counts.get(occupation)
+        if counts is None:
+            return []
+        in_range = np.zeros_like(counts)
+        in_range[self.age_slice(age_range)] = counts[self.age_slice(age_range)]
+        shares = []
+        for band in self.cube.bands(age_range):
+            ages = slice(band * self.cube.band_years, (band + 1) * self.cube.band_years)
+            band_rows = counts[ages].sum()
+            if band_rows:
+                shares.append((band, in_range[ages].sum() / band_rows))
+        return shares
+
+    def histograms(self, metrics, occupation, age_range):
+        shares = self.band_shares(occupation, age_range)
+        result = {}
+        for metric in metrics:
+            edges = self.edges[metric]
+            counts = np.zeros(len(edges) - 1)
+            for band, share in shares:
+                sketch = self.cube.sketches[metric].get((occupation, band))
+                if sketch is not None and sketch.n:
+                    counts += sketch.n * share * sketch.pmf(edges)
+            result[metric] = edges, round_counts(counts)
+        return result
+
+    def age_bin_counts(self, metric):
+        edges = self.edges[metric]
+        result = {}
+        for occupation, counts in self.cube.counts.items():
+            table = np.zeros((self.cube.age_max + 1, len(edges) - 1))
+            for band in self.cube.bands((0, self.cube.age_max)):
+                sketch = self.cube.sketches[metric].get((occupation, band))
+                ages = slice(band * self.cube.band_years, (band + 1) * self.cube.band_years)
+                band_rows = counts[ages].sum()
+                if sketch is not None and sketch.n and band_rows:
+                    table[ages] = np.outer(counts[ages] * sketch.n / band_rows, sketch.pmf(edges))
+            result[occupation] = round_counts(table)
+        return edges, result
+
+    # Процентили показателя: квантиль -> значение (ошибка ранга — error_bounds()['quantile_rank_error']).
+    # Группы возраста взвешены так же, как в histograms(), поэтому процентили согласованы с гистограммами.
+    def percentiles(self, metric, occupation, age_range, qs=DEFAULT_PERCENTILES):
+        values = self.cube.quantiles(metric, occupation, self.band_shares(occupation, age_range), qs)
+        return dict(zip(qs, values.tolist()))
+
+    # Границы ошибки с доверием 99% для ранга квантиля и доли (и числа строк) в интервале гистограммы:
+    # ошибка эскизов KLL и доля строк из групп возраста, которые диапазон покрывает не целиком
+    # (их распределение внутри группы неизвестно, поэтому эта доля — худший случай)
+    def error_bounds(self, occupation, age_range):
+        count = self.count(occupation, age_range)
+        counts = self.cube.counts.get(occupation)
+        partial_rows = 0
+        for band, share in self.band_shares(occupation, age_range):
+            if share < 1:
+                ages = slice(band * self.cube.band_years, (band + 1) * self.cube.band_years)
+                partial_rows += share * counts[ages].sum()
+        band_error = partial_rows / count if count else 0.0
+        bin_share_error = rank_error(self.cube.k, pmf=True) + band_error
+        return {
+            'quantile_rank_error': rank_error(self.cube.k) + band_error,
+            'bin_share_error': bin_share_error,
+            'bin_count_error': bin_share_error * count,
+            'band_error': band_error,
+        }
+
+    # Процентили всех показателей и границы ошибки для одного состояния фильтра
+    def summary(self, metrics, occupation, age_range, qs=DEFAULT_PERCENTILES):
+        return {
+            'count': self.count(occupation, age_range),
+            'percentiles': {metric: self.percentiles(metric, occupation, age_range, qs) for metric in metrics},
+            'error_bounds': self.error_bounds(occupation, age_range),
+        }
@@ -0,0 +1,186 @@
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+import psycopg2
+import psycopg2.extensions
+from psycopg2 import sql
+
+# Параметры подключения к PostgreSQL (можно переопределить переменными окружения)
+POSTGRES_CONN_PARAMS = {
+    'dbname': os.environ.get('PGDATABASE', 'zypl_project'),
+    'user': os.environ.get('PGUSER', 'postgres'),
+    'password': os.environ.get('PGPASSWORD', 'yourpassword'),
+    'host': os.environ.get('PGHOST', '127.0.0.1'),
+    'port': os.environ.get('PGPORT', '5432'),
+}
+
+# Строка подключения для SQLAlchemy (DataFrame.to_sql)
+SQLALCHEMY_URL = 'postgresql://{user}:{password}@{host}:{port}/{dbname}'.format(**POSTGRES_CONN_PARAMS)
+
+# Порядок строк по ID: сначала длина, затем сама строка, чтобы '0x10' шёл после '0x9'.
+# Общий для водяного знака обновлений (etl) и продолжения переноса в SQLite (PSQL_to_LSQL.py).
+ID_ORDER_SQL = sql.SQL("(length({id}), {id})").format(id=sql.Identifier('ID'))
+
+# Размер пула на процесс и ожидание свободного соединения (в секундах)
+POOL_MAX_SIZE = int(os.environ.get('PG_POOL_MAX_SIZE', '5'))
+POOL_TIMEOUT = float(os.environ.get('PG_POOL_TIMEOUT', '10'))
+
+# Соединение, простоявшее дольше этого времени, перед выдачей проверяется запросом SELECT 1
+POOL_PING_AFTER = 30.0
+
+class PoolTimeout(Exception):
+    pass
+
+# Ограниченный пул соединений PostgreSQL для одного процесса.
+# connect — функция создания соединения; вместо psycopg2.connect можно передать заглушку для проверок.
+class ConnectionPool:
+    def __init__(self, max_size=POOL_MAX_SIZE, timeout=POOL_TIMEOUT, connect=psycopg2.connect, **conn_params):
+        self.max_size = max_size
+        self.timeout = timeout
+        self.connect = connect
+        self.conn_params = conn_params or POSTGRES_CONN_PARAMS
+        self.idle = []
+        self.in_use = 0
+        self.condition = threading.Condition()
+
+        self.created = 0
+        self.checkouts = 0
+        self.failures = 0
+        self.discarded = 0
+        self.wait_time_total = 0.0
+        self.wait_time_max = 0.0
+
+    # Проверка соединения перед выдачей: закрытые и сломанные соединения отбрасываются
+    def is_healthy(self, conn, idle_since):
+        if conn.closed:
+            return False
+        if conn.get_transaction_status() != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+            return False
+        if time.monotonic() - idle_since > POOL_PING_AFTER:
+            try:
+                with conn.cursor() as cur:
+                    cur.execute('SELECT 1')
+                conn.rollback()
+            except Exception:
+                return False
+        return True
+
+    def getconn(self):
+        start = time.monotonic()
+        deadline = start + self.timeout
+        with self.condition:
+            while not self.idle and self.in_use >= self.max_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self.failures += 1
+                    raise PoolTimeout(f"No free PostgreSQL connection after {self.timeout} s")
+                self.condition.wait(remaining)
+            self.in_use += 1
+            candidate = self.idle.pop() if self.idle else None
+
+        try:
+            while candidate is not None and not self.is_healthy(*candidate):
+                self.close_quietly(candidate[0])
+                with self.condition:
+                    self.discarded += 1
+                    candidate = self.idle.pop() if self.idle else None
+            if candidate is not None:
+                conn = candidate[0]
+            else:
+                conn = self.connect(**self.conn_params)
+                with self.condition:
+                    self.created += 1
+        except Exception:
+            with self.condition:
+                self.in_use -= 1
+                self.failures += 1
+                self.condition.notify()
+            raise
+
+        waited = time.monotonic() - start
+        with self.condition:
+            self.checkouts += 1
+            self.wait_time_total += waited
+            self.wait_time_max = max(self.wait_time_max, waited)
+        return conn
+
+    def putconn(self, conn, broken=False):
+        if not broken and not conn.closed:
+            try:
+                # Незавершённая транзакция не должна перейти к следующему пользователю соединения
+                conn.rollback()
+            except Exception:
+                broken = True
+        with self.condition:
+            self.in_use -= 1
+            if broken or conn.closed:
+                self.discarded += 1
+            else:
+                self.idle.append((conn, time.monotonic()))
+            self.condition.notify()
+        if broken:
+            self.close_quietly(conn)
+
+    @staticmethod
+    def close_quietly(conn):
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    def closeall(self):
+        with self.condition:
+            idle, self.idle = self.idle, []
+        for conn, _ in idle:
+            self.close_quietly(conn)
+
+    def stats(self):
+        with self.condition:
+            return {
+                'max_size': self.max_size,
+                'in_use': self.in_use,
+                'idle': len(self.idle),
+                'created': self.created,
+                'checkouts': self.checkouts,
+                'checkout_failures': self.failures,
+                'discarded': self.discarded,
+                'wait_time_total': self.wait_time_total,
+                'wait_time_max': self.wait_time_max,
+                'wait_time_avg': self.wait_time_total / self.checkouts if self.checkouts else 0.0,
+            }
+
+_pool = None
+_pool_pid = None
+_pool_lock = threading.Lock()
+
+# Пул текущего процесса. После fork (gunicorn) дочерний процесс создаёт свой пул,
+# а не использует сокеты родителя.
+def get_pool():
+    global _pool, _pool_pid
+    with _pool_lock:
+        if _pool is None or _pool_pid != os.getpid():
+            _pool = ConnectionPool()
+            _pool_pid = os.getpid()
+        return _pool
+
+# Соединение из пула на время блока with; при ошибке транзакция откатывается
+@contextmanager
+def connection():
+    pool = get_pool()
+    conn = pool.getconn()
+    try:
+        yield conn
+    except psycopg2.InterfaceError:
+        pool.putconn(conn, broken=True)
+        raise
+    except Exception:
+        pool.putconn(conn)
+        raise
+    else:
+        pool.putconn(conn)
+
+# Отдельное соединение вне пула — для долгих операций загрузки и выгрузки
+def connect():
+    return psycopg2.connect(**POSTGRES_CONN_PARAMS)
@@ -1,56 +1,207 @@
-import psycopg2
+from db import connection
 
-def execute_ddl():
-    try:
-        conn = psycopg2.connect(
-            dbname='zypl_project', 
-            user='postgres', 
-            password='yourpassword', 
-            host='127.0.0.1', 
-            port='5432'
-        )
-        cur = conn.cursor()
-        
-        ddl_script = """
-        DROP TABLE IF EXISTS full_customers;
+# Число интервалов для непрерывных показателей; целочисленные показатели с разбросом не больше
+# MAX_UNIT_BINS получают интервалы шириной 1. Общие для histogram_cube и материализованных представлений.
+DEFAULT_BINS = 50
+MAX_UNIT_BINS = 200
+
+# Описание столбцов таблицы full_customers (имя, тип PostgreSQL)
+FULL_CUSTOMERS_COLUMNS = [
+    ('ID', 'VARCHAR(255)'),
+    ('Customer_ID', 'VARCHAR(255)'),
+    ('Month', 'VARCHAR(50)'),
+    ('Name', 'VARCHAR(255)'),
+    ('Age', 'INT'),
+    ('SSN', 'VARCHAR(255)'),
+    ('Occupation', 'VARCHAR(255)'),
+    ('Annual_Income', 'FLOAT'),
+    ('Monthly_Inhand_Salary', 'FLOAT'),
+    ('Num_Bank_Accounts', 'INT'),
+    ('Num_Credit_Card', 'INT'),
+    ('Interest_Rate', 'INT'),
+    ('Num_of_Loan', 'INT'),
+    ('Type_of_Loan', 'TEXT'),
+    ('Delay_from_due_date', 'INT'),
+    ('Num_of_Delayed_Payment', 'INT'),
+    ('Changed_Credit_Limit', 'FLOAT'),
+    ('Num_Credit_Inquiries', 'INT'),
+    ('Credit_Mix', 'VARCHAR(50)'),
+    ('Outstanding_Debt', 'FLOAT'),
+    ('Credit_Utilization_Ratio', 'FLOAT'),
+    # Длительность кредитной истории в годах (разбирается из строки при загрузке)
+    ('Credit_History_Age', 'FLOAT'),
+    ('Payment_of_Min_Amount', 'VARCHAR(255)'),
+    ('Total_EMI_per_month', 'FLOAT'),
+    ('Amount_invested_monthly', 'FLOAT'),
+    ('Payment_Behaviour', 'VARCHAR(255)'),
+    ('Monthly_Balance', 'FLOAT'),
+]
+
+# Типы SQLite для столбцов из FULL_CUSTOMERS_COLUMNS (остальные — TEXT)
+SQLITE_COLUMN_TYPES = {'INT': 'INTEGER', 'FLOAT': 'REAL'}
+
+# Показатели, которые строят дашборды. В SQLite по ним создаётся один покрывающий индекс
+# (Occupation, Age, показатели...): в нём есть и столбцы DEFAULT_BOUNDS, которые фильтрует представление
+# SQLiteSource, поэтому фильтр по профессии и возрасту, границы и чтение значений идут только по индексу.
+SQLITE_INDEXED_METRICS = [
+    'Annual_Income', 'Num_Bank_Accounts', 'Num_Credit_Card', 'Interest_Rate', 'Num_Credit_Inquiries',
+    'Credit_History_Age', 'Outstanding_Debt', 'Credit_Utilization_Ratio', 'Amount_invested_monthly',
+]
+
+def sqlite_column_types():
+    return [(name, SQLITE_COLUMN_TYPES.get(sql_type, 'TEXT')) for name, sql_type in FULL_CUSTOMERS_COLUMNS]
+
+# Индексы SQLite-копии таблицы; создаются после загрузки данных, так вставка идёт быстрее.
+# Отдельные команды, чтобы их можно было выполнить внутри транзакции (executescript сначала фиксирует её).
+def build_sqlite_index_statements(table='customers', columns=None):
+    metrics = [metric for metric in SQLITE_INDEXED_METRICS if columns is None or metric in columns]
+    # Индексы прежней схемы (по одному на показатель) не покрывали границы и больше не нужны
+    statements = [f'DROP INDEX IF EXISTS "idx_{table}_occupation_age"']
+    statements += [
+        f'DROP INDEX IF EXISTS "idx_{table}_occupation_age_{metric.lower()}"' for metric in SQLITE_INDEXED_METRICS
+    ]
+    columns_str = ", ".join(f'"{name}"' for name in ['Occupation', 'Age'] + metrics)
+    statements.append(f'CREATE INDEX IF NOT EXISTS "idx_{table}_occupation_age_metrics" ON "{table}" ({columns_str})')
+    # Статистика для планировщика запросов SQLite
+    statements.append(f'ANALYZE "{table}"')
+    return statements
+
+def build_sqlite_index_script(table='customers', columns=None):
+    return ";\n".join(build_sqlite_index_statements(table, columns)) + ";"
+
+# Значения Month, для каждого из которых создаётся своя секция таблицы; прочие попадают в секцию по умолчанию
+MONTH_PARTITIONS = [
+    'January', 'February', 'March', 'April', 'May', 'June',
+    'July', 'August', 'September', 'October', 'November', 'December',
+]
+
+# Границы для исключения экстремальных значений: столбец -> (минимум, максимум), включительно.
+# По ним же отбираются строки для материализованных представлений.
+DEFAULT_BOUNDS = {
+    'Annual_Income': (None, 1e6),
+    'Age': (1, 100),
+    'Num_Bank_Accounts': (None, 10),
+    'Num_Credit_Card': (None, 10),
+}
+
+# Показатели, для которых материализованные представления хранят счётчики по интервалам
+AGGREGATE_METRICS = [
+    'Age', 'Annual_Income', 'Num_Bank_Accounts', 'Num_Credit_Card',
+    'Outstanding_Debt', 'Credit_Utilization_Ratio', 'Amount_invested_monthly',
+]
+
+# Материализованные представления в порядке обновления (интервалы зависят от границ)
+AGGREGATE_VIEWS = ['customer_age_counts', 'customer_metric_edges', 'customer_metric_bins']
+
+# Строки, которые видят дашборды: профессия указана, возраст от 0 до 100, значения в DEFAULT_BOUNDS
+def aggregate_filter_sql():
+    conditions = ['"Occupation" IS NOT NULL', '"Age" BETWEEN 0 AND 100']
+    for col, (low, high) in DEFAULT_BOUNDS.items():
+        if low is not None:
+            conditions.append(f'"{col}" >= {float(low)}')
+        if high is not None:
+            conditions.append(f'"{col}" <= {float(high)}')
+    return " AND ".join(conditions)
+
+def build_ddl_script():
+    # Имена в кавычках, чтобы сохранить регистр (как при df.to_sql)
+    columns_str = ",\n".join(f'            "{name}" {sql_type}' for name, sql_type in FULL_CUSTOMERS_COLUMNS)
+    partitions_str = "\n".join(
+        f"        CREATE TABLE full_customers_{month.lower()} PARTITION OF full_customers FOR VALUES IN ('{month}');"
+        for month in MONTH_PARTITIONS
+    )
+    return f"""
+        DROP TABLE IF EXISTS full_customers CASCADE;
 
         CREATE TABLE full_customers (
-            ID VARCHAR(255),
-            Customer_ID VARCHAR(255),
-            Month VARCHAR(50),
-            Name VARCHAR(255),
-            Age INT,
-            SSN VARCHAR(255),
-            Occupation VARCHAR(255),
-            Annual_Income FLOAT,
-            Monthly_Inhand_Salary FLOAT,
-            Num_Bank_Accounts INT,
-            Num_Credit_Card INT,
-            Interest_Rate INT,
-            Num_of_Loan INT,
-            Type_of_Loan TEXT,
-            Delay_from_due_date INT,
-            Num_of_Delayed_Payment INT,
-            Changed_Credit_Limit FLOAT,
-            Num_Credit_Inquiries INT,
-            Credit_Mix VARCHAR(50),
-            Outstanding_Debt FLOAT,
-            Credit_Utilization_Ratio FLOAT,
-            Credit_History_Age VARCHAR(255),
-            Payment_of_Min_Amount VARCHAR(255),
-            Total_EMI_per_month FLOAT,
-            Amount_invested_monthly FLOAT,
-            Payment_Behaviour VARCHAR(255),
-            Monthly_Balance FLOAT
-        );
+{columns_str}
+        ) PARTITION BY LIST ("Month");
+
+{partitions_str}
+        CREATE TABLE full_customers_other PARTITION OF full_customers DEFAULT;
+        """
+
+# Индексы и материализованные представления; выполняются после загрузки строк, чтобы COPY не обновлял индексы.
+# Представления создаются пустыми и заполняются refresh_aggregates().
+def build_post_load_script():
+    where = aggregate_filter_sql()
+    # Все показатели за один проход по таблице: строка разворачивается в пары (показатель, значение)
+    values_str = ",\n".join(f"""                ('{metric}', "{metric}"::double precision)""" for metric in AGGREGATE_METRICS)
+    values_sql = f"""            SELECT m.metric, c."Occupation", c."Age", m.value
+            FROM full_customers c
+            CROSS JOIN LATERAL (VALUES
+{values_str}
+            ) AS m (metric, value)
+            WHERE {where} AND m.value IS NOT NULL"""
+    return f"""
+        CREATE INDEX full_customers_customer_id_idx ON full_customers ("Customer_ID");
+        CREATE INDEX full_customers_occupation_age_idx ON full_customers ("Occupation", "Age");
+        -- Порядок водяного знака фонового обновления (db.ID_ORDER_SQL)
+        CREATE INDEX full_customers_id_order_idx ON full_customers ((length("ID")), "ID");
+
+        -- Число строк по профессии и возрасту
+        CREATE MATERIALIZED VIEW customer_age_counts AS
+            SELECT "Occupation", "Age", count(*) AS row_count
+            FROM full_customers WHERE {where}
+            GROUP BY "Occupation", "Age"
+        WITH NO DATA;
+        CREATE UNIQUE INDEX customer_age_counts_key ON customer_age_counts ("Occupation", "Age");
+
+        -- Диапазон значений каждого показателя, по нему строятся интервалы
+        CREATE MATERIALIZED VIEW customer_metric_edges AS
+            SELECT metric, min(value) AS low, max(value) AS high, bool_and(value = floor(value)) AS is_integer
+            FROM (
+{values_sql}
+            ) v
+            GROUP BY metric
+        WITH NO DATA;
+        CREATE UNIQUE INDEX customer_metric_edges_key ON customer_metric_edges (metric);
+
+        -- Число строк по показателю, профессии, возрасту и интервалу (правила как в histogram_cube.metric_edges)
+        CREATE MATERIALIZED VIEW customer_metric_bins AS
+            SELECT v.metric, v."Occupation", v."Age",
+                   CASE
+                       WHEN e.is_integer AND e.high - e.low <= {MAX_UNIT_BINS} THEN (v.value - e.low)::int
+                       WHEN e.high = e.low THEN 0
+                       ELSE least(floor((v.value - e.low) / ((e.high - e.low) / {DEFAULT_BINS})), {DEFAULT_BINS - 1})::int
+                   END AS bin,
+                   count(*) AS row_count
+            FROM (
+{values_sql}
+            ) v
+            JOIN customer_metric_edges e USING (metric)
+            GROUP BY 1, 2, 3, 4
+        WITH NO DATA;
+        CREATE UNIQUE INDEX customer_metric_bins_key ON customer_metric_bins (metric, "Occupation", "Age", bin);
         """
-        
-        cur.execute(ddl_script)
-        conn.commit()
-        cur.close()
-        conn.close()
+
+def execute_ddl():
+    try:
+        with connection() as conn:
+            cur = conn.cursor()
+
+            ddl_script = build_ddl_script() + build_post_load_script()
+
+            cur.execute(ddl_script)
+            conn.commit()
+            cur.close()
         print("DDL script executed successfully.")
     except Exception as e:
         print(f"Error: {e}")
 
-execute_ddl()
+# Пересчёт материализованных представлений после загрузки данных. Заполненные представления обновляются
+# CONCURRENTLY, чтобы дашборды могли читать их во время пересчёта.
+def refresh_aggregates():
+    with connection() as conn:
+        with conn.cursor() as cur:
+            for view in AGGREGATE_VIEWS:
+                cur.execute("SELECT ispopulated FROM pg_matviews WHERE matviewname = %s", [view])
+                row = cur.fetchone()
+                if row is None:
+                    raise ValueError(f"Materialized view {view} does not exist, run ddl.py first")
+                cur.execute(f"REFRESH MATERIALIZED VIEW {'CONCURRENTLY ' if row[0] else ''}{view}")
+                conn.commit()
+    print("Materialized views refreshed.")
+
+if __name__ == '__main__':
+    execute_ddl()
@@ -1,28 +1,412 @@
-import psycopg2
+import hashlib
+import json
+import os
+import time
+
+from psycopg2 import sql
 import pandas as pd
 
-def get_data():
+from db import connection, ID_ORDER_SQL
+from ddl import FULL_CUSTOMERS_COLUMNS, DEFAULT_BOUNDS, AGGREGATE_METRICS
+from datasource import PandasSource, DuckDBSource, SQLiteSource, AggregateSource, SketchSource
+from mmap_store import (write_dataset, read_fingerprint, map_dataset, write_arrays, map_arrays, file_lock,
+                        checked_at, mark_checked)
+from quantile_sketch import AGE_BAND_YEARS, SketchCube
+from refresher import SourceHolder, Refresher
+from startup import BACKGROUND_STARTUP, BackgroundSource, read_metadata, write_metadata
+from transforms import parse_credit_history_age, compact_dtypes
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data')
+
+# Каталог для локальных снимков данных в формате Parquet
+SNAPSHOT_DIR = os.path.join(DATA_DIR, 'snapshots')
+
+# Движок данных для дашбордов: 'pandas' (таблица в памяти процесса), 'mmap' (общий для всех процессов
+# файл Arrow, отображённый в память), 'duckdb' (запросы к локальному файлу), 'sqlite' (индексированный my.db),
+# 'postgres' (материализованные представления со счётчиками в PostgreSQL)
+# или 'sketch' (эскизы квантилей по профессии и возрастной группе, см. quantile_sketch.py)
+BACKEND = os.environ.get('DASHBOARD_BACKEND', 'pandas')
+
+# Локальный файл для DuckDB: Parquet (создаётся export_parquet) или SQLite-файл вроде my.db
+DUCKDB_DATA_PATH = os.environ.get('DUCKDB_DATA_PATH', os.path.join(DATA_DIR, 'full_customers.parquet'))
+
+# SQLite-файл для движка 'sqlite', созданный PSQL_to_LSQL.py
+SQLITE_DATA_PATH = os.environ.get('SQLITE_DATA_PATH', os.path.join(os.path.dirname(DATA_DIR), 'my.db'))
+
+# Период фонового обновления данных дашбордов в секундах (0 — без обновления, только для pandas и mmap)
+REFRESH_INTERVAL = float(os.environ.get('DASHBOARD_REFRESH_INTERVAL', '0'))
+
+# Каталог с файлами Arrow для режима 'mmap'
+MMAP_DIR = os.path.join(DATA_DIR, 'mmap')
+
+# Файлы режима 'mmap' сверяются с таблицей не чаще раза в столько секунд: процессы gunicorn, запущенные
+# вместе, используют проверку первого из них и только отображают файлы в память
+MMAP_CHECK_SECONDS = float(os.environ.get('DASHBOARD_MMAP_CHECK_SECONDS', '300'))
+
+# Каталог метаданных для фонового запуска дашбордов (профессии и границы возраста)
+METADATA_DIR = os.path.join(DATA_DIR, 'metadata')
+
+# Каталог эскизов квантилей для движка 'sketch' и число строк в одной части при их построении
+SKETCH_DIR = os.path.join(DATA_DIR, 'sketches')
+STREAM_CHUNK_ROWS = 50_000
+
+# Столбцы, которые в PostgreSQL хранятся числами (по описанию таблицы в ddl.py)
+NUMERIC_COLUMNS = {name for name, sql_type in FULL_CUSTOMERS_COLUMNS if sql_type in ('INT', 'FLOAT')}
+
+# Столбцы, границы по которым проверяются в запросе к PostgreSQL. Кредитная история в таблицах, загруженных
+# до появления числового столбца, хранится строкой, поэтому её границы применяются после разбора (clean_fetched)
+SQL_BOUND_COLUMNS = NUMERIC_COLUMNS - {'Credit_History_Age'}
+
+# Последний ID таблицы. Сортировка по тем же выражениям, что и в индексе full_customers_id_order_idx
+# (а не по строке (length, ID)), поэтому запрос читает одну запись индекса, а не всю таблицу.
+LAST_ID_SQL = sql.SQL("SELECT {id} FROM full_customers ORDER BY length({id}) DESC, {id} DESC LIMIT 1").format(
+    id=sql.Identifier('ID')
+)
+
+# Сборка SQL-запроса с параметрами вместо подстановки значений в текст.
+# id_range — (после, до включительно) по порядку ID; None в любой позиции означает отсутствие границы.
+# partition — (номер части, число частей) по хэшу ID, для обработки таблицы в нескольких процессах.
+def build_query(columns=None, occupation=None, age_range=None, bounds=None, id_range=None, partition=None):
+    if columns:
+        select_list = sql.SQL(", ").join(sql.Identifier(col) for col in columns)
+    else:
+        select_list = sql.SQL("*")
+
+    conditions = []
+    params = []
+    if occupation is not None:
+        conditions.append(sql.SQL("{} = %s").format(sql.Identifier('Occupation')))
+        params.append(occupation)
+    if age_range is not None:
+        conditions.append(sql.SQL("{} BETWEEN %s AND %s").format(sql.Identifier('Age')))
+        params.extend([age_range[0], age_range[1]])
+    for col, (low, high) in (bounds or {}).items():
+        if low is not None:
+            conditions.append(sql.SQL("{} >= %s").format(sql.Identifier(col)))
+            params.append(low)
+        if high is not None:
+            conditions.append(sql.SQL("{} <= %s").format(sql.Identifier(col)))
+            params.append(high)
+    if id_range is not None:
+        after, upto = id_range
+        if after is not None:
+            conditions.append(sql.SQL("{} > (length(%s), %s)").format(ID_ORDER_SQL))
+            params.extend([after, after])
+        if upto is not None:
+            conditions.append(sql.SQL("{} <= (length(%s), %s)").format(ID_ORDER_SQL))
+            params.extend([upto, upto])
+    if partition is not None:
+        part, partitions = partition
+        conditions.append(sql.SQL("mod(hashtext({})::bigint + 2147483648, %s) = %s").format(sql.Identifier('ID')))
+        params.extend([partitions, part])
+
+    query = sql.SQL("SELECT {} FROM full_customers").format(select_list)
+    if conditions:
+        query = sql.SQL("{} WHERE {}").format(query, sql.SQL(" AND ").join(conditions))
+    return query, params
+
+# Отпечаток таблицы для снимков: число строк, последний ID и максимальный Month.
+# Требует прохода по таблице, поэтому для периодической проверки новых строк используется get_watermark.
+def get_fingerprint(conn):
+    with conn.cursor() as cur:
+        cur.execute(sql.SQL(
+            'SELECT count(*), ({}), max("Month") FROM full_customers'
+        ).format(LAST_ID_SQL))
+        row_count, max_id, max_month = cur.fetchone()
+    return {'row_count': row_count, 'max_id': max_id, 'max_month': max_month}
+
+# Водяной знак для фонового обновления — последний ID; читается только по индексу, стоимость не зависит от размера таблицы
+def get_watermark(conn):
+    with conn.cursor() as cur:
+        cur.execute(LAST_ID_SQL)
+        row = cur.fetchone()
+    return row[0] if row else None
+
+# Имя снимка задаётся запросом без границы id_range: граница по водяному знаку меняется с ростом таблицы,
+# и снимок того же запроса перезаписывается, а не копится рядом с прежними
+def snapshot_paths(key, compact):
+    key = hashlib.sha1(json.dumps([key, compact], default=str).encode('utf-8')).hexdigest()[:16]
+    base = os.path.join(SNAPSHOT_DIR, key)
+    return base + '.parquet', base + '.json'
+
+# Снимок подходит, если таблица не изменилась и он построен тем же запросом (вместе с id_range)
+def read_snapshot(key, query_str, params, fingerprint, compact=True):
+    data_path, meta_path = snapshot_paths(key, compact)
+    if not (os.path.exists(data_path) and os.path.exists(meta_path)):
+        return None
+    with open(meta_path, encoding='utf-8') as f:
+        meta = json.load(f)
+    if meta.get('fingerprint') != fingerprint:
+        return None
+    if [meta.get('query'), meta.get('params')] != json.loads(json.dumps([query_str, params], default=str)):
+        return None
+    return pd.read_parquet(data_path)
+
+def write_snapshot(df, key, query_str, params, fingerprint, compact=True):
+    data_path, meta_path = snapshot_paths(key, compact)
+    os.makedirs(SNAPSHOT_DIR, exist_ok=True)
+    # Запись во временные файлы и атомарная замена, чтобы параллельные процессы не прочитали половину файла
+    tmp_suffix = f'.tmp{os.getpid()}'
+    df.to_parquet(data_path + tmp_suffix, index=False)
+    with open(meta_path + tmp_suffix, 'w', encoding='utf-8') as f:
+        json.dump({'query': query_str, 'params': params, 'fingerprint': fingerprint}, f, default=str)
+    os.replace(data_path + tmp_suffix, data_path)
+    os.replace(meta_path + tmp_suffix, meta_path)
+
+# Обработка строк, полученных из базы: разбор кредитной истории и компактные типы
+def clean_fetched(df, compact=True):
+    # Таблицы, загруженные до появления числового столбца, хранят кредитную историю строкой
+    if 'Credit_History_Age' in df.columns:
+        df['Credit_History_Age'] = parse_credit_history_age(df['Credit_History_Age'])
+    if compact:
+        # Компактные типы: каждый процесс gunicorn держит свою копию данных
+        memory_before = df.memory_usage(deep=True).sum()
+        df = compact_dtypes(df, FULL_CUSTOMERS_COLUMNS)
+        memory_after = df.memory_usage(deep=True).sum()
+        print(f"Memory usage: {memory_before / 2**20:.1f} MB -> {memory_after / 2**20:.1f} MB")
+    return df
+
+# raise_errors=True — ошибка передаётся вызывающему коду, а не превращается в пустой DataFrame
+# (для загрузки новых строк, где пустой результат — нормальный ответ и ошибку от него не отличить)
+def get_data(columns=None, occupation=None, age_range=None, bounds=None, use_snapshot=True, compact=True,
+             id_range=None, raise_errors=False):
     try:
-        # Подключение к базе данных PostgreSQL
-        conn = psycopg2.connect(
-            dbname='zypl_project', 
-            user='postgres', 
-            password='yourpassword', 
-            host='127.0.0.1', 
-            port='5432'
-        )
-        
-        # Выполнение SQL-запроса для извлечения данных
-        query = "SELECT * FROM full_customers"
-        df = pd.read_sql_query(query, conn)
-        
-        # Закрытие подключения
-        conn.close()
-        
+        # Соединение с PostgreSQL берётся из пула процесса (см. db.py)
+        with connection() as conn:
+            # Выполнение SQL-запроса для извлечения данных: фильтрация и выбор столбцов на стороне PostgreSQL
+            query, params = build_query(columns, occupation, age_range, bounds, id_range)
+            query_str = query.as_string(conn)
+
+            df = None
+            if use_snapshot:
+                # Снимок используется, только если таблица не изменилась с момента его создания
+                fingerprint = get_fingerprint(conn)
+                key_query, key_params = build_query(columns, occupation, age_range, bounds)
+                snapshot_key = [key_query.as_string(conn), key_params]
+                df = read_snapshot(snapshot_key, query_str, params, fingerprint, compact)
+                if df is not None:
+                    print("Loaded data from local snapshot.")
+
+            if df is None:
+                df = clean_fetched(pd.read_sql_query(query_str, conn, params=params), compact)
+                if use_snapshot:
+                    write_snapshot(df, snapshot_key, query_str, params, fingerprint, compact)
+
         # Вывод всех столбцов в консоль
         print("Columns in the DataFrame:", df.columns.tolist())
-        
+
         return df
     except Exception as e:
         print(f"Error: {e}")
-        return pd.DataFrame() 
\ No newline at end of file
+        if raise_errors:
+            raise
+        return pd.DataFrame()
+
+# Выгрузка всей таблицы full_customers в Parquet для DuckDB
+def export_parquet(path=DUCKDB_DATA_PATH):
+    df = get_data(use_snapshot=False)
+    if df.empty:
+        raise ValueError("DataFrame is empty. Please check your data source.")
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f'{path}.tmp{os.getpid()}'
+    df.to_parquet(tmp_path, index=False)
+    os.replace(tmp_path, path)
+    print(f"Exported {len(df)} rows to {path}")
+
+# Загрузка и очистка данных для дашборда. prepare — очистка DataFrame на стороне pandas;
+# границы по столбцам, которые в PostgreSQL хранятся строкой, применяются уже после неё.
+# allow_empty=True — для загрузки новых строк при обновлении, где пустой результат нормален,
+# а ошибка запроса не превращается в пустой результат.
+def load_frame(columns, bounds=None, prepare=None, id_range=None, use_snapshot=True, allow_empty=False):
+    bounds = bounds or {}
+    sql_bounds = {col: bound for col, bound in bounds.items() if col in SQL_BOUND_COLUMNS}
+    df = get_data(columns=columns, bounds=sql_bounds, id_range=id_range, use_snapshot=use_snapshot,
+                  raise_errors=allow_empty)
+    if df.empty:
+        if allow_empty:
+            return df
+        raise ValueError("DataFrame is empty. Please check your data source.")
+    if prepare is not None:
+        df = prepare(df)
+    return apply_bounds(df, {col: bound for col, bound in bounds.items() if col not in sql_bounds})
+
+def apply_bounds(df, bounds):
+    for col, (low, high) in bounds.items():
+        if low is not None:
+            df = df[df[col] >= low]
+        if high is not None:
+            df = df[df[col] <= high]
+    return df
+
+# Чтение таблицы частями по chunk_rows строк через серверный курсор: в памяти только одна часть.
+# Части проходят ту же очистку, что и get_data (без компактных типов), и фильтр bounds.
+def stream_frames(columns, bounds=None, chunk_rows=STREAM_CHUNK_ROWS, id_range=None, partition=None):
+    bounds = bounds or {}
+    sql_bounds = {col: bound for col, bound in bounds.items() if col in SQL_BOUND_COLUMNS}
+    other_bounds = {col: bound for col, bound in bounds.items() if col not in sql_bounds}
+    with connection() as conn:
+        query, params = build_query(columns, bounds=sql_bounds, id_range=id_range, partition=partition)
+        with conn.cursor(name='stream_frames') as cur:
+            cur.itersize = chunk_rows
+            cur.execute(query, params)
+            while True:
+                rows = cur.fetchmany(chunk_rows)
+                if not rows:
+                    break
+                df = clean_fetched(pd.DataFrame(rows, columns=columns), compact=False)
+                yield apply_bounds(df, other_bounds)
+
+# Отпечаток full_customers или None, если PostgreSQL недоступна
+def current_fingerprint():
+    try:
+        with connection() as conn:
+            return get_fingerprint(conn)
+    except Exception as e:
+        print(f"Error: {e}")
+        return None
+
+# Водяной знак таблицы или None, если PostgreSQL недоступна
+def current_watermark():
+    try:
+        with connection() as conn:
+            return get_watermark(conn)
+    except Exception as e:
+        print(f"Error: {e}")
+        return None
+
+# Файлы Arrow с очищенными данными, индексом и кубом гистограмм, общие для всех процессов.
+# Под блокировкой файла таблица сверяется по отпечатку не чаще раза в MMAP_CHECK_SECONDS, и файлы пересоздаются,
+# только если она изменилась; остальные процессы лишь отображают файлы в память (индекс и куб не строятся).
+# Без доступа к PostgreSQL используются уже существующие файлы. Возвращает источник и отпечаток данных.
+def get_mmap_source(columns, metrics, bounds=None, prepare=None, limits=None):
+    key = hashlib.sha1(json.dumps([columns, bounds], default=str).encode('utf-8')).hexdigest()[:16]
+    path = os.path.join(MMAP_DIR, key + '.arrow')
+    arrays_key = hashlib.sha1(json.dumps([key, metrics, limits], default=str).encode('utf-8')).hexdigest()[:16]
+    arrays_path = os.path.join(MMAP_DIR, arrays_key + '.index.arrow')
+
+    with file_lock(path):
+        if not os.path.exists(path) or time.time() - checked_at(path) > MMAP_CHECK_SECONDS:
+            fingerprint = current_fingerprint()
+            if not os.path.exists(path) or (fingerprint is not None and read_fingerprint(path) != fingerprint):
+                id_range = (None, fingerprint['max_id']) if fingerprint else None
+                write_dataset(load_frame(columns, bounds, prepare, id_range=id_range), path, fingerprint)
+            mark_checked(path)
+        fingerprint = read_fingerprint(path)
+        df = map_dataset(path)
+        if os.path.exists(arrays_path):
+            arrays, metadata = map_arrays(arrays_path)
+            if metadata['fingerprint'] == fingerprint:
+                source = PandasSource.from_arrays(df, metrics, arrays, metadata['source'], limits=limits)
+                return source, fingerprint
+        source = PandasSource(df, metrics, limits=limits, presorted=True)
+        arrays, metadata = source.arrays()
+        write_arrays(arrays, arrays_path, {'fingerprint': fingerprint, 'source': metadata})
+    return source, fingerprint
+
+def sketch_path(bounds):
+    key = hashlib.sha1(json.dumps([AGGREGATE_METRICS, bounds], default=str).encode('utf-8')).hexdigest()[:16]
+    return os.path.join(SKETCH_DIR, key + '.json')
+
+# Эскизы квантилей показателей AGGREGATE_METRICS за один проход по full_customers (или по одной части таблицы)
+def build_sketch_cube(bounds=None, id_range=None, partition=None):
+    cube = SketchCube(AGGREGATE_METRICS)
+    for chunk in stream_frames(['Occupation'] + AGGREGATE_METRICS, bounds, id_range=id_range, partition=partition):
+        cube.update(chunk)
+    return cube
+
+# Эскизы из файла; пересчитываются, если таблица изменилась или файл построен с другой шириной возрастной группы
+# (без PostgreSQL используется файл как есть)
+def get_sketch_cube(bounds=None):
+    path = sketch_path(bounds)
+    fingerprint = current_fingerprint()
+    if os.path.exists(path):
+        cube, meta = SketchCube.load(path)
+        if fingerprint is None or (meta.get('fingerprint') == fingerprint and cube.band_years == AGE_BAND_YEARS):
+            return cube
+    if fingerprint is None:
+        raise ValueError("PostgreSQL is unavailable and no saved quantile sketches were found.")
+    cube = build_sketch_cube(bounds, id_range=(None, fingerprint['max_id']))
+    cube.save(path, fingerprint=fingerprint)
+    return cube
+
+def query_postgres(query, params=None):
+    with connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute(query, params)
+            return cur.fetchall()
+
+def metadata_path(columns, bounds, limits):
+    key = hashlib.sha1(json.dumps([BACKEND, columns, bounds, limits], default=str).encode('utf-8')).hexdigest()[:16]
+    return os.path.join(METADATA_DIR, key + '.json')
+
+# Источник данных для дашбордов. После загрузки профессии и границы возраста сохраняются в файл метаданных;
+# при BACKGROUND_STARTUP и наличии этого файла данные загружаются в фоновом потоке (startup.BackgroundSource),
+# а без файла — как обычно, до возврата из функции.
+def get_source(columns, metrics, bounds=None, limits=None, prepare=None):
+    path = metadata_path(columns, bounds, limits)
+
+    def load():
+        holder = build_source(columns, metrics, bounds, limits, prepare)
+        try:
+            write_metadata(path, holder.current())
+        except OSError as e:
+            print(f"Error: {e}")
+        return holder
+
+    metadata = read_metadata(path) if BACKGROUND_STARTUP else None
+    if metadata is None:
+        return load()
+    return BackgroundSource(load, metadata)
+
+# Источник данных в зависимости от настройки BACKEND, обёрнутый в SourceHolder.
+# Обработчики берут данные через holder.current(); при REFRESH_INTERVAL > 0 новые строки
+# подгружаются в фоне и подменяют источник целиком.
+def build_source(columns, metrics, bounds=None, limits=None, prepare=None):
+    bounds = bounds or {}
+    backend = BACKEND
+    if backend == 'postgres':
+        # Представления посчитаны с DEFAULT_BOUNDS; при других условиях данные загружаются в pandas
+        if bounds == DEFAULT_BOUNDS and not limits and prepare is None and set(metrics) <= set(AGGREGATE_METRICS):
+            source = AggregateSource(query_postgres, metrics)
+            if source.row_count() == 0:
+                raise ValueError("Materialized views are empty. Run ddl.refresh_aggregates() after loading data.")
+            return SourceHolder(source)
+        print("Materialized views do not match the requested bounds, falling back to the pandas backend")
+        backend = 'pandas'
+
+    if backend == 'sketch':
+        # Эскизы построены для показателей AGGREGATE_METRICS; ограничения limits и prepare к ним не применить
+        if not limits and prepare is None and set(metrics) <= set(AGGREGATE_METRICS):
+            source = SketchSource(get_sketch_cube(bounds), metrics)
+            if source.row_count() == 0:
+                raise ValueError("DataFrame is empty. Please check your data source.")
+            return SourceHolder(source)
+        print("Quantile sketches do not cover the requested metrics or limits, falling back to the pandas backend")
+        backend = 'pandas'
+
+    if backend in ('duckdb', 'sqlite'):
+        if backend == 'duckdb':
+            source = DuckDBSource(DUCKDB_DATA_PATH, columns, metrics, bounds=bounds, limits=limits)
+        else:
+            source = SQLiteSource(SQLITE_DATA_PATH, columns, metrics, bounds=bounds, limits=limits)
+        if source.row_count() == 0:
+            raise ValueError("DataFrame is empty. Please check your data source.")
+        return SourceHolder(source)
+
+    if backend == 'mmap':
+        source, fingerprint = get_mmap_source(columns, metrics, bounds, prepare, limits)
+        watermark = fingerprint['max_id'] if fingerprint else None
+        holder = SourceHolder(source)
+    elif backend == 'pandas':
+        # Водяной знак фиксируется до загрузки, чтобы строки, добавленные во время неё, не потерялись и не задвоились
+        watermark = current_watermark() if REFRESH_INTERVAL > 0 else None
+        id_range = (None, watermark) if watermark is not None else None
+        holder = SourceHolder(PandasSource(load_frame(columns, bounds, prepare, id_range=id_range), metrics, limits=limits))
+    else:
+        raise ValueError(f"Unknown backend: {backend}")
+
+    if REFRESH_INTERVAL > 0 and watermark is not None:
+        def fetch_delta(after, upto):
+            return load_frame(columns, bounds, prepare, id_range=(after, upto), use_snapshot=False, allow_empty=True)
+        Refresher(holder, watermark, current_watermark, fetch_delta, REFRESH_INTERVAL).start()
+    return holder
@@ -0,0 +1,89 @@
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+# Объём памяти под кэш графиков по умолчанию (в байтах)
+DEFAULT_MAX_BYTES = 64 * 1024 * 1024
+
+# Оценка размера оформления (layout с шаблоном), одинаковая для всех графиков
+LAYOUT_BYTES = 8 * 1024
+
+# Оценка размера значения трассы: массивы NumPy — по nbytes, списки — по 8 байт на элемент
+def value_size(value):
+    if isinstance(value, np.ndarray):
+        return value.nbytes
+    if isinstance(value, dict):
+        return sum(len(key) + value_size(item) for key, item in value.items())
+    if isinstance(value, (list, tuple)):
+        return sum(8 if isinstance(item, (int, float)) else value_size(item) for item in value)
+    if isinstance(value, (str, bytes)):
+        return len(value)
+    return 8
+
+# Размер графика без сериализации: по массивам трасс и постоянной оценке оформления
+def figure_size(fig):
+    return LAYOUT_BYTES + sum(value_size(trace.to_plotly_json()) for trace in fig.data)
+
+# LRU-кэш готовых графиков с ограничением по памяти.
+# Размер записи оценивается по массивам трасс (figure_size), без лишней сериализации в JSON.
+class FigureCache:
+    def __init__(self, max_bytes=DEFAULT_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key, fig):
+        size = figure_size(fig)
+        with self.lock:
+            if key in self.entries:
+                self.size -= self.entries.pop(key)[1]
+            if size > self.max_bytes:
+                return
+            self.entries[key] = (fig, size)
+            self.size += size
+            # Вытеснение давно не использованных графиков, пока не уложимся в лимит
+            while self.size > self.max_bytes:
+                _, (_, evicted_size) = self.entries.popitem(last=False)
+                self.size -= evicted_size
+                self.evictions += 1
+
+    # Готовый график из кэша или построение нового через build()
+    def get_or_build(self, key, build):
+        fig = self.get(key)
+        if fig is None:
+            fig = build()
+            self.put(key, fig)
+        return fig
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.size = 0
+
+    def stats(self):
+        with self.lock:
+            total = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / total if total else 0.0,
+                'evictions': self.evictions,
+                'entries': len(self.entries),
+                'bytes': self.size,
+                'max_bytes': self.max_bytes,
+            }
@@ -0,0 +1,127 @@
+import base64
+import functools
+import os
+
+import numpy as np
+import plotly
+from dash import dcc, html
+from dash.dependencies import ClientsideFunction, Input, Output, MATCH
+
+# plotly начиная с версии 6 сам передаёт массивы трасс как base64 типизированных массивов (bdata),
+# и dcc.Graph раскодирует их без дополнительного обработчика
+PLOTLY_ENCODES_ARRAYS = int(plotly.__version__.split('.')[0]) >= 6
+
+# Режим двоичной передачи графиков: числовые массивы трасс отправляются в браузер как base64
+# типизированных массивов и раскодируются там клиентским обработчиком (assets/figure_encoding.js).
+# С plotly 6 и новее режим не включается: размер ответа тот же, а лишний шаг через dcc.Store только добавляет задержку.
+BINARY_FIGURES = os.environ.get('DASHBOARD_BINARY_FIGURES', '0') == '1'
+if BINARY_FIGURES and PLOTLY_ENCODES_ARRAYS:
+    BINARY_FIGURES = False
+    print(f"plotly {plotly.__version__} already sends arrays as binary, DASHBOARD_BINARY_FIGURES is ignored")
+
+# Более короткие массивы остаются списками JSON: выигрыш меньше, чем накладные расходы
+MIN_ENCODED_LENGTH = 16
+
+# float32 достаточно, если ошибка округления не больше этой доли размаха значений массива
+FLOAT32_MAX_ERROR = 1e-6
+
+# Целочисленные типы в порядке возрастания размера (little-endian, как TypedArray в браузере)
+INTEGER_DTYPES = ['<i1', '<u1', '<i2', '<u2', '<i4', '<u4']
+
+# Идентификаторы компонентов графиков, создаваемых обработчиками (encoded_graph)
+ENCODED_FIGURE_TYPE = 'encoded-figure'
+DECODED_GRAPH_TYPE = 'decoded-graph'
+
+# Самый компактный тип для числового массива или None, если массив кодировать не нужно
+def compact_array(values):
+    values = np.asarray(values)
+    if values.ndim != 1 or len(values) < MIN_ENCODED_LENGTH or values.dtype.kind not in 'iuf':
+        return None
+
+    finite = np.isfinite(values) if values.dtype.kind == 'f' else np.ones(len(values), dtype=bool)
+    if finite.all() and (values.dtype.kind != 'f' or np.array_equal(values, np.round(values))):
+        low, high = values.min(), values.max()
+        for dtype in INTEGER_DTYPES:
+            info = np.iinfo(dtype)
+            if info.min <= low and high <= info.max:
+                return values.astype(dtype)
+
+    values = values.astype('<f8')
+    narrow = values.astype('<f4')
+    if finite.any():
+        error = np.abs(narrow[finite].astype('<f8') - values[finite]).max()
+        if np.isfinite(narrow[finite]).all() and error <= FLOAT32_MAX_ERROR * np.ptp(values[finite]):
+            return narrow
+    return values
+
+def typed_array(values):
+    return {'dtype': values.dtype.str[1:], 'bdata': base64.b64encode(values.tobytes()).decode('ascii')}
+
+# Массив, уже закодированный plotly (версии 6 и новее пишут {'dtype', 'bdata'} в to_plotly_json)
+def decode_plotly_array(value):
+    return np.frombuffer(base64.b64decode(value['bdata']), dtype=np.dtype(value['dtype']).newbyteorder('<'))
+
+def encode_value(value):
+    if isinstance(value, dict):
+        if 'bdata' in value and 'dtype' in value and 'shape' not in value:
+            compact = compact_array(decode_plotly_array(value))
+            return value if compact is None else typed_array(compact)
+        return {key: encode_value(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple, np.ndarray)):
+        compact = compact_array(value) if isinstance(value, np.ndarray) or is_numeric_list(value) else None
+        if compact is not None:
+            return typed_array(compact)
+        if isinstance(value, np.ndarray):
+            return value
+        return [encode_value(item) for item in value]
+    return value
+
+def is_numeric_list(values):
+    return len(values) >= MIN_ENCODED_LENGTH and all(
+        isinstance(item, (int, float, np.number)) and not isinstance(item, bool) for item in values
+    )
+
+# Словарь графика с числовыми массивами трасс в виде типизированных массивов (оформление не меняется)
+def encode_figure(fig):
+    fig = fig.to_plotly_json() if hasattr(fig, 'to_plotly_json') else fig
+    return {
+        'data': [encode_value(trace) for trace in fig.get('data', [])],
+        'layout': fig.get('layout', {}),
+    }
+
+# Обёртка обработчика: график (или список графиков) кодируется перед отправкой
+def encoded(fn):
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        output = fn(*args, **kwargs)
+        if isinstance(output, (list, tuple)):
+            return [encode_figure(fig) for fig in output]
+        return encode_figure(output)
+    return wrapper
+
+def figure_store_id(graph_id):
+    return f'{graph_id}-data'
+
+# Хранилище для закодированного графика graph_id и клиентский обработчик, раскодирующий его в граф.
+# Возвращает хранилище, которое нужно добавить в макет.
+def register_decoder(app, graph_id):
+    app.clientside_callback(
+        ClientsideFunction(namespace='figures', function_name='decode'),
+        Output(graph_id, 'figure'),
+        [Input(figure_store_id(graph_id), 'data')]
+    )
+    return dcc.Store(id=figure_store_id(graph_id))
+
+# Граф для содержимого, которое возвращает обработчик: закодированный график в хранилище рядом с графом
+def encoded_graph(fig, name):
+    return html.Div([
+        dcc.Store(id={'type': ENCODED_FIGURE_TYPE, 'index': name}, data=encode_figure(fig)),
+        dcc.Graph(id={'type': DECODED_GRAPH_TYPE, 'index': name}),
+    ])
+
+def register_encoded_graphs(app):
+    app.clientside_callback(
+        ClientsideFunction(namespace='figures', function_name='decode'),
+        Output({'type': DECODED_GRAPH_TYPE, 'index': MATCH}, 'figure'),
+        [Input({'type': ENCODED_FIGURE_TYPE, 'index': MATCH}, 'data')]
+    )
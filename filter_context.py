@@ -0,0 +1,126 @@
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+
+# Число состояний фильтра (профессия и диапазон возраста), для которых хранятся контексты
+DEFAULT_MAX_CONTEXTS = 64
+
+# Наибольшее число фоновых задач в очереди и число последних состояний фильтра, для которых они ещё выполняются
+DEFAULT_MAX_PENDING = 16
+DEFAULT_RECENT_STATES = 4
+
+# Вычисления для одного состояния фильтра на одной версии данных: число строк, выборки и т.п.
+# Каждое значение считается один раз; обработчики, пришедшие во время вычисления, ждут его результата.
+class FilterContext:
+    def __init__(self, data, occupation, age_range):
+        self.data = data
+        self.occupation = occupation
+        self.age_range = age_range
+        self.key = (data.version, occupation, tuple(age_range))
+        self.lock = threading.Lock()
+        self.futures = {}
+        self.prewarmed = False
+
+    # Значение name для этого состояния фильтра. При keep=False результат не хранится в контексте
+    # (например, график, который кладётся в отдельный кэш), объединяются только одновременные вычисления.
+    # Ошибка не запоминается: следующий вызов вычислит значение заново.
+    def once(self, name, compute, keep=True):
+        with self.lock:
+            future = self.futures.get(name)
+            owner = future is None
+            if owner:
+                future = self.futures[name] = Future()
+        if owner:
+            try:
+                future.set_result(compute())
+            except Exception as e:
+                future.set_exception(e)
+                keep = False
+            finally:
+                if not keep:
+                    with self.lock:
+                        self.futures.pop(name, None)
+        return future.result()
+
+    # Отметка о запуске фонового построения; True только для первого вызова
+    def start_prewarm(self):
+        with self.lock:
+            started, self.prewarmed = self.prewarmed, True
+            return not started
+
+# LRU контекстов по состояниям фильтра
+class ContextCache:
+    def __init__(self, max_contexts=DEFAULT_MAX_CONTEXTS):
+        self.max_contexts = max_contexts
+        self.contexts = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, data, occupation, age_range):
+        context = FilterContext(data, occupation, age_range)
+        with self.lock:
+            existing = self.contexts.get(context.key)
+            if existing is not None:
+                self.contexts.move_to_end(context.key)
+                return existing
+            self.contexts[context.key] = context
+            while len(self.contexts) > self.max_contexts:
+                self.contexts.popitem(last=False)
+            return context
+
+    def clear(self):
+        with self.lock:
+            self.contexts.clear()
+
+# Фоновые вычисления для состояний фильтра (например, графики других вкладок) с ограниченной очередью.
+# Задачи состояния, после которого фильтр (у любого пользователя) менялся уже recent_states раз, пропускаются:
+# пользователь, скорее всего, ушёл с него, а построение отнимало бы GIL у обработчиков запросов.
+# Когда в очереди max_pending задач, новые не добавляются.
+class Prewarmer:
+    def __init__(self, workers, max_pending=DEFAULT_MAX_PENDING, recent_states=DEFAULT_RECENT_STATES):
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='tab-prewarm')
+        self.max_pending = max_pending
+        self.recent_states = recent_states
+        self.lock = threading.Lock()
+        self.generation = 0
+        self.pending = 0
+        self.completed = 0
+        self.skipped_full = 0
+        self.skipped_stale = 0
+
+    # tasks — функции без аргументов для одного нового состояния фильтра, в порядке важности
+    def submit(self, tasks):
+        with self.lock:
+            self.generation += 1
+            generation = self.generation
+        for task in tasks:
+            with self.lock:
+                if self.pending >= self.max_pending:
+                    self.skipped_full += 1
+                    continue
+                self.pending += 1
+            self.executor.submit(self.run, generation, task)
+
+    def run(self, generation, task):
+        try:
+            with self.lock:
+                stale = self.generation - generation >= self.recent_states
+                if stale:
+                    self.skipped_stale += 1
+            if not stale:
+                task()
+                with self.lock:
+                    self.completed += 1
+        except Exception as e:
+            print(f"Error: {e}")
+        finally:
+            with self.lock:
+                self.pending -= 1
+
+    def stats(self):
+        with self.lock:
+            return {
+                'pending': self.pending,
+                'completed': self.completed,
+                'skipped_full': self.skipped_full,
+                'skipped_stale': self.skipped_stale,
+            }
@@ -0,0 +1,58 @@
+import numpy as np
+import pandas as pd
+
+# Индекс для фильтра (профессия, диапазон возраста), общий для всех обработчиков дашборда.
+# Строки упорядочены по профессии и возрасту, поэтому каждая профессия — непрерывный
+# отрезок, а диапазон возраста внутри него находится бинарным поиском.
+class OccupationAgeIndex:
+    def __init__(self, df, presorted=False):
+        # presorted=True — строки уже упорядочены (например, файл из mmap_store), копия не нужна
+        if presorted:
+            self.df = df
+        else:
+            self.df = df.sort_values(['Occupation', 'Age'], kind='mergesort').reset_index(drop=True)
+        self.ages = self.df['Age'].to_numpy(dtype='float64')
+
+        # Границы отрезков для каждой профессии: профессия -> (начало, конец)
+        self.groups = {}
+        codes, uniques = pd.factorize(self.df['Occupation'])
+        if len(codes):
+            starts = np.flatnonzero(np.r_[True, codes[1:] != codes[:-1]])
+            stops = np.r_[starts[1:], len(codes)]
+            for start, stop in zip(starts, stops):
+                if codes[start] >= 0:
+                    self.groups[uniques[codes[start]]] = (int(start), int(stop))
+
+    # Массивы индекса и границы отрезков для восстановления (from_arrays) поверх того же df
+    def arrays(self):
+        return {'ages': self.ages}, {'groups': self.groups}
+
+    @classmethod
+    def from_arrays(cls, df, arrays, metadata):
+        index = cls.__new__(cls)
+        index.df = df
+        index.ages = arrays['ages']
+        index.groups = {occ: tuple(bounds) for occ, bounds in metadata['groups'].items()}
+        return index
+
+    def occupations(self):
+        return list(self.groups)
+
+    # Позиции строк [начало, конец) для профессии и диапазона возраста (включительно)
+    def positions(self, occupation, age_range):
+        bounds = self.groups.get(occupation)
+        if bounds is None:
+            return 0, 0
+        start, stop = bounds
+        ages = self.ages[start:stop]
+        lo = start + int(np.searchsorted(ages, age_range[0], side='left'))
+        hi = start + int(np.searchsorted(ages, age_range[1], side='right'))
+        return lo, max(lo, hi)
+
+    def filter(self, occupation, age_range):
+        lo, hi = self.positions(occupation, age_range)
+        return self.df.iloc[lo:hi]
+
+    def count(self, occupation, age_range):
+        lo, hi = self.positions(occupation, age_range)
+        return hi - lo
@@ -0,0 +1,165 @@
+import copy
+
+import numpy as np
+import plotly.graph_objects as go
+
+from ddl import DEFAULT_BINS, MAX_UNIT_BINS
+
+# Границы интервалов, фиксируемые один раз при загрузке данных
+def metric_edges(values, bins=DEFAULT_BINS):
+    if len(values) == 0:
+        return np.array([0.0, 1.0])
+    return range_edges(float(values.min()), float(values.max()), np.all(np.mod(values, 1) == 0), bins)
+
+# Границы интервалов по диапазону значений: целые с небольшим разбросом — по одному значению на интервал
+def range_edges(low, high, is_integer, bins=DEFAULT_BINS):
+    if is_integer and high - low <= MAX_UNIT_BINS:
+        return np.arange(low - 0.5, high + 1.5)
+    if low == high:
+        return np.array([low - 0.5, high + 0.5])
+    return np.linspace(low, high, bins + 1)
+
+# Предварительно агрегированные гистограммы: профессия × возраст × интервал для каждого показателя.
+# По оси возраста хранятся накопленные суммы, поэтому гистограмма для любого диапазона
+# возраста — разность двух срезов, и её стоимость не зависит от числа клиентов.
+class HistogramCube:
+    def __init__(self, df, metrics, bins=DEFAULT_BINS, limits=None, age_max=100):
+        self.limits = limits or {}
+        self.age_max = age_max
+        self.occupations = {occ: i for i, occ in enumerate(df['Occupation'].dropna().unique())}
+        self.edges = {}
+        self.cumulative = {}
+
+        for metric in metrics:
+            values, valid = self.valid_values(df, metric)
+            self.edges[metric] = metric_edges(values[valid], bins)
+            self.cumulative[metric] = self.cumulative_counts(df, metric, self.edges[metric])
+
+    # Массивы куба и данные для восстановления (from_arrays), например для записи в файл mmap_store
+    def arrays(self):
+        arrays = {}
+        for metric in self.edges:
+            arrays[f'edges/{metric}'] = self.edges[metric]
+            arrays[f'cumulative/{metric}'] = self.cumulative[metric]
+        return arrays, {'occupations': list(self.occupations), 'limits': self.limits, 'age_max': self.age_max}
+
+    @classmethod
+    def from_arrays(cls, arrays, metadata):
+        cube = cls.__new__(cls)
+        cube.limits = metadata['limits']
+        cube.age_max = metadata['age_max']
+        cube.occupations = {occ: i for i, occ in enumerate(metadata['occupations'])}
+        cube.edges = {name.split('/', 1)[1]: array for name, array in arrays.items() if name.startswith('edges/')}
+        cube.cumulative = {
+            name.split('/', 1)[1]: array for name, array in arrays.items() if name.startswith('cumulative/')
+        }
+        return cube
+
+    # Значения показателя и маска строк, которые попадают в куб
+    def valid_values(self, df, metric):
+        occ_codes = df['Occupation'].map(self.occupations).to_numpy(dtype='float64')
+        ages = df['Age'].to_numpy(dtype='float64')
+        values = df[metric].to_numpy(dtype='float64')
+        valid = ~np.isnan(occ_codes) & (ages >= 0) & (ages <= self.age_max) & ~np.isnan(values)
+        if metric in self.limits:
+            valid &= values <= self.limits[metric]
+        return values, valid
+
+    # Накопленные по возрасту счётчики строк df в интервалах edges: профессия × (возраст + 1) × интервал
+    def cumulative_counts(self, df, metric, edges):
+        values, valid = self.valid_values(df, metric)
+        occ_codes = df['Occupation'].map(self.occupations).to_numpy(dtype='float64')[valid].astype('int64')
+        ages = df['Age'].to_numpy(dtype='float64')[valid].astype('int64')
+        n_occ, n_ages, n_bins = len(self.occupations), self.age_max + 1, len(edges) - 1
+
+        bin_idx = np.clip(np.searchsorted(edges, values[valid], side='right') - 1, 0, n_bins - 1)
+        flat = (occ_codes * n_ages + ages) * n_bins + bin_idx
+        counts = np.bincount(flat, minlength=n_occ * n_ages * n_bins).reshape(n_occ, n_ages, n_bins)
+
+        cumulative = np.zeros((n_occ, n_ages + 1, n_bins), dtype='int64')
+        np.cumsum(counts, axis=1, out=cumulative[:, 1:, :])
+        return cumulative
+
+    # Число строк delta, у которых значение показателя лежит за пределами интервалов куба
+    def outside_edges(self, delta):
+        outside = 0
+        for metric, edges in self.edges.items():
+            values = delta[metric].to_numpy(dtype='float64')
+            if metric in self.limits:
+                values = values[~(values > self.limits[metric])]
+            outside += int(np.count_nonzero((values < edges[0]) | (values > edges[-1])))
+        return outside
+
+    # Новый куб с добавленными строками delta; стоимость зависит от размера delta и куба, а не таблицы.
+    # Интервалы остаются прежними: значения за их пределами попали бы в крайние интервалы,
+    # поэтому перед вызовом стоит проверить outside_edges() и при необходимости построить куб заново.
+    def with_delta(self, delta):
+        cube = copy.copy(self)
+        cube.occupations = dict(self.occupations)
+        for occ in delta['Occupation'].dropna().unique():
+            if occ not in cube.occupations:
+                cube.occupations[occ] = len(cube.occupations)
+        new_occupations = len(cube.occupations) - len(self.occupations)
+
+        cube.cumulative = {}
+        for metric, cumulative in self.cumulative.items():
+            cumulative = np.pad(cumulative, ((0, new_occupations), (0, 0), (0, 0)))
+            cube.cumulative[metric] = cumulative + cube.cumulative_counts(delta, metric, self.edges[metric])
+        return cube
+
+    # Позиция профессии и границы диапазона возраста в кубе (None, если профессии нет в данных)
+    def locate(self, occupation, age_range):
+        i = self.occupations.get(occupation)
+        if i is None:
+            return None
+        lo = int(np.clip(np.ceil(age_range[0]), 0, self.age_max + 1))
+        hi = int(np.clip(np.floor(age_range[1]) + 1, lo, self.age_max + 1))
+        return i, lo, hi
+
+    # Границы интервалов и число клиентов в каждом интервале для профессии и диапазона возраста
+    def histogram(self, metric, occupation, age_range):
+        return self.histograms([metric], occupation, age_range)[metric]
+
+    # Гистограммы нескольких показателей для одного фильтра: фильтр вычисляется один раз
+    def histograms(self, metrics, occupation, age_range):
+        location = self.locate(occupation, age_range)
+        result = {}
+        for metric in metrics:
+            edges = self.edges[metric]
+            if location is None:
+                result[metric] = edges, np.zeros(len(edges) - 1, dtype='int64')
+            else:
+                i, lo, hi = location
+                cumulative = self.cumulative[metric]
+                result[metric] = edges, cumulative[i, hi] - cumulative[i, lo]
+        return result
+
+    # Границы интервалов и счётчики по каждому возрасту: профессия -> массив (возраст 0..age_max) × интервал
+    def age_bin_counts(self, metric):
+        counts = np.diff(self.cumulative[metric], axis=1)
+        return self.edges[metric], {occ: counts[i] for occ, i in self.occupations.items()}
+
+# Столбчатая диаграмма из заранее посчитанных интервалов вместо px.histogram по сырым строкам
+def histogram_figure(edges, counts, metric, title=None, color=None, label=None):
+    nonzero = np.flatnonzero(counts)
+    if len(nonzero):
+        # Пустые интервалы по краям отбрасываются, как при автоматическом диапазоне px.histogram
+        first, last = nonzero[0], nonzero[-1] + 1
+        edges, counts = edges[first:last + 1], counts[first:last]
+    else:
+        edges, counts = edges[:1], counts[:0]
+
+    fig = go.Figure(go.Bar(
+        x=(edges[:-1] + edges[1:]) / 2,
+        y=counts,
+        width=np.diff(edges),
+        marker_color=color,
+        name=metric
+    ))
+    fig.update_layout(
+        title=title,
+        bargap=0,
+        xaxis_title=label or metric,
+        yaxis_title='count'
+    )
+    return fig
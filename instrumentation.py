@@ -0,0 +1,188 @@
+import bisect
+import functools
+import threading
+import time
+from contextlib import contextmanager
+
+import flask
+
+# Верхние границы интервалов гистограмм задержек в миллисекундах (последний интервал — всё, что больше)
+LATENCY_BUCKETS_MS = [1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000]
+
+# Скользящее окно гистограмм: ROLLING_SLOTS отрезков по ROLLING_SLOT_SECONDS секунд
+ROLLING_SLOT_SECONDS = 30
+ROLLING_SLOTS = 10
+
+# Этапы обработки запроса: выборка данных, построение графика, сериализация ответа Dash и всё вместе
+PHASES = ['filter', 'build', 'serialize', 'total']
+
+# Скользящая гистограмма задержек: счётчики по интервалам для нескольких последних отрезков времени.
+# Запись — поиск интервала и увеличение счётчика, поэтому её можно держать включённой постоянно.
+class RollingHistogram:
+    def __init__(self, buckets=LATENCY_BUCKETS_MS, slot_seconds=ROLLING_SLOT_SECONDS, slots=ROLLING_SLOTS):
+        self.buckets = buckets
+        self.slot_seconds = slot_seconds
+        self.slot_ids = [None] * slots
+        self.counts = [[0] * (len(buckets) + 1) for _ in range(slots)]
+        self.sums = [0.0] * slots
+
+    def add(self, value, now):
+        slot_id = int(now // self.slot_seconds)
+        pos = slot_id % len(self.slot_ids)
+        if self.slot_ids[pos] != slot_id:
+            self.slot_ids[pos] = slot_id
+            self.counts[pos] = [0] * (len(self.buckets) + 1)
+            self.sums[pos] = 0.0
+        self.counts[pos][bisect.bisect_left(self.buckets, value)] += 1
+        self.sums[pos] += value
+
+    def snapshot(self, now):
+        current = int(now // self.slot_seconds)
+        counts = [0] * (len(self.buckets) + 1)
+        total = 0.0
+        for slot_id, slot_counts, slot_sum in zip(self.slot_ids, self.counts, self.sums):
+            if slot_id is not None and current - slot_id < len(self.slot_ids):
+                counts = [a + b for a, b in zip(counts, slot_counts)]
+                total += slot_sum
+        n = sum(counts)
+        return {
+            'count': n,
+            'mean': total / n if n else None,
+            'p50': self.quantile(counts, 0.5),
+            'p90': self.quantile(counts, 0.9),
+            'p99': self.quantile(counts, 0.99),
+            'buckets': {str(le): c for le, c in zip(self.buckets + ['+Inf'], counts)},
+        }
+
+    # Оценка квантиля по гистограмме: верхняя граница интервала, в который он попадает
+    def quantile(self, counts, q):
+        n = sum(counts)
+        if n == 0:
+            return None
+        rank = q * n
+        seen = 0
+        for le, count in zip(self.buckets + [float('inf')], counts):
+            seen += count
+            if seen >= rank:
+                return le
+        return float('inf')
+
+# Измерения одного вызова обработчика
+class CallTimer:
+    def __init__(self, name):
+        self.name = name
+        self.start = time.perf_counter()
+        self.end = None
+        self.phases = {}
+        self.rows = None
+
+    @contextmanager
+    def phase(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases[name] = self.phases.get(name, 0.0) + (time.perf_counter() - start) * 1000
+
+# Заглушка вне обработчика: этапы не записываются
+class NullTimer:
+    rows = None
+
+    @contextmanager
+    def phase(self, name):
+        yield
+
+_local = threading.local()
+
+# Измерения текущего обработчика в этом потоке (или заглушка)
+def current():
+    return getattr(_local, 'timer', None) or NullTimer()
+
+# Метрики обработчиков Dash: задержки по этапам, число отобранных строк и размер ответа.
+# Сериализацию выполняет сам Dash после возврата из обработчика, поэтому её время и размер ответа
+# фиксируются в after_request сервера Flask.
+class Instrumentation:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.callbacks = {}
+
+    def stats_for(self, name):
+        stats = self.callbacks.get(name)
+        if stats is None:
+            stats = self.callbacks[name] = {
+                'calls': 0,
+                'errors': 0,
+                'rows_total': 0,
+                'response_bytes_total': 0,
+                'latency_ms': {phase: RollingHistogram() for phase in PHASES},
+                'response_bytes': RollingHistogram(buckets=[1_000, 10_000, 100_000, 1_000_000, 10_000_000]),
+            }
+        return stats
+
+    def record(self, timer, serialize_ms=None, response_bytes=None, error=False):
+        now = time.time()
+        phases = dict(timer.phases)
+        phases['total'] = (timer.end - timer.start) * 1000
+        if serialize_ms is not None:
+            phases['serialize'] = serialize_ms
+            phases['total'] += serialize_ms
+        with self.lock:
+            stats = self.stats_for(timer.name)
+            stats['calls'] += 1
+            stats['errors'] += int(error)
+            if timer.rows is not None:
+                stats['rows_total'] += int(timer.rows)
+            for phase, value in phases.items():
+                stats['latency_ms'][phase].add(value, now)
+            if response_bytes is not None:
+                stats['response_bytes_total'] += response_bytes
+                stats['response_bytes'].add(response_bytes, now)
+
+    # Декоратор обработчика; ставится под @app.callback
+    def instrument(self, name):
+        def decorator(fn):
+            @functools.wraps(fn)
+            def wrapper(*args, **kwargs):
+                timer = _local.timer = CallTimer(name)
+                error = False
+                try:
+                    return fn(*args, **kwargs)
+                except Exception:
+                    error = True
+                    raise
+                finally:
+                    timer.end = time.perf_counter()
+                    _local.timer = None
+                    if flask.has_request_context() and not error:
+                        flask.g.callback_timer = timer
+                    else:
+                        self.record(timer, error=error)
+            return wrapper
+        return decorator
+
+    def after_request(self, response):
+        timer = flask.g.pop('callback_timer', None)
+        if timer is not None:
+            serialize_ms = (time.perf_counter() - timer.end) * 1000
+            self.record(timer, serialize_ms, response.calculate_content_length())
+        return response
+
+    def snapshot(self):
+        now = time.time()
+        with self.lock:
+            return {
+                name: {
+                    'calls': stats['calls'],
+                    'errors': stats['errors'],
+                    'rows_total': stats['rows_total'],
+                    'response_bytes_total': stats['response_bytes_total'],
+                    'latency_ms': {phase: hist.snapshot(now) for phase, hist in stats['latency_ms'].items()},
+                    'response_bytes': stats['response_bytes'].snapshot(now),
+                }
+                for name, stats in self.callbacks.items()
+            }
+
+    # Подключение к приложению Dash: замер ответа и маршрут с метриками
+    def init_app(self, app, route='/metrics'):
+        app.server.after_request(self.after_request)
+        app.server.add_url_rule(route, 'callback_metrics', lambda: flask.jsonify(self.snapshot()))
@@ -0,0 +1,92 @@
+import fcntl
+import json
+import os
+import time
+from contextlib import contextmanager
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.ipc as ipc
+
+# Ключ метаданных Arrow, в котором хранится отпечаток исходной таблицы
+FINGERPRINT_KEY = b'fingerprint'
+
+# Ключ метаданных Arrow с формами массивов и прочими данными файла массивов (write_arrays)
+ARRAYS_KEY = b'arrays'
+
+# Запись очищенного набора данных в файл Arrow IPC без сжатия.
+# Строки упорядочены по профессии и возрасту, поэтому индекс строится без сортировки и копирования.
+def write_dataset(df, path, fingerprint=None):
+    df = df.sort_values(['Occupation', 'Age'], kind='mergesort').reset_index(drop=True)
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    table = table.replace_schema_metadata({
+        **(table.schema.metadata or {}),
+        FINGERPRINT_KEY: json.dumps(fingerprint, default=str).encode('utf-8'),
+    })
+    write_table(table, path)
+
+def write_table(table, path):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    # Запись во временный файл и атомарная замена: работающие процессы продолжают видеть старый файл
+    tmp_path = f'{path}.tmp{os.getpid()}'
+    with pa.OSFile(tmp_path, 'wb') as sink:
+        with ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+    os.replace(tmp_path, path)
+
+def read_fingerprint(path):
+    with pa.memory_map(path, 'r') as source:
+        metadata = ipc.open_file(source).schema.metadata or {}
+    return json.loads(metadata.get(FINGERPRINT_KEY, b'null'))
+
+# Отображение файла в память только для чтения. Числовые столбцы без пропусков ссылаются прямо
+# на страницы файла, которые ОС делит между всеми процессами gunicorn; копируются только коды категорий.
+def map_dataset(path):
+    source = pa.memory_map(path, 'r')
+    table = ipc.open_file(source).read_all()
+    return table.to_pandas(split_blocks=True, self_destruct=False)
+
+# Запись именованных массивов NumPy (например, куба гистограмм) в файл Arrow: таблица из одной строки,
+# каждый массив — отдельный столбец-список. metadata — данные в JSON (профессии, параметры и т.п.).
+def write_arrays(arrays, path, metadata=None):
+    columns = {name: pa.LargeListArray.from_arrays([0, array.size], np.ascontiguousarray(array).ravel())
+               for name, array in arrays.items()}
+    shapes = {name: list(array.shape) for name, array in arrays.items()}
+    table = pa.table(columns).replace_schema_metadata({
+        ARRAYS_KEY: json.dumps({'shapes': shapes, 'metadata': metadata}, default=str).encode('utf-8'),
+    })
+    write_table(table, path)
+
+# Массивы из файла write_arrays без копирования: представления NumPy только для чтения
+# поверх отображённых в память страниц файла
+def map_arrays(path):
+    table = ipc.open_file(pa.memory_map(path, 'r')).read_all()
+    info = json.loads(table.schema.metadata[ARRAYS_KEY])
+    arrays = {}
+    for name, shape in info['shapes'].items():
+        values = table.column(name).chunk(0).values
+        arrays[name] = values.to_numpy(zero_copy_only=True).reshape(shape)
+    return arrays, info['metadata']
+
+# Блокировка на время проверки и пересборки файла: процессы gunicorn, запущенные одновременно,
+# ждут первый процесс вместо того, чтобы повторять его работу
+@contextmanager
+def file_lock(path):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path + '.lock', 'w') as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock, fcntl.LOCK_UN)
+
+# Время последней проверки файла по отпечатку таблицы (0, если проверки не было)
+def checked_at(path):
+    try:
+        return os.path.getmtime(path + '.checked')
+    except OSError:
+        return 0.0
+
+def mark_checked(path):
+    with open(path + '.checked', 'w') as f:
+        f.write(str(time.time()))
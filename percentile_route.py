@@ -0,0 +1,36 @@
+import math
+
+import flask
+
+# Маршрут со сводкой распределения для движка 'sketch': процентили показателей и границы ошибки
+# для профессии и диапазона возраста, например /percentiles?occupation=Lawyer&age_min=20&age_max=40.
+# Параметр metric (можно несколько раз) ограничивает показатели. Другие движки процентили не считают — ответ 404.
+def init_app(app, source, metrics, route='/percentiles'):
+    def percentiles():
+        data = source.current()
+        if not hasattr(data, 'summary'):
+            return flask.jsonify({'error': 'Percentiles are available only with the sketch backend'}), 404
+
+        args = flask.request.args
+        occupation = args.get('occupation')
+        if occupation is None:
+            return flask.jsonify({'error': 'occupation is required'}), 400
+        age_min, age_max = data.age_bounds()
+        try:
+            age_range = [float(args.get('age_min', age_min)), float(args.get('age_max', age_max))]
+        except ValueError:
+            return flask.jsonify({'error': 'age_min and age_max must be numbers'}), 400
+        selected = args.getlist('metric') or list(metrics)
+        unknown = [metric for metric in selected if metric not in metrics]
+        if unknown:
+            return flask.jsonify({'error': f'Unknown metrics: {unknown}'}), 400
+
+        summary = data.summary(selected, occupation, age_range)
+        # Ключи JSON — строки: квантиль 0.5 -> 'p50'; без строк в диапазоне процентиль — null
+        summary['percentiles'] = {
+            metric: {f'p{round(q * 100):g}': None if math.isnan(value) else value for q, value in values.items()}
+            for metric, values in summary['percentiles'].items()
+        }
+        return flask.jsonify({'occupation': occupation, 'age_range': age_range, **summary})
+
+    app.server.add_url_rule(route, 'percentiles', percentiles)
@@ -0,0 +1,268 @@
+import json
+import os
+
+import numpy as np
+
+from histogram_cube import DEFAULT_BINS, range_edges
+
+# Точность эскиза KLL: ошибка ранга убывает примерно как 1/k, эскиз хранит порядка 3k значений
+DEFAULT_K = 200
+
+# Ёмкость уровней: верхний уровень вмещает k значений, каждый следующий вниз — в CAPACITY_DECAY раз меньше
+CAPACITY_DECAY = 2 / 3
+MIN_LEVEL_CAPACITY = 8
+
+# Ширина возрастной группы (в годах), для которой строится отдельный эскиз. При одном годе диапазон возраста
+# из целых лет покрывает группы целиком и распределение внутри группы не приходится предполагать
+AGE_BAND_YEARS = 1
+
+# Процентили по умолчанию для сводки распределения
+DEFAULT_PERCENTILES = [0.05, 0.25, 0.5, 0.75, 0.95]
+
+# Нормированная ошибка ранга KLL с доверием 99% (эмпирические оценки Apache DataSketches):
+# для отдельного квантиля и для доли значений в интервале гистограммы (pmf=True)
+def rank_error(k, pmf=False):
+    return 2.446 / k ** 0.9433 if pmf else 2.296 / k ** 0.9723
+
+# Квантили по значениям с весами (значения одного или нескольких эскизов); low и high — точные минимум
+# и максимум, ими заменяются крайние квантили
+def weighted_quantiles(values, weights, qs, low, high):
+    qs = np.asarray(qs, dtype='float64')
+    order = np.argsort(values, kind='stable')
+    values, cumulative = values[order], np.cumsum(weights[order])
+    positions = np.searchsorted(cumulative, qs * cumulative[-1], side='left')
+    result = values[np.minimum(positions, len(values) - 1)]
+    result = np.where(qs <= 0, low, np.where(qs >= 1, high, result))
+    return np.clip(result, low, high)
+
+# Эскиз KLL для квантилей потока значений. Значение на уровне h представляет 2**h исходных значений;
+# переполненный уровень сортируется, и каждое второе значение (со случайным сдвигом) переходит уровнем выше.
+# Память не зависит от числа значений, а эскизы, построенные по разным частям данных, объединяются (merge).
+class KLLSketch:
+    def __init__(self, k=DEFAULT_K, seed=None):
+        self.k = k
+        self.n = 0
+        self.min = np.inf
+        self.max = -np.inf
+        self.levels = [np.empty(0)]
+        self.rng = np.random.default_rng(seed)
+
+    def capacity(self, level):
+        depth = len(self.levels) - level - 1
+        return max(MIN_LEVEL_CAPACITY, int(np.ceil(self.k * CAPACITY_DECAY ** depth)))
+
+    def update(self, values):
+        values = np.asarray(values, dtype='float64')
+        values = values[~np.isnan(values)]
+        if not len(values):
+            return
+        self.n += len(values)
+        self.min = min(self.min, values.min())
+        self.max = max(self.max, values.max())
+        self.levels[0] = np.concatenate([self.levels[0], values])
+        self.compress()
+
+    def merge(self, other):
+        if other.n == 0:
+            return self
+        self.n += other.n
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        for level, items in enumerate(other.levels):
+            if level == len(self.levels):
+                self.levels.append(np.empty(0))
+            self.levels[level] = np.concatenate([self.levels[level], items])
+        self.compress()
+        return self
+
+    # Уплотнение переполненных уровней; при появлении нового уровня ёмкости нижних уменьшаются,
+    # поэтому проверка повторяется, пока все уровни не уложатся в свою ёмкость
+    def compress(self):
+        level = 0
+        while level < len(self.levels):
+            if len(self.levels[level]) <= self.capacity(level):
+                level += 1
+                continue
+            if level + 1 == len(self.levels):
+                self.levels.append(np.empty(0))
+            items = np.sort(self.levels[level])
+            # При нечётном числе одно значение остаётся на уровне, чтобы суммарный вес не изменился
+            keep, items = items[len(items) - len(items) % 2:], items[:len(items) - len(items) % 2]
+            self.levels[level + 1] = np.concatenate([self.levels[level + 1], items[self.rng.integers(2)::2]])
+            self.levels[level] = keep
+            level = 0
+
+    def size(self):
+        return sum(len(items) for items in self.levels)
+
+    # Значения эскиза и их веса (сумма весов равна n)
+    def items(self):
+        values = np.concatenate(self.levels)
+        weights = np.concatenate([np.full(len(items), 2.0 ** level) for level, items in enumerate(self.levels)])
+        return values, weights
+
+    # Значения эскиза по возрастанию и накопленные веса
+    def sorted_view(self):
+        values, weights = self.items()
+        order = np.argsort(values, kind='stable')
+        return values[order], np.cumsum(weights[order])
+
+    # Оценка числа значений меньше x (inclusive=True — не больше x) для каждой точки
+    def rank(self, points, inclusive=False):
+        if self.n == 0:
+            return np.zeros(len(points))
+        values, cumulative = self.sorted_view()
+        positions = np.searchsorted(values, points, side='right' if inclusive else 'left')
+        return np.where(positions > 0, cumulative[np.maximum(positions - 1, 0)], 0)
+
+    def quantiles(self, qs):
+        if self.n == 0:
+            return np.full(len(qs), np.nan)
+        return weighted_quantiles(*self.items(), qs, self.min, self.max)
+
+    # Доля значений в каждом интервале [edges[i], edges[i + 1]); последний интервал включает правую границу
+    def pmf(self, edges):
+        if self.n == 0:
+            return np.zeros(len(edges) - 1)
+        below = self.rank(edges[:-1])
+        upto = np.append(self.rank(edges[1:-1]), self.rank(edges[-1:], inclusive=True))
+        return (upto - below) / self.n
+
+    def to_dict(self):
+        return {
+            'k': self.k,
+            'n': int(self.n),
+            'min': float(self.min) if self.n else None,
+            'max': float(self.max) if self.n else None,
+            'levels': [items.tolist() for items in self.levels],
+        }
+
+    @classmethod
+    def from_dict(cls, data, seed=None):
+        sketch = cls(data['k'], seed=seed)
+        sketch.n = data['n']
+        if sketch.n:
+            sketch.min, sketch.max = data['min'], data['max']
+        sketch.levels = [np.asarray(items, dtype='float64') for items in data['levels']]
+        return sketch
+
+# Эскизы показателей по профессии и возрастной группе и точное число строк по профессии и возрасту.
+# Строится за один проход по частям таблицы (update), части из разных процессов объединяются (merge).
+class SketchCube:
+    def __init__(self, metrics, k=DEFAULT_K, band_years=AGE_BAND_YEARS, age_max=100, seed=None):
+        self.metrics = list(metrics)
+        self.k = k
+        self.band_years = band_years
+        self.age_max = age_max
+        self.rng = np.random.default_rng(seed)
+        self.sketches = {metric: {} for metric in self.metrics}
+        self.is_integer = {metric: True for metric in self.metrics}
+        self.counts = {}
+
+    def sketch(self, metric, occupation, band):
+        sketches = self.sketches[metric]
+        if (occupation, band) not in sketches:
+            sketches[occupation, band] = KLLSketch(self.k, seed=self.rng.integers(2**32))
+        return sketches[occupation, band]
+
+    def age_counts(self, occupation):
+        if occupation not in self.counts:
+            self.counts[occupation] = np.zeros(self.age_max + 1, dtype='int64')
+        return self.counts[occupation]
+
+    # Часть таблицы: столбцы Occupation, Age и показатели
+    def update(self, df):
+        df = df[df['Occupation'].notna() & df['Age'].between(0, self.age_max)]
+        if df.empty:
+            return self
+        ages = df['Age'].to_numpy().astype('int64')
+        values = {metric: df[metric].to_numpy(dtype='float64', na_value=np.nan) for metric in self.metrics}
+        for metric, column in values.items():
+            column = column[~np.isnan(column)]
+            self.is_integer[metric] = self.is_integer[metric] and bool(np.all(np.mod(column, 1) == 0))
+
+        groups = df.groupby([df['Occupation'].astype(str).to_numpy(), ages // self.band_years], sort=False).indices
+        for (occupation, band), positions in groups.items():
+            band_ages = ages[positions]
+            self.age_counts(occupation)[:] += np.bincount(band_ages, minlength=self.age_max + 1)
+            for metric, column in values.items():
+                self.sketch(metric, occupation, int(band)).update(column[positions])
+        return self
+
+    def merge(self, other):
+        for metric in self.metrics:
+            self.is_integer[metric] = self.is_integer[metric] and other.is_integer[metric]
+            for (occupation, band), sketch in other.sketches[metric].items():
+                self.sketch(metric, occupation, band).merge(sketch)
+        for occupation, counts in other.counts.items():
+            self.age_counts(occupation)[:] += counts
+        return self
+
+    def bands(self, age_range):
+        low = max(int(np.ceil(age_range[0])), 0)
+        high = min(int(np.floor(age_range[1])), self.age_max)
+        return range(low // self.band_years, high // self.band_years + 1) if low <= high else range(0)
+
+    # Квантили показателя по возрастным группам профессии: shares — пары (группа, доля её строк в диапазоне),
+    # вклад группы умножается на долю так же, как в гистограммах SketchSource
+    def quantiles(self, metric, occupation, shares, qs):
+        parts = [(self.sketches[metric].get((occupation, band)), share) for band, share in shares]
+        parts = [(sketch, share) for sketch, share in parts if sketch is not None and sketch.n and share > 0]
+        if not parts:
+            return np.full(len(qs), np.nan)
+        values, weights = [], []
+        for sketch, share in parts:
+            sketch_values, sketch_weights = sketch.items()
+            values.append(sketch_values)
+            weights.append(sketch_weights * share)
+        low = min(sketch.min for sketch, _ in parts)
+        high = max(sketch.max for sketch, _ in parts)
+        return weighted_quantiles(np.concatenate(values), np.concatenate(weights), qs, low, high)
+
+    def value_range(self, metric):
+        sketches = [sketch for sketch in self.sketches[metric].values() if sketch.n]
+        if not sketches:
+            return 0.0, 0.0
+        return min(sketch.min for sketch in sketches), max(sketch.max for sketch in sketches)
+
+    def edges(self, metric, bins=DEFAULT_BINS):
+        low, high = self.value_range(metric)
+        return range_edges(low, high, self.is_integer[metric], bins)
+
+    def to_dict(self):
+        return {
+            'metrics': self.metrics,
+            'k': self.k,
+            'band_years': self.band_years,
+            'age_max': self.age_max,
+            'is_integer': self.is_integer,
+            'counts': {occupation: counts.tolist() for occupation, counts in self.counts.items()},
+            'sketches': {
+                metric: [[occupation, band, sketch.to_dict()] for (occupation, band), sketch in sketches.items()]
+                for metric, sketches in self.sketches.items()
+            },
+        }
+
+    @classmethod
+    def from_dict(cls, data, seed=None):
+        cube = cls(data['metrics'], k=data['k'], band_years=data['band_years'], age_max=data['age_max'], seed=seed)
+        cube.is_integer = dict(data['is_integer'])
+        cube.counts = {occupation: np.asarray(counts, dtype='int64') for occupation, counts in data['counts'].items()}
+        for metric, sketches in data['sketches'].items():
+            for occupation, band, sketch in sketches:
+                cube.sketches[metric][occupation, band] = KLLSketch.from_dict(sketch, seed=cube.rng.integers(2**32))
+        return cube
+
+    # Запись во временный файл и атомарная замена; extra — дополнительные поля (например, отпечаток таблицы)
+    def save(self, path, **extra):
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        tmp_path = f'{path}.tmp{os.getpid()}'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({**extra, 'cube': self.to_dict()}, f)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        with open(path, encoding='utf-8') as f:
+            data = json.load(f)
+        return cls.from_dict(data.pop('cube')), data
@@ -0,0 +1,66 @@
+import threading
+
+# Текущий источник данных дашборда. Обновление заменяет ссылку целиком, поэтому обработчик,
+# который один раз взял current(), до конца работает с согласованным набором данных.
+class SourceHolder:
+    def __init__(self, source):
+        self.lock = threading.Lock()
+        self.version = 0
+        source.version = 0
+        self.source = source
+
+    def current(self):
+        return self.source
+
+    def swap(self, source):
+        with self.lock:
+            self.version += 1
+            source.version = self.version
+            self.source = source
+
+    # Значения для макета дашборда (так же у startup.BackgroundSource, пока данные загружаются)
+    def occupations(self):
+        return self.current().occupations()
+
+    def age_bounds(self):
+        return self.current().age_bounds()
+
+    def status(self):
+        return {'status': 'ready', 'version': self.version}
+
+# Фоновое обновление: периодически проверяет водяной знак (ID последней строки),
+# загружает только новые строки и подменяет источник в SourceHolder.
+# get_watermark() — текущий водяной знак таблицы; fetch_delta(after, upto) — очищенные строки в диапазоне
+# (при ошибке запроса — исключение, а не пустой результат).
+class Refresher(threading.Thread):
+    def __init__(self, holder, watermark, get_watermark, fetch_delta, interval):
+        super().__init__(name='dashboard-refresher', daemon=True)
+        self.holder = holder
+        self.watermark = watermark
+        self.get_watermark = get_watermark
+        self.fetch_delta = fetch_delta
+        self.interval = interval
+        self.stop_event = threading.Event()
+
+    def refresh_once(self):
+        new_watermark = self.get_watermark()
+        if new_watermark is None or new_watermark == self.watermark:
+            return 0
+        # Водяной знак сдвигается только после загрузки и подмены: если fetch_delta или with_delta
+        # завершились ошибкой, следующая проверка загрузит тот же диапазон заново
+        delta = self.fetch_delta(self.watermark, new_watermark)
+        if len(delta):
+            self.holder.swap(self.holder.current().with_delta(delta))
+        self.watermark = new_watermark
+        print(f"Refreshed dataset: {len(delta)} new rows, watermark {new_watermark}")
+        return len(delta)
+
+    def run(self):
+        while not self.stop_event.wait(self.interval):
+            try:
+                self.refresh_once()
+            except Exception as e:
+                print(f"Error: {e}")
+
+    def stop(self):
+        self.stop_event.set()
@@ -0,0 +1,11 @@
+# Стратифицированная выборка: доля строк в каждой группе сохраняется,
+# поэтому распределение по группам в выборке такое же, как в исходных данных
+def stratified_sample(df, max_rows, by, seed=0):
+    if len(df) <= max_rows:
+        return df
+    fraction = max_rows / len(df)
+    sample = df.groupby(by, group_keys=False).sample(frac=fraction, random_state=seed)
+    # Округление по группам может немного превысить лимит
+    if len(sample) > max_rows:
+        sample = sample.sample(n=max_rows, random_state=seed)
+    return sample
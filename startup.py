@@ -0,0 +1,144 @@
+import datetime
+import json
+import os
+import threading
+import time
+
+import flask
+
+# Режим фонового запуска: макет строится по сохранённым метаданным (профессии и границы возраста),
+# а данные загружаются в отдельном потоке, так что процесс сразу отвечает на запросы
+BACKGROUND_STARTUP = os.environ.get('DASHBOARD_BACKGROUND_STARTUP', '0') == '1'
+
+# Сколько обработчик ждёт окончания загрузки, прежде чем вернуть ошибку (в секундах)
+STARTUP_WAIT_SECONDS = float(os.environ.get('DASHBOARD_STARTUP_WAIT', '10'))
+
+# Данные ещё загружаются или загрузка завершилась ошибкой
+class SourceNotReady(Exception):
+    pass
+
+# Все источники с фоновой загрузкой в процессе (для post_fork)
+_sources = []
+
+# Хук gunicorn: загрузка начинается сразу после запуска рабочего процесса, а не при первом запросе.
+# В файле настроек gunicorn: from startup import post_fork
+def post_fork(server, worker):
+    for source in _sources:
+        source.ensure_started()
+
+def read_metadata(path):
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(path, encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError) as e:
+        print(f"Error: {e}")
+        return None
+
+# Метаданные для макета дашборда; запись во временный файл и атомарная замена, как у снимков etl
+def write_metadata(path, source):
+    age_min, age_max = source.age_bounds()
+    metadata = {
+        'occupations': [str(occ) for occ in source.occupations()],
+        'age_bounds': [int(age_min), int(age_max)],
+        'row_count': int(source.row_count()),
+        'written_at': datetime.datetime.now().isoformat(timespec='seconds'),
+    }
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f'{path}.tmp{os.getpid()}'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(metadata, f, ensure_ascii=False)
+    os.replace(tmp_path, path)
+    return metadata
+
+# Источник, загружаемый в фоновом потоке. До окончания загрузки профессии и границы возраста берутся
+# из метаданных, а current() ждёт не дольше wait_seconds и выбрасывает SourceNotReady.
+# load() возвращает SourceHolder; после загрузки вызовы передаются ему.
+# Загрузка начинается не при импорте, а в процессе, который обслуживает запросы: при первом запросе
+# (в том числе к /readyz) или из хука gunicorn post_fork. С gunicorn --preload главный процесс данные не загружает,
+# и при fork не копируется поток, который может держать блокировки (например, пула соединений).
+class BackgroundSource:
+    def __init__(self, load, metadata, wait_seconds=STARTUP_WAIT_SECONDS):
+        self.load = load
+        self.metadata = metadata
+        self.wait_seconds = wait_seconds
+        self.holder = None
+        self.error = None
+        self.finished = threading.Event()
+        self.started_at = None
+        self.loaded_at = None
+        self.pid = None
+        self.lock = threading.Lock()
+        _sources.append(self)
+
+    # Запуск загрузки в текущем процессе (один раз на процесс)
+    def ensure_started(self):
+        if self.pid == os.getpid():
+            return
+        with self.lock:
+            if self.pid == os.getpid():
+                return
+            self.pid = os.getpid()
+            if self.holder is not None:
+                # Данные уже загружены до fork: дочерний процесс использует их копию
+                return
+            self.error = None
+            self.finished = threading.Event()
+            self.started_at = time.time()
+            self.loaded_at = None
+            threading.Thread(target=self.run, name='dashboard-startup', daemon=True).start()
+
+    def run(self):
+        try:
+            self.holder = self.load()
+            self.loaded_at = time.time()
+            print(f"Dataset loaded in background in {self.loaded_at - self.started_at:.1f} s")
+        except Exception as e:
+            self.error = e
+            print(f"Error: {e}")
+        finally:
+            self.finished.set()
+
+    def current(self):
+        self.ensure_started()
+        if not self.finished.wait(self.wait_seconds):
+            raise SourceNotReady("Dataset is still loading")
+        if self.holder is None:
+            raise SourceNotReady(f"Dataset failed to load: {self.error}")
+        return self.holder.current()
+
+    def occupations(self):
+        if self.holder is not None:
+            return self.holder.occupations()
+        return self.metadata['occupations']
+
+    def age_bounds(self):
+        if self.holder is not None:
+            return self.holder.age_bounds()
+        return tuple(self.metadata['age_bounds'])
+
+    def status(self):
+        self.ensure_started()
+        if self.holder is not None:
+            return {**self.holder.status(), 'load_seconds': self.loaded_at - self.started_at}
+        if self.error is not None:
+            return {'status': 'failed', 'error': str(self.error)}
+        return {'status': 'loading', 'seconds': time.time() - self.started_at}
+
+# Маршруты для балансировщика: /healthz — процесс жив (ошибка, только если загрузка данных не удалась),
+# /readyz — данные загружены и обработчики могут отвечать
+def init_app(app, source, liveness_route='/healthz', readiness_route='/readyz'):
+    def liveness():
+        status = source.status()
+        return flask.jsonify(status), 500 if status['status'] == 'failed' else 200
+
+    def readiness():
+        status = source.status()
+        return flask.jsonify(status), 200 if status['status'] == 'ready' else 503
+
+    app.server.add_url_rule(liveness_route, 'liveness', liveness)
+    app.server.add_url_rule(readiness_route, 'readiness', readiness)
+    if isinstance(source, BackgroundSource):
+        # Загрузка начинается при первом запросе к процессу, если её не запустил post_fork
+        app.server.before_request(source.ensure_started)
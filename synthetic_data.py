@@ -0,0 +1,101 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+from ddl import FULL_CUSTOMERS_COLUMNS
+
+# Значения категориальных столбцов и их доли, близкие к исходному набору данных
+OCCUPATIONS = [
+    'Lawyer', 'Architect', 'Engineer', 'Scientist', 'Mechanic', 'Accountant', 'Developer',
+    'Media_Manager', 'Teacher', 'Entrepreneur', 'Doctor', 'Journalist', 'Manager', 'Musician', 'Writer',
+]
+MONTHS = ['January', 'February', 'March', 'April', 'May', 'June', 'July', 'August']
+CREDIT_MIX = (['Standard', 'Good', 'Bad'], [0.46, 0.30, 0.24])
+PAYMENT_OF_MIN_AMOUNT = (['Yes', 'No', 'NM'], [0.52, 0.36, 0.12])
+PAYMENT_BEHAVIOUR = ([
+    'Low_spent_Small_value_payments', 'High_spent_Medium_value_payments', 'Low_spent_Medium_value_payments',
+    'High_spent_Large_value_payments', 'High_spent_Small_value_payments', 'Low_spent_Large_value_payments',
+], [0.27, 0.19, 0.15, 0.14, 0.12, 0.13])
+LOAN_TYPES = [
+    'Auto Loan', 'Credit-Builder Loan', 'Personal Loan', 'Home Equity Loan', 'Mortgage Loan',
+    'Student Loan', 'Debt Consolidation Loan', 'Payday Loan',
+]
+
+# Доля строк с выбросами в счётчиках (как в исходных данных: 1500 банковских счетов и т.п.)
+OUTLIER_SHARE = 0.015
+
+# Строк в одной части при записи CSV
+CSV_CHUNK_ROWS = 500_000
+
+# Набор сочетаний видов кредитов (от нуля до трёх), из которого выбираются значения Type_of_Loan
+def loan_combinations(rng, size=200):
+    return [
+        ', '.join(LOAN_TYPES[j] for j in rng.choice(len(LOAN_TYPES), k, replace=False))
+        for k in rng.integers(0, 4, size)
+    ]
+
+def with_outliers(rng, values, high):
+    mask = rng.random(len(values)) < OUTLIER_SHARE
+    values = values.copy()
+    values[mask] = rng.integers(high // 10, high, mask.sum())
+    return values
+
+# Синтетическая часть таблицы full_customers: start — номер первой строки, чтобы ID не повторялись.
+# Каждый клиент представлен восемью строками (январь–август), как в исходном наборе.
+# Credit_History_Age — строка вида "22 Years and 6 Months", как в CSV.
+def generate_customers(n_rows, seed=0, start=0):
+    rng = np.random.default_rng([seed, start])
+    row = np.arange(start, start + n_rows)
+    customer = row // len(MONTHS)
+    n_customers = customer[-1] - customer[0] + 1 if n_rows else 0
+
+    # Признаки клиента одинаковы во всех его месяцах
+    def per_customer(values):
+        return values[customer - customer[0]]
+
+    age = per_customer(np.clip(rng.normal(33, 10.5, n_customers), 14, 56).astype('int64'))
+    annual_income = per_customer(np.exp(rng.normal(10.5, 0.8, n_customers)).clip(7000, 180000))
+    history_months = per_customer(rng.integers(1, 34 * 12, n_customers)) + row % len(MONTHS)
+
+    df = pd.DataFrame({
+        'ID': [f'0x{i + 0x1602:x}' for i in row],
+        'Customer_ID': [f'CUS_0x{c + 0xd40:x}' for c in customer],
+        'Month': np.array(MONTHS)[row % len(MONTHS)],
+        'Name': [f'Customer {c}' for c in customer],
+        'Age': age,
+        'SSN': [f'{c % 900 + 100:03d}-{c % 90 + 10:02d}-{c % 9000 + 1000:04d}' for c in customer],
+        'Occupation': per_customer(rng.choice(OCCUPATIONS, n_customers)),
+        'Annual_Income': with_outliers(rng, annual_income, 24_000_000).round(2),
+        'Monthly_Inhand_Salary': (annual_income / 12 * rng.uniform(0.75, 0.9, n_rows)).round(2),
+        'Num_Bank_Accounts': with_outliers(rng, rng.integers(0, 11, n_rows), 1800),
+        'Num_Credit_Card': with_outliers(rng, rng.integers(0, 12, n_rows), 1500),
+        'Interest_Rate': with_outliers(rng, rng.integers(1, 35, n_rows), 5800),
+        'Num_of_Loan': rng.integers(0, 10, n_rows),
+        'Type_of_Loan': rng.choice(loan_combinations(rng), n_rows),
+        'Delay_from_due_date': rng.integers(-5, 68, n_rows),
+        'Num_of_Delayed_Payment': rng.integers(0, 29, n_rows),
+        'Changed_Credit_Limit': rng.uniform(-6.5, 36.5, n_rows).round(2),
+        'Num_Credit_Inquiries': with_outliers(rng, rng.integers(0, 18, n_rows), 2600),
+        'Credit_Mix': rng.choice(CREDIT_MIX[0], n_rows, p=CREDIT_MIX[1]),
+        'Outstanding_Debt': rng.gamma(1.6, 900, n_rows).clip(0.23, 4998).round(2),
+        'Credit_Utilization_Ratio': rng.normal(32.3, 5.1, n_rows).clip(20, 50),
+        'Credit_History_Age': [f'{m // 12} Years and {m % 12} Months' for m in history_months],
+        'Payment_of_Min_Amount': rng.choice(PAYMENT_OF_MIN_AMOUNT[0], n_rows, p=PAYMENT_OF_MIN_AMOUNT[1]),
+        'Total_EMI_per_month': rng.gamma(1.2, 90, n_rows).round(2),
+        'Amount_invested_monthly': rng.gamma(1.1, 180, n_rows).clip(0, 10000).round(2),
+        'Payment_Behaviour': rng.choice(PAYMENT_BEHAVIOUR[0], n_rows, p=PAYMENT_BEHAVIOUR[1]),
+        'Monthly_Balance': rng.gamma(3.5, 115, n_rows).round(2),
+    })
+    return df[[name for name, _ in FULL_CUSTOMERS_COLUMNS]]
+
+# Запись синтетического CSV в формате processed_test.csv частями, не держа всю таблицу в памяти.
+# При одинаковых n_rows и seed файл получается одинаковым.
+def write_csv(path, n_rows, seed=0, chunk_rows=CSV_CHUNK_ROWS):
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    for start in range(0, n_rows, chunk_rows):
+        chunk = generate_customers(min(chunk_rows, n_rows - start), seed=seed, start=start)
+        chunk.to_csv(path, mode='w' if start == 0 else 'a', header=start == 0, index=False)
+    return path
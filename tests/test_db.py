@@ -0,0 +1,157 @@
+import threading
+import time
+
+import psycopg2.extensions
+import pytest
+
+import db
+from db import ConnectionPool, PoolTimeout
+
+# Заглушка соединения psycopg2: только то, что использует пул
+class FakeConnection:
+    def __init__(self, ping_fails=False):
+        self.closed = 0
+        self.status = psycopg2.extensions.TRANSACTION_STATUS_IDLE
+        self.ping_fails = ping_fails
+        self.pings = 0
+        self.rollbacks = 0
+
+    def get_transaction_status(self):
+        return self.status
+
+    def cursor(self):
+        return FakeCursor(self)
+
+    def rollback(self):
+        self.rollbacks += 1
+        self.status = psycopg2.extensions.TRANSACTION_STATUS_IDLE
+
+    def close(self):
+        self.closed = 1
+
+class FakeCursor:
+    def __init__(self, conn):
+        self.conn = conn
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def execute(self, query):
+        self.conn.pings += 1
+        if self.conn.ping_fails:
+            raise psycopg2.OperationalError("server closed the connection")
+
+class FakeConnect:
+    def __init__(self):
+        self.connections = []
+
+    def __call__(self, **params):
+        conn = FakeConnection()
+        self.connections.append(conn)
+        return conn
+
+def make_pool(max_size=2, timeout=0.05):
+    connect = FakeConnect()
+    return ConnectionPool(max_size=max_size, timeout=timeout, connect=connect, dbname='test'), connect
+
+def test_checkout_reuses_idle_connection():
+    pool, connect = make_pool()
+    conn = pool.getconn()
+    pool.putconn(conn)
+    assert pool.getconn() is conn
+    assert len(connect.connections) == 1
+    assert conn.rollbacks == 1
+
+def test_checkout_times_out_when_pool_is_exhausted():
+    pool, _ = make_pool(max_size=1)
+    pool.getconn()
+    with pytest.raises(PoolTimeout):
+        pool.getconn()
+    stats = pool.stats()
+    assert stats['in_use'] == 1
+    assert stats['checkout_failures'] == 1
+
+def test_waiting_checkout_gets_returned_connection():
+    pool, connect = make_pool(max_size=1, timeout=2)
+    conn = pool.getconn()
+    timer = threading.Timer(0.05, pool.putconn, [conn])
+    timer.start()
+    assert pool.getconn() is conn
+    timer.join()
+    assert len(connect.connections) == 1
+    assert pool.stats()['wait_time_max'] > 0
+
+def test_closed_and_busy_connections_are_discarded():
+    pool, connect = make_pool()
+    first, second = pool.getconn(), pool.getconn()
+    pool.putconn(first)
+    pool.putconn(second)
+    first.closed = 1
+    second.status = psycopg2.extensions.TRANSACTION_STATUS_INTRANS
+    conn = pool.getconn()
+    assert conn is connect.connections[-1] and conn not in (first, second)
+    assert pool.stats()['discarded'] == 2
+
+def test_stale_connection_failing_ping_is_evicted(monkeypatch):
+    monkeypatch.setattr(db, 'POOL_PING_AFTER', 0.0)
+    pool, connect = make_pool()
+    conn = pool.getconn()
+    pool.putconn(conn)
+    conn.ping_fails = True
+    time.sleep(0.001)
+    fresh = pool.getconn()
+    assert fresh is not conn
+    assert conn.pings == 1 and conn.closed
+    assert pool.stats()['discarded'] == 1
+
+def test_broken_connection_is_closed_and_not_reused():
+    pool, connect = make_pool()
+    conn = pool.getconn()
+    pool.putconn(conn, broken=True)
+    assert conn.closed
+    assert pool.getconn() is not conn
+    assert pool.stats()['created'] == 2
+
+def test_failed_connect_releases_slot():
+    def connect(**params):
+        raise psycopg2.OperationalError("connection refused")
+
+    pool = ConnectionPool(max_size=1, timeout=0.05, connect=connect)
+    for _ in range(2):
+        with pytest.raises(psycopg2.OperationalError):
+            pool.getconn()
+    stats = pool.stats()
+    assert stats['in_use'] == 0
+    assert stats['checkout_failures'] == 2
+
+def test_stats_count_checkouts():
+    pool, _ = make_pool()
+    for _ in range(3):
+        pool.putconn(pool.getconn())
+    stats = pool.stats()
+    assert stats['checkouts'] == 3
+    assert stats['created'] == 1
+    assert stats['idle'] == 1 and stats['in_use'] == 0
+    assert stats['wait_time_avg'] == stats['wait_time_total'] / 3
+
+def test_connection_context_rolls_back_and_returns(monkeypatch):
+    pool, connect = make_pool()
+    monkeypatch.setattr(db, 'get_pool', lambda: pool)
+    with pytest.raises(ValueError):
+        with db.connection():
+            raise ValueError("query failed")
+    assert pool.stats()['idle'] == 1
+    assert connect.connections[0].rollbacks == 1
+
+def test_pool_is_recreated_after_fork(monkeypatch):
+    monkeypatch.setattr(db, '_pool', None)
+    monkeypatch.setattr(db, '_pool_pid', None)
+    parent_pool = db.get_pool()
+    assert db.get_pool() is parent_pool
+    monkeypatch.setattr(db.os, 'getpid', lambda: -1)
+    child_pool = db.get_pool()
+    assert child_pool is not parent_pool
+    assert db.get_pool() is child_pool
@@ -0,0 +1,40 @@
+import pandas as pd
+
+import etl
+
+# Кредитная история в старых таблицах — строка: её граница не должна попасть в запрос к PostgreSQL
+def test_credit_history_bound_applied_after_parsing(monkeypatch):
+    requested = {}
+
+    def fake_get_data(columns=None, bounds=None, **kwargs):
+        requested.update(bounds)
+        raw = pd.DataFrame({
+            'Age': [30, 40, 50],
+            'Credit_History_Age': ['22 Years and 6 Months', '70 Years and 0 Months', None],
+        })
+        return etl.clean_fetched(raw, compact=False)
+    monkeypatch.setattr(etl, 'get_data', fake_get_data)
+
+    df = etl.load_frame(['Age', 'Credit_History_Age'], bounds={'Age': (14, 100), 'Credit_History_Age': (None, 60)})
+
+    assert requested == {'Age': (14, 100)}
+    assert df['Credit_History_Age'].tolist() == [22.5]
+
+# Снимок запроса с границей по водяному знаку: один файл на запрос, а не новый при каждом росте таблицы
+def test_snapshot_replaced_when_watermark_moves(monkeypatch, tmp_path):
+    monkeypatch.setattr(etl, 'SNAPSHOT_DIR', str(tmp_path))
+    key = ['SELECT "Age" FROM full_customers', []]
+    query = 'SELECT "Age" FROM full_customers WHERE (length("ID"), "ID") <= (length(%s), %s)'
+    fingerprint = {'row_count': 2, 'max_id': '0x2', 'max_month': 'March'}
+    etl.write_snapshot(pd.DataFrame({'Age': [30, 40]}), key, query, ['0x2', '0x2'], fingerprint)
+
+    assert etl.read_snapshot(key, query, ['0x2', '0x2'], fingerprint)['Age'].tolist() == [30, 40]
+    # Тот же отпечаток, но другая граница: снимок построен другим запросом
+    assert etl.read_snapshot(key, query, ['0x1', '0x1'], fingerprint) is None
+
+    grown = {'row_count': 3, 'max_id': '0x3', 'max_month': 'March'}
+    assert etl.read_snapshot(key, query, ['0x3', '0x3'], grown) is None
+    etl.write_snapshot(pd.DataFrame({'Age': [30, 40, 50]}), key, query, ['0x3', '0x3'], grown)
+
+    assert sorted(path.suffix for path in tmp_path.iterdir()) == ['.json', '.parquet']
+    assert etl.read_snapshot(key, query, ['0x3', '0x3'], grown)['Age'].tolist() == [30, 40, 50]
@@ -0,0 +1,119 @@
+import sqlite3
+
+import pytest
+
+import PSQL_to_LSQL
+from PSQL_to_LSQL import STATE_TABLE, migrate
+
+COLUMNS = [('ID', 'character varying'), ('Age', 'integer')]
+
+# Строки PostgreSQL: ID 0x1..0x7 и три строки с пустым ID, которые в порядке ID идут последними
+ROWS = [(f'0x{i:x}', 20 + i) for i in range(1, 8)] + [(None, 40 + i) for i in range(3)]
+
+def id_order(row):
+    return (row[0] is None, len(row[0] or ''), row[0] or '')
+
+# Заглушка курсора psycopg2: запрос строк разбирается по тексту условий build_select
+class FakeCursor:
+    def __init__(self, conn, name):
+        self.conn = conn
+        self.name = name
+        self.rows = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        pass
+
+    def execute(self, query, params=None):
+        if self.name is None:
+            self.rows = COLUMNS
+            return
+        text = repr(query)
+        rows = sorted(ROWS, key=id_order)
+        if 'IS NULL' in text:
+            rows = [row for row in rows if row[0] is None]
+        else:
+            rows = [row for row in rows if row[0] is not None]
+            if params:
+                rows = [row for row in rows if id_order(row) > id_order((params[0],))]
+        self.conn.queries.append((text, params))
+        self.rows = rows
+
+    def fetchall(self):
+        return self.rows
+
+    def fetchmany(self, size):
+        self.conn.batches += 1
+        if self.conn.batches == self.conn.fail_at:
+            raise ConnectionError('server closed the connection unexpectedly')
+        batch, self.rows = self.rows[:size], self.rows[size:]
+        return batch
+
+class FakeConnection:
+    def __init__(self, fail_at=None):
+        self.fail_at = fail_at
+        self.batches = 0
+        self.queries = []
+
+    def cursor(self, name=None):
+        return FakeCursor(self, name)
+
+    def rollback(self):
+        pass
+
+    def close(self):
+        pass
+
+@pytest.fixture
+def path(tmp_path, monkeypatch):
+    monkeypatch.setattr(PSQL_to_LSQL, 'create_sqlite_indexes', lambda *args: None)
+    return str(tmp_path / 'my.db')
+
+def copied(path):
+    conn = sqlite3.connect(path)
+    try:
+        return sorted(conn.execute('SELECT "ID", "Age" FROM customers').fetchall(), key=id_order)
+    finally:
+        conn.close()
+
+def run(monkeypatch, path, conn, **kwargs):
+    monkeypatch.setattr(PSQL_to_LSQL.db, 'connect', lambda: conn)
+    return migrate(path, **kwargs)
+
+def test_copies_rows_with_empty_id(monkeypatch, path):
+    assert run(monkeypatch, path, FakeConnection(), batch_size=3) == len(ROWS)
+    assert copied(path) == sorted(ROWS, key=id_order)
+
+@pytest.mark.parametrize('fail_at', [2, 3, 4, 5, 6])
+def test_resume_keeps_every_row_once(monkeypatch, path, fail_at):
+    # Порции по 3 строки: 0x1–0x3, 0x4–0x6, 0x7, пустая порция, затем строки с пустым ID и снова пустая порция
+    with pytest.raises(ConnectionError):
+        run(monkeypatch, path, FakeConnection(fail_at=fail_at), batch_size=3)
+    resumed = FakeConnection()
+    assert run(monkeypatch, path, resumed, batch_size=3) == len(ROWS)
+    assert copied(path) == sorted(ROWS, key=id_order)
+
+def test_resume_in_null_phase_skips_ordered_rows(monkeypatch, path):
+    # Порции по 2 строки: четыре с непустым ID, пустая порция в конце этапа, затем строки с пустым ID
+    with pytest.raises(ConnectionError):
+        run(monkeypatch, path, FakeConnection(fail_at=7), batch_size=2)
+    resumed = FakeConnection()
+    run(monkeypatch, path, resumed, batch_size=2)
+    # Строки с непустым ID уже перенесены: повторяется только этап строк с пустым ID
+    assert len(resumed.queries) == 1 and 'IS NULL' in resumed.queries[0][0]
+    assert copied(path) == sorted(ROWS, key=id_order)
+
+def test_legacy_state_with_empty_last_id(monkeypatch, path):
+    # Позиция в старом формате: перенос дошёл до строк с пустым ID и записал одну из них
+    conn = sqlite3.connect(path)
+    with conn:
+        conn.execute('CREATE TABLE customers ("ID" TEXT, "Age" INTEGER)')
+        conn.executemany('INSERT INTO customers VALUES (?, ?)', sorted(ROWS, key=id_order)[:8])
+        conn.execute(f"CREATE TABLE {STATE_TABLE} (table_name TEXT PRIMARY KEY, last_id TEXT, rows INTEGER, done INTEGER)")
+        conn.execute(f"INSERT INTO {STATE_TABLE} VALUES ('customers', NULL, 8, 0)")
+    conn.close()
+
+    assert run(monkeypatch, path, FakeConnection(), batch_size=3) == len(ROWS)
+    assert copied(path) == sorted(ROWS, key=id_order)
@@ -0,0 +1,115 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from datasource import PandasSource, SketchSource
+from quantile_sketch import KLLSketch, SketchCube, rank_error
+
+QS = np.linspace(0.01, 0.99, 99)
+
+# Отклонение ранга найденного значения от запрошенного квантиля по точным (отсортированным) данным
+def rank_errors(exact, qs, values):
+    low = np.searchsorted(exact, values, side='left') / len(exact)
+    high = np.searchsorted(exact, values, side='right') / len(exact)
+    return np.where((low <= qs) & (qs <= high), 0.0, np.minimum(np.abs(low - qs), np.abs(high - qs)))
+
+def lognormal(n, seed):
+    return np.random.default_rng(seed).lognormal(10, 1, n)
+
+@pytest.mark.parametrize('seed', [0, 1, 2])
+def test_quantile_rank_error_within_bound(seed):
+    values = lognormal(200_000, seed)
+    sketch = KLLSketch(seed=seed)
+    for part in np.array_split(values, 20):
+        sketch.update(part)
+
+    assert sketch.n == len(values)
+    assert sketch.size() < 4 * sketch.k
+    errors = rank_errors(np.sort(values), QS, sketch.quantiles(QS))
+    assert errors.max() <= rank_error(sketch.k)
+
+def test_pmf_error_within_bound():
+    values = lognormal(200_000, 3)
+    sketch = KLLSketch(seed=3)
+    sketch.update(values)
+    edges = np.linspace(values.min(), values.max(), 51)
+
+    exact = np.histogram(values, edges)[0] / len(values)
+    assert np.abs(sketch.pmf(edges) - exact).max() <= rank_error(sketch.k, pmf=True)
+
+def test_merged_sketch_within_bound():
+    values = lognormal(200_000, 4)
+    merged = KLLSketch(seed=4)
+    for number, part in enumerate(np.array_split(values, 8)):
+        sketch = KLLSketch(seed=number)
+        sketch.update(part)
+        merged.merge(sketch)
+
+    assert merged.n == len(values)
+    assert (merged.min, merged.max) == (values.min(), values.max())
+    errors = rank_errors(np.sort(values), QS, merged.quantiles(QS))
+    assert errors.max() <= rank_error(merged.k)
+
+def test_small_sketch_is_exact():
+    values = np.arange(100, dtype='float64')
+    sketch = KLLSketch()
+    sketch.update(values)
+
+    assert sketch.quantiles([0, 0.5, 1]).tolist() == [0, 49, 99]
+
+# Набор с сильной зависимостью показателей от возраста: ошибка из-за групп возраста была бы заметна
+def customers(n=400_000, seed=5):
+    rng = np.random.default_rng(seed)
+    ages = rng.integers(14, 60, n)
+    return pd.DataFrame({
+        'Occupation': rng.choice(['Lawyer', 'Teacher'], n),
+        'Age': ages,
+        'Annual_Income': rng.lognormal(10 + ages / 40, 0.6, n),
+    })
+
+@pytest.fixture(scope='module')
+def sources():
+    df = customers()
+    metrics = ['Age', 'Annual_Income']
+    cube = SketchCube(metrics, seed=0)
+    for start in range(0, len(df), 40_000):
+        cube.update(df.iloc[start:start + 40_000])
+    return df, PandasSource(df, metrics), SketchSource(cube, metrics)
+
+@pytest.mark.parametrize('age_range', [(26, 27), (20, 40), (14, 59), (33, 33)])
+def test_sketch_source_matches_exact(sources, age_range):
+    df, exact, sketch = sources
+    bounds = sketch.error_bounds('Lawyer', age_range)
+    count = exact.count('Lawyer', age_range)
+
+    assert sketch.count('Lawyer', age_range) == count
+    assert bounds['band_error'] == 0
+    approximate = sketch.histograms(['Age', 'Annual_Income'], 'Lawyer', age_range)
+    expected = exact.histograms(['Age', 'Annual_Income'], 'Lawyer', age_range)
+    # Возраст известен точно по годам
+    assert np.array_equal(approximate['Age'][1], expected['Age'][1])
+    assert approximate['Annual_Income'][1].sum() == pytest.approx(count, abs=len(approximate['Annual_Income'][1]))
+    assert np.abs(approximate['Annual_Income'][1] - expected['Annual_Income'][1]).max() / count \
+        <= bounds['bin_share_error']
+
+    selected = df[(df['Occupation'] == 'Lawyer') & df['Age'].between(*age_range)]['Annual_Income']
+    percentiles = sketch.percentiles('Annual_Income', 'Lawyer', age_range, QS)
+    errors = rank_errors(np.sort(selected.to_numpy()), QS, np.array(list(percentiles.values())))
+    assert errors.max() <= bounds['quantile_rank_error']
+
+def test_partial_bands_widen_error_bounds():
+    df = customers(50_000)
+    cube = SketchCube(['Annual_Income'], band_years=5, seed=0).update(df)
+    source = SketchSource(cube, ['Annual_Income'])
+    counts = cube.counts['Lawyer']
+
+    assert source.error_bounds('Lawyer', (20, 39))['band_error'] == 0
+    bounds = source.error_bounds('Lawyer', (22, 40))
+    # Группы 20–24 и 40–44 покрыты частично: их строки в диапазоне — 22–24 и 40
+    partial = counts[22:25].sum() + counts[40]
+    assert bounds['band_error'] == pytest.approx(partial / counts[22:41].sum())
+    assert bounds['quantile_rank_error'] == pytest.approx(rank_error(cube.k) + bounds['band_error'])
+
+def test_unknown_occupation_has_no_percentiles(sources):
+    _, _, sketch = sources
+    assert np.isnan(list(sketch.percentiles('Annual_Income', 'Pilot', (20, 40)).values())).all()
@@ -0,0 +1,78 @@
+import pandas as pd
+import pytest
+
+import etl
+from refresher import Refresher, SourceHolder
+
+# Заглушка источника: хранит ID загруженных строк
+class FakeSource:
+    def __init__(self, ids):
+        self.ids = list(ids)
+
+    def with_delta(self, delta):
+        return FakeSource(self.ids + delta['ID'].tolist())
+
+# Таблица с ID 1..last; fetch_delta отдаёт строки в диапазоне (after, upto] и один раз падает
+class FakeTable:
+    def __init__(self, last, failures=0):
+        self.last = last
+        self.failures = failures
+        self.calls = []
+
+    def watermark(self):
+        return self.last
+
+    def fetch_delta(self, after, upto):
+        self.calls.append((after, upto))
+        if self.failures:
+            self.failures -= 1
+            raise ConnectionError('server closed the connection unexpectedly')
+        return pd.DataFrame({'ID': list(range(after + 1, upto + 1))})
+
+def test_refresh_loads_new_rows():
+    table = FakeTable(3)
+    holder = SourceHolder(FakeSource([1, 2, 3]))
+    refresher = Refresher(holder, 3, table.watermark, table.fetch_delta, interval=60)
+
+    assert refresher.refresh_once() == 0
+    table.last = 5
+    assert refresher.refresh_once() == 2
+    assert holder.current().ids == [1, 2, 3, 4, 5]
+    assert (refresher.watermark, holder.version) == (5, 1)
+
+def test_failed_fetch_keeps_watermark():
+    table = FakeTable(5, failures=1)
+    holder = SourceHolder(FakeSource([1, 2, 3]))
+    refresher = Refresher(holder, 3, table.watermark, table.fetch_delta, interval=60)
+
+    with pytest.raises(ConnectionError):
+        refresher.refresh_once()
+    assert refresher.watermark == 3
+    assert holder.version == 0
+
+    # Следующая проверка загружает тот же диапазон, строки не теряются
+    table.last = 6
+    assert refresher.refresh_once() == 3
+    assert table.calls == [(3, 5), (3, 6)]
+    assert holder.current().ids == [1, 2, 3, 4, 5, 6]
+    assert refresher.watermark == 6
+
+def test_failed_swap_keeps_watermark():
+    table = FakeTable(5)
+    holder = SourceHolder(FakeSource([1, 2, 3]))
+    refresher = Refresher(holder, 3, table.watermark, table.fetch_delta, interval=60)
+    holder.current().with_delta = lambda delta: 1 / 0
+
+    with pytest.raises(ZeroDivisionError):
+        refresher.refresh_once()
+    assert refresher.watermark == 3
+
+def test_delta_load_raises_on_query_error(monkeypatch):
+    def broken_connection():
+        raise ConnectionError('could not connect to server')
+    monkeypatch.setattr(etl, 'connection', broken_connection)
+
+    # Загрузка при запуске по-прежнему получает пустой результат, а загрузка новых строк — исключение
+    assert etl.get_data(['ID']).empty
+    with pytest.raises(ConnectionError):
+        etl.load_frame(['ID'], id_range=('a', 'b'), use_snapshot=False, allow_empty=True)
@@ -0,0 +1,69 @@
+import numpy as np
+import pandas as pd
+
+# Шаблон значений вида "22 Years and 1 Months"
+CREDIT_HISTORY_PATTERN = r'(?P<years>\d+)\s+Years?(?:\s+and\s+(?P<months>\d+)\s+Months?)?'
+
+# Векторный разбор 'Credit_History_Age' в годы с учётом месяцев ("22 Years and 6 Months" -> 22.5).
+# Различных значений всего несколько сотен, поэтому разбираются только уникальные строки,
+# а результат раскладывается по всем строкам через коды factorize.
+# Значения, которые уже являются числами, сохраняются как есть.
+def parse_credit_history_age(series):
+    if pd.api.types.is_numeric_dtype(series):
+        return series.astype('float64')
+    codes, uniques = pd.factorize(series)
+    uniques = pd.Series(uniques, dtype='object')
+    parts = uniques.astype(str).str.extract(CREDIT_HISTORY_PATTERN, expand=True)
+    years = pd.to_numeric(parts['years'], errors='coerce')
+    months = pd.to_numeric(parts['months'], errors='coerce').fillna(0)
+    parsed = (years + months / 12).fillna(pd.to_numeric(uniques, errors='coerce')).to_numpy(dtype='float64')
+    # Код -1 у пропущенных значений указывает на добавленный в конец NaN
+    return pd.Series(np.append(parsed, np.nan)[codes], index=series.index, name=series.name)
+
+# Текстовые столбцы с долей уникальных значений ниже порога хранятся как category
+CATEGORY_MAX_UNIQUE_RATIO = 0.5
+
+# Наибольшее число знаков после запятой, при котором дробный столбец ещё проверяется на переход к float32
+FLOAT32_MAX_DECIMALS = 6
+
+# Число знаков после запятой, с которым хранятся значения (2 для сумм в центах), или None, если их больше
+def decimal_scale(values):
+    finite = values[np.isfinite(values)]
+    for decimals in range(FLOAT32_MAX_DECIMALS + 1):
+        scaled = finite * 10 ** decimals
+        if np.allclose(scaled, np.rint(scaled), rtol=1e-12, atol=1e-6):
+            return decimals
+    return None
+
+# float32 подходит, если каждое значение восстанавливается округлением до своего числа знаков:
+# ошибка меньше половины единицы последнего знака (при 1e6 шаг float32 около 0.06, и центы теряются)
+def fits_float32(values, compact):
+    decimals = decimal_scale(values)
+    if decimals is None:
+        return False
+    finite = np.isfinite(values)
+    return bool(np.all(np.abs(compact[finite] - values[finite]) < 0.5 * 10.0 ** -decimals))
+
+# Компактные типы по описанию таблицы в ddl.py: category для текста с небольшим числом значений,
+# минимальные целые типы и float32 там, где он без потерь хранит значения с их числом знаков после запятой
+def compact_dtypes(df, columns):
+    df = df.copy()
+    for name, sql_type in columns:
+        if name not in df.columns:
+            continue
+        series = df[name]
+        if sql_type == 'INT':
+            if series.isna().any():
+                # Целые с пропусками: float32 точно хранит целые до 2**24
+                df[name] = series.astype('float32')
+            else:
+                df[name] = pd.to_numeric(series, downcast='integer')
+        elif sql_type == 'FLOAT':
+            values = series.to_numpy(dtype='float64')
+            compact = values.astype('float32')
+            if fits_float32(values, compact):
+                df[name] = compact
+        elif (pd.api.types.is_string_dtype(series) and not isinstance(series.dtype, pd.CategoricalDtype)
+              and len(series) and series.nunique() / len(series) < CATEGORY_MAX_UNIQUE_RATIO):
+            df[name] = series.astype('category')
+    return df